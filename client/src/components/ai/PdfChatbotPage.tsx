@@ -10,7 +10,7 @@ import {
   ChevronDown,
 } from "lucide-react";
 import { isAuthenticated, getAuthToken } from "../../utils/auth";
-import { uploadPdfToPython, queryPdfChat } from "../../utils/api";
+import { uploadPdfToPython, streamPdfChat } from "../../utils/api";
 import { ToastContainer, ToastType } from "../ui/Toast";
 import { ProgressBar } from "../ui/ProgressBar";
 import { MarkdownRenderer } from "../ui/MarkdownRenderer";
@@ -328,7 +328,17 @@ export default function PdfChatbotPage() {
     setShouldAutoScroll(true); // Enable auto-scroll for new messages
 
     try {
-      const result = await queryPdfChat(sessionId, userMessage);
+      let streamedResponse = "";
+      const result = await streamPdfChat(sessionId, userMessage, (delta) => {
+        streamedResponse += delta;
+        setMessages((prev) =>
+          prev.map((msg) =>
+            msg.id === messageId
+              ? { ...msg, response: streamedResponse, isLoading: false }
+              : msg
+          )
+        );
+      });
 
       // Update the message with the response
       setMessages((prev) =>
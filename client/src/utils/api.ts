@@ -948,9 +948,48 @@ export const deleteRoadmap = async (
 };
 
 // Python Backend API (PDF Chat)
+export interface PdfIngestStatus {
+  job_id: string;
+  session_id: string;
+  status: "queued" | "running" | "completed" | "failed";
+  stage: string;
+  progress: {
+    total_pages: number;
+    pages_parsed: number;
+    chunks_total: number;
+    chunks_embedded: number;
+    vectors_upserted: number;
+    chunks_failed: number;
+  };
+  cloudinary_url: string | null;
+  cloudinary_public_id: string | null;
+  embedding_result: string | null;
+  error: string | null;
+}
+
+const UPLOAD_POLL_INTERVAL_MS = 1000;
+
+export const getPdfUploadStatus = async (
+  jobId: string
+): Promise<PdfIngestStatus> => {
+  const response = await fetch(`${PYTHON_API_URL}/upload-status/${jobId}`, {
+    method: "GET",
+  });
+
+  if (!response.ok) {
+    const errorData = await response.json().catch(() => ({}));
+    const errorMessage = errorData.detail || "Failed to get upload status";
+    throw new Error(errorMessage);
+  }
+
+  return response.json();
+};
+
+// Queues the PDF for ingestion, then polls the job until it finishes
 export const uploadPdfToPython = async (
   file: File,
-  sessionId: string
+  sessionId: string,
+  onProgress?: (status: PdfIngestStatus) => void
 ): Promise<{
   message: string;
   cloudinary_url: string;
@@ -960,12 +999,15 @@ export const uploadPdfToPython = async (
 }> => {
   const formData = new FormData();
   formData.append("file", file);
-  formData.append("session_id", sessionId);
 
-  const response = await fetch(`${PYTHON_API_URL}/upload-pdf/`, {
-    method: "POST",
-    body: formData,
-  });
+  // session_id goes in the query string so uploads are rate limited per session
+  const response = await fetch(
+    `${PYTHON_API_URL}/upload-pdf/?session_id=${encodeURIComponent(sessionId)}`,
+    {
+      method: "POST",
+      body: formData,
+    }
+  );
 
   if (!response.ok) {
     const errorData = await response.json().catch(() => ({}));
@@ -974,7 +1016,28 @@ export const uploadPdfToPython = async (
     throw new Error(errorMessage);
   }
 
-  return response.json();
+  const { job_id: jobId } = await response.json();
+
+  while (true) {
+    await new Promise((resolve) =>
+      setTimeout(resolve, UPLOAD_POLL_INTERVAL_MS)
+    );
+    const status = await getPdfUploadStatus(jobId);
+    onProgress?.(status);
+
+    if (status.status === "failed") {
+      throw new Error(status.error || "Failed to process PDF");
+    }
+    if (status.status === "completed") {
+      return {
+        message: "PDF uploaded and embedded successfully",
+        cloudinary_url: status.cloudinary_url || "",
+        cloudinary_public_id: status.cloudinary_public_id || "",
+        embedding_result: status.embedding_result || "",
+        session_id: status.session_id,
+      };
+    }
+  }
 };
 
 export const queryPdfChat = async (
@@ -982,7 +1045,7 @@ export const queryPdfChat = async (
   userQuery: string
 ): Promise<{ rag_response: string }> => {
   const response = await fetch(
-    `${PYTHON_API_URL}/query?session_id=${sessionId}`,
+    `${PYTHON_API_URL}/query?session_id=${encodeURIComponent(sessionId)}`,
     {
       method: "POST",
       headers: {
@@ -1003,6 +1066,63 @@ export const queryPdfChat = async (
   return response.json();
 };
 
+// Streams the answer as Server-Sent Events, calling onDelta for every chunk.
+// Resolves with the final (filtered) answer once the stream is done.
+export const streamPdfChat = async (
+  sessionId: string,
+  userQuery: string,
+  onDelta: (text: string) => void
+): Promise<{ rag_response: string }> => {
+  const response = await fetch(
+    `${PYTHON_API_URL}/query/stream?session_id=${encodeURIComponent(sessionId)}`,
+    {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        Accept: "text/event-stream",
+      },
+      body: JSON.stringify({
+        user_query: userQuery,
+      }),
+    }
+  );
+
+  if (!response.ok || !response.body) {
+    const errorData = await response.json().catch(() => ({}));
+    const errorMessage = errorData.detail || "Failed to query PDF chat";
+    throw new Error(errorMessage);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf("\n\n");
+
+      if (!rawEvent.startsWith("data: ")) continue;
+      const event = JSON.parse(rawEvent.slice(6));
+      if (event.type === "delta") {
+        onDelta(event.content);
+      } else if (event.type === "done") {
+        return { rag_response: event.rag_response };
+      } else if (event.type === "error") {
+        throw new Error(event.detail || "Failed to query PDF chat");
+      }
+    }
+  }
+
+  throw new Error("Stream ended before the answer was complete");
+};
+
 export const cleanupPdfSession = async (
   sessionId: string,
   cloudinaryPublicId?: string
@@ -1041,7 +1161,7 @@ export const getPdfSessionInfo = async (
   messages_remaining: number;
 }> => {
   const response = await fetch(
-    `${PYTHON_API_URL}/session-info?session_id=${sessionId}`,
+    `${PYTHON_API_URL}/session-info?session_id=${encodeURIComponent(sessionId)}`,
     {
       method: "GET",
     }
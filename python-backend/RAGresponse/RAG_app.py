@@ -1,109 +1,36 @@
 from dotenv import load_dotenv
-import os
 import logging
+import os
 
-from langchain_pinecone import PineconeVectorStore
-from langchain_openai import OpenAIEmbeddings
-
-from pinecone import Pinecone
-from pinecone import ServerlessSpec
-
-from groq import Groq
+from utils.blockingPool import run_blocking
+from utils import clients
+from utils.documentRegistry import document_registry, vector_scope
+from utils.tokens import count_tokens, count_message_tokens
+from utils.metrics import count_chunks, span
+from RAGresponse.retrievalCache import retrieval_cache
+from RAGresponse.answerCache import answer_cache
+from RAGresponse.contextPacking import CONTEXT_TOKEN_BUDGET, pack_context
+from RAGresponse.guardrails import JAILBREAK_RESPONSE, is_jailbreak_attempt, filter_response
+from RAGresponse.llmGateway import LLMUnavailableError, llm_gateway
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Initialize a Pinecone client with your API key
-PINECONE_API = os.getenv("PINECONE_API_KEY")
-index_name = os.getenv("PINECONE_INDEX_NAME")
-region_name = os.getenv("PINECONE_ENVIRONMENT")
-pc = Pinecone(api_key=PINECONE_API)
-if not pc.has_index(index_name):
-    pc.create_index(
-        name=index_name,
-        dimension=1536,  # OpenAI text-embedding-3-small dimension
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region=region_name),
-    )
-index = pc.Index(index_name)
-
-# OpenAI embeddings
-openai_api_key = os.getenv("OPENAI_API_KEY")
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small", openai_api_key=openai_api_key)
-
-# Groq client for chat
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-def pinecone_retriver(query, session_id=None):
-    """
-    This function helps to retrieve the documents from the vector database
-    query: This is the query to be processed by the user
-    session_id: Optional session ID to filter documents
-    """
-    try:
-        vector_store = PineconeVectorStore(index=index, embedding=embeddings)
-        
-        if session_id:
-            # Filter by session_id in metadata - reduced to top 5 most relevant
-            retriever = vector_store.as_retriever(
-                search_type="similarity_score_threshold",
-                search_kwargs={
-                    "k": 5, 
-                    "score_threshold": 0.5,
-                    "filter": {"session_id": session_id}
-                },
-            )
-        else:
-            retriever = vector_store.as_retriever(
-                search_type="similarity_score_threshold",
-                search_kwargs={"k": 5, "score_threshold": 0.5},
-            )
-        
-        documents = retriever.invoke(query)
-        content_list = [doc.page_content for doc in documents]
-        logger.info(f"Retrieved {len(content_list)} documents for query")
-        return content_list
-    except Exception as e:
-        logger.error(f"Error retrieving from Pinecone: {str(e)}")
-        return []
+RETRIEVER_TOP_K = 5
+RETRIEVER_SCORE_THRESHOLD = 0.5
+# Prompt plus answer must fit in this many tokens
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "8192"))
+RESPONSE_MAX_TOKENS = 1500
+# History sent to the model is summarized in the background once it grows past this
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Newest turns that stay verbatim when the rest is summarized
+SUMMARY_KEEP_TURNS = 2
+SUMMARY_PREFIX = "Previous conversation summary: "
 
-def finetuning_RAG_LLM(chat_history):
-    try:
-        # Convert chat history to Groq format
-        messages = [
-            {
-                "role": "system",
-                "content": "You are a conversation summarizer. Summarize the chat history concisely, focusing on the key questions asked and answers provided about the document. Keep it brief and factual. Only output the summary, nothing else."
-            },
-            {
-                "role": "user",
-                "content": "Summarize this conversation:\n\n" + "\n".join(chat_history)
-            }
-        ]
-        
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=messages,
-            temperature=0.2,
-            max_tokens=400
-        )
-        
-        summary = response.choices[0].message.content
-        chat_history.clear()
-        chat_history.append("Previous conversation summary: " + summary)
-        logger.info("Chat history summarized successfully")
-    except Exception as e:
-        logger.error(f"Error summarizing chat history: {str(e)}")
-        # Keep original history if summarization fails
+SUMMARIZER_SYSTEM_PROMPT = "You are a conversation summarizer. Summarize the chat history concisely, focusing on the key questions asked and answers provided about the document. Keep it brief and factual. Only output the summary, nothing else."
 
-def RAG_LLM_integration(content_list, query, chat_history):
-    try:
-        # Build messages for Groq with context injected into user message
-        messages = [
-            {
-                "role": "system",
-                "content": """You are a specialized document Q&A assistant. Your ONLY purpose is to answer questions about the uploaded document.
+RAG_SYSTEM_PROMPT = """You are a specialized document Q&A assistant. Your ONLY purpose is to answer questions about the uploaded document.
 
 STRICT RULES:
 1. Answer ONLY based on the provided document context
@@ -122,83 +49,301 @@ FORMATTING:
 - Keep answers clear, concise, and well-structured
 
 Remember: You are a document assistant. Stay focused on the document content only."""
-            }
-        ]
-        
-        # Add chat history (without old context)
-        for msg in chat_history:
-            if msg.startswith("User: "):
-                messages.append({"role": "user", "content": msg.replace("User: ", "")})
-            elif msg.startswith("Model: "):
-                messages.append({"role": "assistant", "content": msg.replace("Model: ", "")})
-            elif msg.startswith("Here is the summary"):
-                messages.append({"role": "system", "content": msg})
-        
-        # Validate query isn't trying to jailbreak
-        jailbreak_patterns = [
-            "ignore previous", "ignore all", "disregard", "forget", "new instructions",
-            "you are now", "act as", "pretend", "roleplay", "system prompt",
-            "reveal your", "show your instructions", "what are your rules"
+
+NO_CONTEXT_RESPONSE = "Sorry! I could not find relevant information in the document to answer your question."
+ERROR_RESPONSE = "Sorry, I encountered an error processing your request. Please try again."
+BUSY_RESPONSE = "Sorry, I'm getting too many questions right now. Please try again in a moment."
+
+async def aembed_query(query):
+    query_embedding = retrieval_cache.get_embedding(query)
+    if query_embedding is None:
+        with span("query", "embed"):
+            query_embedding = await clients.get_embeddings().aembed_query(query)
+        retrieval_cache.set_embedding(query, query_embedding)
+    return query_embedding
+
+async def lookup_cached_answer(query, chat_history, session_id):
+    """
+    Checks the cross-session answer cache
+    Returns (key, answer): key is (doc_id, query embedding) when the answer may
+    be cached, None when the session has no shared document, the document is
+    still being embedded or the prompt would carry chat history; answer is the
+    cached one or None.
+    """
+    if not answer_cache.enabled or not session_id or chat_history.summary or chat_history.context_turns:
+        return None, None
+    doc_id = await document_registry.doc_for_session(session_id)
+    if doc_id is None:
+        return None, None
+    query_embedding = await aembed_query(query)
+    answer = answer_cache.get(doc_id, query_embedding)
+    # Retrieval only sees part of a document that is still being embedded,
+    # its answers must not be served to every other session
+    if answer is None and await document_registry.chunk_count(doc_id) is None:
+        return None, None
+    return (doc_id, query_embedding), answer
+
+def store_cached_answer(key, response, documents):
+    # Canned replies depend on the moment (ingestion, outages), not on the question
+    if key is not None and documents and response not in (NO_CONTEXT_RESPONSE, ERROR_RESPONSE, BUSY_RESPONSE):
+        answer_cache.set(*key, response)
+
+async def apinecone_retriver(query, session_id=None):
+    """
+    Retrieves the chunks of the session's document most relevant to the query
+    The query is embedded with the async OpenAI client, the Pinecone query runs
+    in the bounded blocking pool so the event loop stays free. Returns the
+    chunks as Documents, most relevant first, with the metadata (page,
+    start_index) the context packing needs.
+    """
+    try:
+        query_embedding = await aembed_query(query)
+
+        # Results are cached per shared document, private uploads are not cached
+        doc_id = await document_registry.doc_for_session(session_id) if session_id else None
+        cacheable = False
+        if doc_id is not None:
+            documents = retrieval_cache.get_results(doc_id, query_embedding)
+            if documents is not None:
+                count_chunks("retrieved", len(documents))
+                logger.info(f"Retrieved {len(documents)} cached documents for query")
+                return documents
+            cacheable = await document_registry.chunk_count(doc_id) is not None
+
+        vector_store = clients.get_vector_store()
+        search_scope = vector_scope(doc_id, session_id) if session_id else {}
+        with span("query", "retrieve"):
+            results = await run_blocking(
+                vector_store.similarity_search_by_vector_with_score,
+                query_embedding,
+                k=RETRIEVER_TOP_K,
+                **search_scope,
+            )
+        # Same relevance mapping as the retriever: Pinecone cosine scores are in [-1, 1]
+        documents = [
+            doc for doc, score in results
+            if (score + 1) / 2 >= RETRIEVER_SCORE_THRESHOLD
         ]
-        
-        query_lower = query.lower()
-        if any(pattern in query_lower for pattern in jailbreak_patterns):
-            logger.warning(f"Potential jailbreak attempt detected: {query}")
-            return "I can only answer questions about the uploaded document. Please ask about the document content."
-        
-        # Add current query with FRESH context
-        user_message = f"""Document Context:
+        if cacheable and documents:
+            retrieval_cache.set_results(doc_id, query_embedding, documents)
+        count_chunks("retrieved", len(documents))
+        logger.info(f"Retrieved {len(documents)} documents for query")
+        return documents
+    except Exception as e:
+        logger.error(f"Error retrieving from Pinecone: {str(e)}")
+        return []
+
+def summary_turns(chat_history):
+    """seq of the context turns to fold into the summary, empty while the history is under budget"""
+    if chat_history.context_tokens <= HISTORY_TOKEN_BUDGET:
+        return []
+    return chat_history.context_seqs()[:max(chat_history.context_turns - SUMMARY_KEEP_TURNS, 0)]
+
+def build_summary_messages(chat_history, seqs):
+    # The previous summary and the context turns listed in seqs go into the new summary
+    lines = [SUMMARY_PREFIX + chat_history.summary] if chat_history.summary else []
+    summarized = set(seqs)
+    for turn in chat_history.turns:
+        if not (turn.in_context and turn.seq in summarized):
+            continue
+        query, response = turn.unpack()
+        lines.append(f"User: {query}")
+        lines.append(f"Model: {response}")
+    return [
+        {
+            "role": "system",
+            "content": SUMMARIZER_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": "Summarize this conversation:\n\n" + "\n".join(lines)
+        }
+    ]
+
+def store_summary(chat_history, summary, seqs):
+    if chat_history.set_summary(summary, seqs):
+        logger.info("Chat history summarized successfully")
+    else:
+        logger.info("Chat history changed while it was summarized, summary dropped")
+
+async def afinetuning_RAG_LLM(chat_history, seqs):
+    """
+    Returns a summary of the context turns listed in seqs without changing chat_history
+    The caller applies it with store_summary, so no session lock is held while
+    the model is summarizing.
+    """
+    try:
+        with span("summarize", "generate"):
+            response = await llm_gateway.complete(
+                "summarize",
+                build_summary_messages(chat_history, seqs),
+                temperature=0.2,
+                max_tokens=400
+            )
+        return response.choices[0].message.content
+    except Exception as e:
+        logger.error(f"Error summarizing chat history: {str(e)}")
+        # Keep original history if summarization fails
+        return None
+
+def build_user_message(context, query):
+    return f"""Document Context:
 ---
-{content_list}
+{context}
 ---
 
 User Question: {query}
 
 Remember: Answer ONLY based on the document context above. If the information is not in the context, say you couldn't find it."""
-        
-        messages.append({"role": "user", "content": user_message})
-        
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=messages,
-            temperature=0.2,  # Lower temperature for more focused responses
-            max_tokens=1500,
-            top_p=0.9
-        )
-        
-        chatbot_response = response.choices[0].message.content
-        
-        # Validate response isn't revealing system info
-        if any(word in chatbot_response.lower() for word in ["system prompt", "instructions", "i am programmed", "my role is"]):
-            logger.warning("Response contained system information, filtering")
-            chatbot_response = "I can only answer questions about the uploaded document."
-        
-        # Store in history WITHOUT the context (to save memory)
-        chat_history.append(f"User: {query}")
-        chat_history.append(f"Model: {chatbot_response}")
-        
-        logger.info("Generated RAG response successfully")
-        return chatbot_response
+
+def build_rag_messages(documents, query, chat_history):
+    # Build messages for Groq with context injected into user message
+    system_message = {
+        "role": "system",
+        "content": RAG_SYSTEM_PROMPT
+    }
+
+    # Keep the prompt under LLM_CONTEXT_TOKENS. The document context comes
+    # first; the history (whose summary may still be in the making) gets what
+    # is left, dropping the oldest turns first
+    budget = LLM_CONTEXT_TOKENS - RESPONSE_MAX_TOKENS - count_message_tokens([system_message])
+    question_tokens = count_tokens(build_user_message("", query)) + 4
+    context = pack_context(documents, min(CONTEXT_TOKEN_BUDGET, budget - question_tokens))
+    user_message = {"role": "user", "content": build_user_message(context, query)}
+    user_tokens = count_tokens(user_message["content"]) + 4
+
+    # Add chat history (without old context)
+    history = []
+    for role, content in chat_history.context():
+        if role == "system":
+            content = SUMMARY_PREFIX + content
+        history.append({"role": role, "content": content})
+
+    history_tokens = [count_tokens(message["content"]) + 4 for message in history]
+    while history and sum(history_tokens) + user_tokens > budget:
+        # Turns go before the summary, which sits first
+        drop = 1 if history[0]["role"] == "system" and len(history) > 1 else 0
+        history.pop(drop)
+        history_tokens.pop(drop)
+
+    # Add current query with FRESH context
+    return [system_message, *history, user_message]
+
+def finalize_response(chatbot_response):
+    chatbot_response = filter_response(chatbot_response)
+    logger.info("Generated RAG response successfully")
+    return chatbot_response
+
+def record_turn(chat_history, query, response):
+    """Stores a finished turn WITHOUT the context (to save memory)"""
+    # Canned replies are shown in /history but never sent back to the model
+    in_context = response not in (JAILBREAK_RESPONSE, NO_CONTEXT_RESPONSE, ERROR_RESPONSE, BUSY_RESPONSE)
+    chat_history.append(query, response, in_context=in_context)
+
+async def aRAG_LLM_integration(documents, query, chat_history):
+    try:
+        with span("query", "build_prompt"):
+            messages = build_rag_messages(documents, query, chat_history)
+        with span("query", "generate"):
+            response = await llm_gateway.complete(
+                "query",
+                messages,
+                temperature=0.2,  # Lower temperature for more focused responses
+                max_tokens=RESPONSE_MAX_TOKENS,
+                top_p=0.9
+            )
+        return finalize_response(response.choices[0].message.content)
+    except LLMUnavailableError as e:
+        logger.error(f"LLM unavailable: {str(e)}")
+        return BUSY_RESPONSE
     except Exception as e:
         logger.error(f"Error generating RAG response: {str(e)}")
-        return "Sorry, I encountered an error processing your request. Please try again."
+        return ERROR_RESPONSE
 
-def main(query, chat_history, session_id=None):
+async def amain(query, chat_history, session_id=None):
+    """
+    RAG pipeline of the /query route, never blocks the event loop
+    The caller records the finished turn with record_turn and summarizes the
+    history in the background afterwards.
+    """
     try:
+        # Validate query isn't trying to jailbreak, before anything is embedded
+        if is_jailbreak_attempt(query):
+            return JAILBREAK_RESPONSE
+
+        cache_key, cached = await lookup_cached_answer(query, chat_history, session_id)
+        if cached is not None:
+            return cached
+
         # Retrieve FRESH context for THIS specific query
-        content_list = pinecone_retriver(query, session_id)
-        
-        if not content_list:
+        documents = await apinecone_retriver(query, session_id)
+
+        if not documents:
             logger.warning("No relevant content found in vector store")
-            return "Sorry! I could not find relevant information in the document to answer your question."
-        
-        # Summarize chat history if it gets too long
-        if len(chat_history) > 10:
-            finetuning_RAG_LLM(chat_history)
-        
+            return NO_CONTEXT_RESPONSE
+
         # Generate response with fresh context
-        rag_response = RAG_LLM_integration(content_list, query, chat_history)
-        return rag_response
+        response = await aRAG_LLM_integration(documents, query, chat_history)
+        store_cached_answer(cache_key, response, documents)
+        return response
     except Exception as e:
         logger.error(f"Error in main RAG flow: {str(e)}")
-        return "Sorry, I encountered an error processing your request. Please try again."
\ No newline at end of file
+        return ERROR_RESPONSE
+
+async def astream_main(query, chat_history, session_id=None):
+    """
+    Streaming version of amain
+    Yields ("delta", text) for every Groq stream chunk as it arrives and ends with
+    ("done", final_response). The final response has already gone through the
+    response filter, so it may differ from the concatenated deltas when the
+    filter kicks in. Like amain it leaves recording the turn to the caller.
+    """
+    try:
+        # Validate query isn't trying to jailbreak, before anything is embedded
+        if is_jailbreak_attempt(query):
+            yield "done", JAILBREAK_RESPONSE
+            return
+
+        cache_key, cached = await lookup_cached_answer(query, chat_history, session_id)
+        if cached is not None:
+            yield "delta", cached
+            yield "done", cached
+            return
+
+        # Retrieve FRESH context for THIS specific query
+        documents = await apinecone_retriver(query, session_id)
+
+        if not documents:
+            logger.warning("No relevant content found in vector store")
+            yield "done", NO_CONTEXT_RESPONSE
+            return
+
+        with span("query", "build_prompt"):
+            messages = build_rag_messages(documents, query, chat_history)
+        with span("query", "generate"):
+            stream = llm_gateway.stream(
+                "query",
+                messages,
+                temperature=0.2,  # Lower temperature for more focused responses
+                max_tokens=RESPONSE_MAX_TOKENS,
+                top_p=0.9
+            )
+
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield "delta", delta
+
+        response = finalize_response("".join(parts))
+        store_cached_answer(cache_key, response, documents)
+        yield "done", response
+    except LLMUnavailableError as e:
+        logger.error(f"LLM unavailable: {str(e)}")
+        yield "done", BUSY_RESPONSE
+    except Exception as e:
+        logger.error(f"Error streaming RAG response: {str(e)}")
+        yield "done", ERROR_RESPONSE
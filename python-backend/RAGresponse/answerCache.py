@@ -0,0 +1,144 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.metrics import CallbackCounter, register
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: answers given for one student's copy of a PDF are served to every
+# other student who uploaded the same file and asks (nearly) the same question
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Cosine similarity of the query embeddings needed for a hit. Lower values
+# start matching different questions ("chapter 3" and "chapter 4").
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.97"))
+
+class _DocAnswers:
+    """Normalized query embeddings of one document's cached answers, one matrix row each"""
+
+    def __init__(self, dimensions):
+        self.matrix = np.empty((8, dimensions), dtype=np.float32)
+        self.entry_ids = []
+
+    def add(self, entry_id, vector):
+        row = len(self.entry_ids)
+        if row == len(self.matrix):
+            self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+        self.matrix[row] = vector
+        self.entry_ids.append(entry_id)
+
+    def remove(self, entry_id):
+        # The last row takes the removed one's place
+        row = self.entry_ids.index(entry_id)
+        last = len(self.entry_ids) - 1
+        self.matrix[row] = self.matrix[last]
+        self.entry_ids[row] = self.entry_ids[last]
+        self.entry_ids.pop()
+
+    def best_match(self, vector):
+        """(entry_id, similarity) of the closest cached query"""
+        scores = self.matrix[:len(self.entry_ids)] @ vector
+        row = int(np.argmax(scores))
+        return self.entry_ids[row], float(scores[row])
+
+class AnswerCache:
+    """
+    Answers keyed by document content hash (the documentRegistry doc_id) and
+    query embedding, for questions asked without chat history
+    A lookup compares the query with every cached query of the same document
+    in one matrix product. Entries are evicted least recently used first once
+    there are `maxsize`, and expire `ttl` seconds after they were stored.
+    Documents are content addressed, so entries stay valid after the sessions
+    that uploaded them are gone and serve the next upload of the same file.
+    """
+
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL_SECONDS,
+                 threshold=ANSWER_CACHE_SIMILARITY, enabled=ANSWER_CACHE_ENABLED):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.enabled = enabled
+        # entry id -> (doc_id, answer, stored at), least recently used first
+        self._entries = OrderedDict()
+        self._docs = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id):
+        doc_id, _, _ = self._entries.pop(entry_id)
+        answers = self._docs[doc_id]
+        answers.remove(entry_id)
+        if not answers.entry_ids:
+            del self._docs[doc_id]
+
+    def get(self, doc_id, embedding):
+        """The cached answer to a question this similar about this document, else None"""
+        answers = self._docs.get(doc_id)
+        if answers is not None:
+            entry_id, similarity = answers.best_match(self._normalize(embedding))
+            if similarity >= self.threshold:
+                _, answer, stored_at = self._entries[entry_id]
+                if time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    logger.info(f"Answer cache hit for document {doc_id} (similarity {similarity:.3f}, hit rate {self.hit_rate():.1%})")
+                    return answer
+                self._remove(entry_id)
+        self.misses += 1
+        logger.info(f"Answer cache miss for document {doc_id} (hit rate {self.hit_rate():.1%})")
+        return None
+
+    def set(self, doc_id, embedding, answer):
+        vector = self._normalize(embedding)
+        answers = self._docs.get(doc_id)
+        if answers is None:
+            answers = self._docs[doc_id] = _DocAnswers(len(vector))
+        elif answers.entry_ids:
+            # A near duplicate stored meanwhile (e.g. by a concurrent request) is replaced
+            entry_id, similarity = answers.best_match(vector)
+            if similarity >= self.threshold:
+                self._remove(entry_id)
+                answers = self._docs.setdefault(doc_id, answers)
+        while len(self._entries) >= self.maxsize:
+            self._remove(next(iter(self._entries)))
+            answers = self._docs.setdefault(doc_id, answers)
+        entry_id = self._next_id
+        self._next_id += 1
+        answers.add(entry_id, vector)
+        self._entries[entry_id] = (doc_id, answer, time.monotonic())
+
+    def clear(self):
+        self._entries.clear()
+        self._docs.clear()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.maxsize,
+            "documents": len(self._docs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate(), 4),
+        }
+
+answer_cache = AnswerCache()
+
+register(CallbackCounter("answer_cache_lookups", "Answer cache lookups by result", ("result",),
+                         lambda: [(("hit",), answer_cache.hits), (("miss",), answer_cache.misses)]))
@@ -0,0 +1,101 @@
+import logging
+import os
+
+from utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Most tokens of document context sent with one question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+BLOCK_SEPARATOR = "\n\n---\n\n"
+
+class _Block:
+    """Text of one or more neighbouring chunks of the same document"""
+    __slots__ = ("key", "start", "end", "text", "rank", "page", "last_page")
+
+    def __init__(self, doc, rank):
+        metadata = doc.metadata or {}
+        # start_index counts from the start of the document, not the page
+        self.key = metadata.get("doc_id") or metadata.get("session_id") or metadata.get("source")
+        self.start = metadata.get("start_index")
+        self.text = doc.page_content
+        self.end = self.start + len(self.text) if self.start is not None else None
+        # Position in the retrieval results, lower is more relevant
+        self.rank = rank
+        self.page = metadata.get("page")
+        self.last_page = self.page
+
+    def absorb(self, other):
+        """
+        Appends a chunk that starts inside or right after this block, without
+        the text both share. Returns False when the offsets don't line up.
+        """
+        overlap = self.end - other.start
+        if overlap < 0 or overlap > len(other.text):
+            return False
+        if overlap and not self.text.endswith(other.text[:overlap]):
+            return False
+        self.text += other.text[overlap:]
+        self.end = max(self.end, other.end)
+        self.rank = min(self.rank, other.rank)
+        if other.page is not None:
+            self.last_page = other.page
+        return True
+
+def merge_chunks(documents):
+    """
+    Merges retrieved chunks of the same document that overlap or touch, also
+    across page breaks, ordered by their most relevant chunk. Chunks without a start_index are kept as they are.
+    """
+    blocks = [_Block(doc, rank) for rank, doc in enumerate(documents)]
+    loose = [block for block in blocks if block.start is None]
+    by_key = {}
+    for block in blocks:
+        if block.start is not None:
+            by_key.setdefault(block.key, []).append(block)
+
+    merged = list(loose)
+    for group in by_key.values():
+        group.sort(key=lambda block: block.start)
+        current = group[0]
+        for block in group[1:]:
+            if block.end <= current.end and current.text.find(block.text) != -1:
+                # Fully contained, e.g. the same chunk retrieved twice
+                current.rank = min(current.rank, block.rank)
+            elif not current.absorb(block):
+                merged.append(current)
+                current = block
+        merged.append(current)
+    merged.sort(key=lambda block: block.rank)
+    return merged
+
+def _format_block(block):
+    if block.page is None:
+        return block.text.strip()
+    if block.last_page is not None and block.last_page != block.page:
+        return f"[Pages {int(block.page) + 1}-{int(block.last_page) + 1}]\n{block.text.strip()}"
+    return f"[Page {int(block.page) + 1}]\n{block.text.strip()}"
+
+def pack_context(documents, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Builds the document context for the prompt: merged chunks in relevance
+    order, as many as fit in `budget` tokens. The most relevant block is cut to
+    the budget rather than dropped.
+    """
+    parts = []
+    used = 0
+    separator_tokens = count_tokens(BLOCK_SEPARATOR)
+    for block in merge_chunks(documents):
+        text = _format_block(block)
+        tokens = count_tokens(text) + (separator_tokens if parts else 0)
+        if used + tokens > budget:
+            if parts:
+                continue
+            # Roughly cut by characters, keeping the same characters per token
+            text = text[:max(0, len(text) * budget // max(tokens, 1))]
+            tokens = count_tokens(text)
+        parts.append(text)
+        used += tokens
+    logger.info(f"Packed {len(parts)} context blocks from {len(documents)} chunks into {used} tokens")
+    return BLOCK_SEPARATOR.join(parts)
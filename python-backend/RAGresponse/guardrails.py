@@ -0,0 +1,72 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+JAILBREAK_RESPONSE = "I can only answer questions about the uploaded document. Please ask about the document content."
+FILTERED_RESPONSE = "I can only answer questions about the uploaded document."
+
+JAILBREAK_PATTERNS = [
+    "ignore previous", "ignore all", "disregard", "forget", "new instructions",
+    "you are now", "act as", "pretend", "roleplay", "system prompt",
+    "reveal your", "show your instructions", "what are your rules"
+]
+
+# Phrases in a model answer that suggest it is talking about its own instructions
+OUTPUT_LEAK_PATTERNS = ["system prompt", "instructions", "i am programmed", "my role is"]
+
+class Guardrail:
+    """
+    Substring patterns compiled into one regex alternation
+    The text is lowercased once and scanned once; lowercasing up front is much
+    faster than re.IGNORECASE. Counts how many texts it checked and rejected.
+    """
+
+    def __init__(self, name, patterns):
+        self.name = name
+        self.patterns = [pattern.lower() for pattern in patterns]
+        self._matcher = re.compile("|".join(re.escape(pattern) for pattern in self.patterns))
+        self.checked = 0
+        self.rejected = 0
+
+    def match(self, text):
+        """Returns the first pattern found in text, or None"""
+        self.checked += 1
+        found = self._matcher.search(text.lower())
+        if found is None:
+            return None
+        self.rejected += 1
+        return found.group(0)
+
+    def stats(self):
+        return {
+            "patterns": len(self.patterns),
+            "checked": self.checked,
+            "rejected": self.rejected,
+            "rejection_rate": round(self.rejected / self.checked, 4) if self.checked else 0.0,
+        }
+
+jailbreak_guardrail = Guardrail("jailbreak", JAILBREAK_PATTERNS)
+output_leak_guardrail = Guardrail("output_leak", OUTPUT_LEAK_PATTERNS)
+
+def is_jailbreak_attempt(query):
+    """Runs before retrieval, so a blocked query never reaches OpenAI, Pinecone or Groq"""
+    pattern = jailbreak_guardrail.match(query)
+    if pattern is not None:
+        logger.warning(f"Potential jailbreak attempt detected ({pattern}): {query}")
+        return True
+    return False
+
+def filter_response(chatbot_response):
+    # Validate response isn't revealing system info
+    pattern = output_leak_guardrail.match(chatbot_response)
+    if pattern is not None:
+        logger.warning(f"Response contained system information ({pattern}), filtering")
+        return FILTERED_RESPONSE
+    return chatbot_response
+
+def guardrail_stats():
+    return {
+        jailbreak_guardrail.name: jailbreak_guardrail.stats(),
+        output_leak_guardrail.name: output_leak_guardrail.stats(),
+    }
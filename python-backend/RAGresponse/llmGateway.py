@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+
+from utils import clients
+from utils.metrics import Counter, observe_stage, record_llm_usage, register
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+# Smaller, faster model used while the main one is overloaded or failing, e.g.
+# llama-3.1-8b-instant. Empty disables the fallback.
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+# Longest a single attempt may take, and the whole call including queueing and retries
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "60"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))
+# Calls in flight per model; more wait in line
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Calls go to the fallback model once this many are waiting for the main one
+LLM_FALLBACK_QUEUE_DEPTH = int(os.getenv("LLM_FALLBACK_QUEUE_DEPTH", "8"))
+# Consecutive failures that open a model's circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+LLM_CALLS = register(Counter("llm_calls", "LLM API attempts by model and outcome", ("model", "outcome")))
+LLM_EVENTS = register(Counter("llm_gateway_events", "Retries, fallbacks, coalesced calls and fast failures", ("event",)))
+
+class LLMUnavailableError(Exception):
+    """No model could answer in time: circuits open, deadline passed or retries used up"""
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth another try"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    # The SDK's connection and timeout errors carry no status code
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, then fails fast for
+    `reset_seconds`. After that one trial call goes through (half open): its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=LLM_BREAKER_FAILURES, reset_seconds=LLM_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def available(self):
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial_running)
+
+    def before_call(self):
+        if self.state == "half_open":
+            self._trial_running = True
+
+    def cancel_call(self):
+        """The call ended without telling anything about the model's health"""
+        self._trial_running = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial_running:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            self._trial_running = False
+
+class _Lane:
+    """One model with its own concurrency cap and circuit breaker"""
+
+    def __init__(self, model, max_concurrency):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.breaker = CircuitBreaker(model)
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "in_flight": self.max_concurrency - self.semaphore._value,
+            "waiting": self.waiting,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+        }
+
+class LLMGateway:
+    """
+    Every Groq chat completion goes through here
+    - deadlines: each attempt is cut off after `timeout`, the whole call
+      (queueing, attempts and backoff) after `deadline`
+    - retries with jittered exponential backoff on 429/5xx/timeouts,
+      honouring Retry-After
+    - at most `max_concurrency` calls in flight per model, the time spent
+      waiting for a slot is recorded as the llm/queue_wait stage
+    - identical non-streaming prompts in flight at the same time share one call
+    - a circuit breaker per model fails fast while it is degraded; with a
+      fallback model configured, calls move to it while the main model's
+      circuit is open or its queue is long
+    Raises LLMUnavailableError when no answer can be had in time. Other
+    errors (e.g. a 400) are raised as they are.
+    """
+
+    def __init__(self, model=LLM_MODEL, fallback_model=LLM_FALLBACK_MODEL, max_concurrency=LLM_MAX_CONCURRENCY,
+                 timeout=LLM_TIMEOUT_SECONDS, deadline=LLM_DEADLINE_SECONDS, max_attempts=LLM_MAX_ATTEMPTS,
+                 backoff=LLM_BACKOFF_SECONDS, fallback_queue_depth=LLM_FALLBACK_QUEUE_DEPTH):
+        self.primary = _Lane(model, max_concurrency)
+        self.fallback = _Lane(fallback_model, max_concurrency) if fallback_model else None
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.fallback_queue_depth = fallback_queue_depth
+        self._in_flight = {}
+
+    @property
+    def model(self):
+        return self.primary.model
+
+    def _pick_lane(self):
+        primary, fallback = self.primary, self.fallback
+        fallback_ready = fallback is not None and fallback.breaker.available()
+        if primary.breaker.available() and not (fallback_ready and primary.waiting >= self.fallback_queue_depth):
+            return primary
+        if fallback_ready:
+            LLM_EVENTS.inc(1, "fallback")
+            return fallback
+        LLM_EVENTS.inc(1, "circuit_open")
+        return None
+
+    def _backoff_delay(self, error, attempt):
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return retry_after
+        # Full jitter: spreads out retries of calls that failed together
+        return random.uniform(0, self.backoff * 2 ** (attempt - 1))
+
+    def _record_outcome(self, lane, error=None):
+        if error is None:
+            lane.breaker.record_success()
+            LLM_CALLS.inc(1, lane.model, "ok")
+        elif is_retryable(error):
+            lane.breaker.record_failure()
+            LLM_CALLS.inc(1, lane.model, "timeout" if isinstance(error, (asyncio.TimeoutError, TimeoutError)) else "retryable_error")
+        else:
+            LLM_CALLS.inc(1, lane.model, "error")
+
+    async def _acquire(self, lane, remaining):
+        started = time.perf_counter()
+        lane.waiting += 1
+        try:
+            await asyncio.wait_for(lane.semaphore.acquire(), remaining)
+        except asyncio.TimeoutError:
+            raise LLMUnavailableError(f"No free {lane.model} slot within the deadline")
+        finally:
+            lane.waiting -= 1
+            observe_stage("llm", "queue_wait", time.perf_counter() - started)
+
+    async def _attempts(self, call):
+        """
+        Runs call(lane, timeout) under the retry, deadline and breaker rules
+        Returns (lane, result) of the first successful attempt. That lane's
+        slot is still held: the caller releases it and records the outcome
+        once it is done with the result (e.g. at the end of a stream).
+        """
+        deadline = time.monotonic() + self.deadline
+        last_error = None
+        for attempt in range(1, self.max_attempts + 1):
+            lane = self._pick_lane()
+            if lane is None:
+                raise LLMUnavailableError("Every model's circuit is open") from last_error
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await self._acquire(lane, remaining)
+            timeout = min(self.timeout, max(deadline - time.monotonic(), 0.001))
+            lane.breaker.before_call()
+            try:
+                result = await asyncio.wait_for(call(lane, timeout), timeout)
+            except Exception as e:
+                lane.semaphore.release()
+                self._record_outcome(lane, e)
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                logger.warning(f"LLM call to {lane.model} failed (attempt {attempt}/{self.max_attempts}): {str(e) or type(e).__name__}")
+                if attempt == self.max_attempts:
+                    break
+                delay = self._backoff_delay(e, attempt)
+                if time.monotonic() + delay >= deadline:
+                    break
+                LLM_EVENTS.inc(1, "retry")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: the attempt says nothing about the model's health
+                lane.semaphore.release()
+                lane.breaker.cancel_call()
+                raise
+            return lane, result
+        raise LLMUnavailableError("LLM call failed or timed out") from last_error
+
+    async def _complete(self, operation, messages, params):
+        async def call(lane, timeout):
+            return await clients.get_async_groq_client().chat.completions.create(
+                model=lane.model, messages=messages, timeout=timeout, **params
+            )
+
+        lane, response = await self._attempts(call)
+        lane.semaphore.release()
+        self._record_outcome(lane)
+        record_llm_usage(operation, getattr(response, "usage", None))
+        return response
+
+    @staticmethod
+    def _prompt_key(messages, params):
+        payload = json.dumps([messages, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def complete(self, operation, messages, **params):
+        """
+        Chat completion with the gateway's policies, returns the SDK response
+        operation: Label for token metrics ("query", "summarize"...)
+        """
+        key = self._prompt_key(messages, params)
+        task = self._in_flight.get(key)
+        if task is not None:
+            LLM_EVENTS.inc(1, "coalesced")
+        else:
+            task = asyncio.ensure_future(self._complete(operation, messages, params))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # Shielded: one caller going away doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            # Marks the error as retrieved when every caller has gone away
+            task.exception()
+
+    async def stream(self, operation, messages, **params):
+        """
+        Streaming chat completion, yields the SDK's chunks
+        Retries and fallback only apply until the stream is open; a stream
+        that breaks halfway is not restarted, its first part was already sent.
+        """
+        async def call(lane, timeout):
+            return await clients.get_async_groq_client().chat.completions.create(
+                model=lane.model, messages=messages, timeout=timeout, stream=True, **params
+            )
+
+        lane, stream = await self._attempts(call)
+        try:
+            async for chunk in stream:
+                # Groq sends the token usage with the last chunk
+                record_llm_usage(operation, getattr(getattr(chunk, "x_groq", None), "usage", None))
+                yield chunk
+        except Exception as e:
+            self._record_outcome(lane, e)
+            raise
+        else:
+            self._record_outcome(lane)
+        finally:
+            # A reader that goes away mid-stream leaves no outcome
+            lane.breaker.cancel_call()
+            lane.semaphore.release()
+
+    def stats(self):
+        return {
+            "primary": self.primary.stats(),
+            "fallback": self.fallback.stats() if self.fallback else None,
+            "prompts_in_flight": len(self._in_flight),
+        }
+
+llm_gateway = LLMGateway()
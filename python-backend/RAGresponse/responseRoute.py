@@ -1,17 +1,21 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import RAGresponse.RAG_app as RAG_app
+from RAGresponse.retrievalCache import retrieval_cache
+from RAGresponse.answerCache import answer_cache
+from RAGresponse.guardrails import guardrail_stats
+from RAGresponse.llmGateway import llm_gateway
 from fastapi import Query as FastAPIQuery, HTTPException
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import json
 import logging
-from datetime import datetime, timedelta
-from collections import defaultdict
+from datetime import datetime
+from sessionStore.sessionData import SessionData
+from sessionStore.stores import session_store, SessionLockTimeout
 
 logger = logging.getLogger(__name__)
 
-limiter = Limiter(key_func=get_remote_address)
-
 class Query(BaseModel):
     user_query: str
 
@@ -20,75 +24,141 @@ class Response(BaseModel):
 
 response_router = APIRouter()
 
-# Session storage with metadata
-class SessionData:
-    def __init__(self):
-        self.chat_history = []
-        self.gemini_chat_history = []
-        self.last_accessed = datetime.now()
-        self.message_count = 0
-
-# Global variable for chat history per session with expiration
-session_storage = defaultdict(SessionData)
-SESSION_EXPIRY_HOURS = 24
 MAX_MESSAGES_PER_SESSION = 100
 
-def cleanup_expired_sessions():
-    """Remove sessions that haven't been accessed in SESSION_EXPIRY_HOURS"""
-    current_time = datetime.now()
-    expired_sessions = [
-        session_id for session_id, data in session_storage.items()
-        if (current_time - data.last_accessed).total_seconds() > SESSION_EXPIRY_HOURS * 3600
-    ]
-    for session_id in expired_sessions:
-        del session_storage[session_id]
-        logger.info(f"Expired session cleaned up: {session_id}")
-    return len(expired_sessions)
+def validate_query_request(query, session_id):
+    # Validate session_id
+    if not session_id or len(session_id) < 5:
+        raise HTTPException(status_code=400, detail="Valid session_id is required")
+    
+    # Validate query
+    if not query.user_query or len(query.user_query.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    if len(query.user_query) > 1000:
+        raise HTTPException(status_code=400, detail="Query too long (max 1000 characters)")
 
-# Fetching user request using POST request
-@response_router.post("/query", response_model=Response)
-@limiter.limit("20/minute")
-async def fetch_query(request: Request, query: Query, session_id: str = FastAPIQuery(...)):
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+# Sessions with a summary in the making, one at a time per session
+_summarizing = set()
+
+async def summarize_session(session_id):
+    """Runs after the response has been sent, folds old turns into the session's summary"""
+    if session_id in _summarizing:
+        return
+    _summarizing.add(session_id)
     try:
-        # Validate session_id
-        if not session_id or len(session_id) < 5:
-            raise HTTPException(status_code=400, detail="Valid session_id is required")
-        
-        # Validate query
-        if not query.user_query or len(query.user_query.strip()) == 0:
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
-        
-        if len(query.user_query) > 1000:
-            raise HTTPException(status_code=400, detail="Query too long (max 1000 characters)")
-        
-        # Cleanup expired sessions periodically
-        cleanup_expired_sessions()
-        
-        # Get or create session data
-        session_data = session_storage[session_id]
-        session_data.last_accessed = datetime.now()
+        session_data = await session_store.load(session_id)
+        if session_data is None:
+            return
+        seqs = RAG_app.summary_turns(session_data.history)
+        if not seqs:
+            return
         
-        # Check message limit
-        if session_data.message_count >= MAX_MESSAGES_PER_SESSION:
-            raise HTTPException(status_code=429, detail="Session message limit reached. Please start a new session.")
+        # No lock while the model works: the turns are named by seq, so store_summary
+        # only applies the summary while they are still the oldest context turns
+        summary = await RAG_app.afinetuning_RAG_LLM(session_data.history, seqs)
+        if summary is None:
+            return
         
-        logger.info(f"Processing query for session: {session_id}")
-        
-        # Process query
-        rag_resp = RAG_app.main(query.user_query, session_data.gemini_chat_history, session_id)
+        async with session_store.lock(session_id):
+            session_data = await session_store.load(session_id)
+            if session_data is None:
+                return
+            RAG_app.store_summary(session_data.history, summary, seqs)
+            await session_store.save(session_data)
+    except Exception as e:
+        logger.error(f"Error summarizing session {session_id}: {str(e)}")
+    finally:
+        _summarizing.discard(session_id)
+
+# Fetching user request using POST request
+@response_router.post("/query", response_model=Response)
+async def fetch_query(query: Query, background_tasks: BackgroundTasks, session_id: str = FastAPIQuery(...)):
+    try:
+        validate_query_request(query, session_id)
         
-        # Update session data
-        session_data.chat_history.append({"user_query": query.user_query, "rag_response": rag_resp})
-        session_data.message_count += 1
+        async with session_store.lock(session_id):
+            # Get or create session data, one read and one write per request
+            session_data = await session_store.load(session_id) or SessionData(session_id)
+            session_data.last_accessed = datetime.now()
+            
+            # Check message limit
+            if session_data.message_count >= MAX_MESSAGES_PER_SESSION:
+                raise HTTPException(status_code=429, detail="Session message limit reached. Please start a new session.")
+            
+            logger.info(f"Processing query for session: {session_id}")
+            
+            # Process query without blocking the event loop
+            rag_resp = await RAG_app.amain(query.user_query, session_data.history, session_id)
+            
+            # Update session data
+            RAG_app.record_turn(session_data.history, query.user_query, rag_resp)
+            session_data.message_count += 1
+            await session_store.save(session_data)
         
+        background_tasks.add_task(summarize_session, session_id)
         return Response(rag_response=rag_resp if rag_resp else "")
         
     except HTTPException:
         raise
+    except SessionLockTimeout:
+        raise HTTPException(status_code=409, detail="Another query for this session is still running")
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail="Error processing your query")
 
+# Streaming variant of /query using Server-Sent Events
+@response_router.post("/query/stream")
+async def stream_query(query: Query, session_id: str = FastAPIQuery(...)):
+    """
+    Streams the answer as SSE events while Groq generates it
+    Events are JSON objects: {"type": "delta", "content": ...} for every chunk,
+    then {"type": "done", "rag_response": ...} with the filtered final answer.
+    """
+    validate_query_request(query, session_id)
+    
+    # Fail fast with a proper status code, re-checked under the lock below
+    session_data = await session_store.load(session_id)
+    if session_data is not None and session_data.message_count >= MAX_MESSAGES_PER_SESSION:
+        raise HTTPException(status_code=429, detail="Session message limit reached. Please start a new session.")
+    
+    async def event_stream():
+        try:
+            async with session_store.lock(session_id):
+                session_data = await session_store.load(session_id) or SessionData(session_id)
+                session_data.last_accessed = datetime.now()
+                
+                # Another request may have used the last slot meanwhile
+                if session_data.message_count >= MAX_MESSAGES_PER_SESSION:
+                    yield sse_event({"type": "error", "detail": "Session message limit reached. Please start a new session."})
+                    return
+                
+                logger.info(f"Streaming query for session: {session_id}")
+                rag_resp = ""
+                async for kind, text in RAG_app.astream_main(query.user_query, session_data.history, session_id):
+                    if kind == "delta":
+                        yield sse_event({"type": "delta", "content": text})
+                    else:
+                        rag_resp = text
+                
+                # Update session data once the full answer is known
+                RAG_app.record_turn(session_data.history, query.user_query, rag_resp)
+                session_data.message_count += 1
+                await session_store.save(session_data)
+                yield sse_event({"type": "done", "rag_response": rag_resp})
+        except SessionLockTimeout:
+            yield sse_event({"type": "error", "detail": "Another query for this session is still running"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(summarize_session, session_id)
+    )
+
 # Providing the response using get request
 @response_router.get("/history", response_model=list)
 async def get_history(session_id: str = FastAPIQuery(...)):
@@ -96,13 +166,13 @@ async def get_history(session_id: str = FastAPIQuery(...)):
         if not session_id or len(session_id) < 5:
             raise HTTPException(status_code=400, detail="Valid session_id is required")
         
-        if session_id not in session_storage:
+        session_data = await session_store.load(session_id)
+        if session_data is None:
             raise HTTPException(status_code=404, detail="No history found for this session.")
         
-        session_data = session_storage[session_id]
-        session_data.last_accessed = datetime.now()
+        await session_store.touch(session_id)
         
-        return session_data.chat_history
+        return session_data.history.to_list()
         
     except HTTPException:
         raise
@@ -114,18 +184,37 @@ async def get_history(session_id: str = FastAPIQuery(...)):
 async def get_session_info(session_id: str = FastAPIQuery(...)):
     """Get information about a session"""
     try:
-        if session_id not in session_storage:
+        session_data = await session_store.load(session_id)
+        if session_data is None:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        session_data = session_storage[session_id]
         return {
             "session_id": session_id,
             "message_count": session_data.message_count,
             "last_accessed": session_data.last_accessed.isoformat(),
-            "messages_remaining": MAX_MESSAGES_PER_SESSION - session_data.message_count
+            "messages_remaining": MAX_MESSAGES_PER_SESSION - session_data.message_count,
+            "history_turns": len(session_data.history),
+            "history_bytes": session_data.nbytes,
+            # Shared by every session, answers only come from it before the first answered question
+            "answer_cache": answer_cache.stats()
         }
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error getting session info: {str(e)}")
         raise HTTPException(status_code=500, detail="Error fetching session info")
+
+@response_router.get("/cache-stats")
+async def get_cache_stats():
+    """Hit/miss counters of the query embedding and retrieval caches"""
+    return retrieval_cache.stats()
+
+@response_router.get("/guardrail-stats")
+async def get_guardrail_stats():
+    """Checked/rejected counters of the jailbreak and output leak guardrails"""
+    return guardrail_stats()
+
+@response_router.get("/llm-stats")
+async def get_llm_stats():
+    """Models in use, their in-flight and queued calls and circuit states"""
+    return llm_gateway.stats()
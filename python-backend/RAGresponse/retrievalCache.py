@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import os
+import re
+import struct
+
+from cachetools import TTLCache
+
+from utils.metrics import CallbackCounter, register
+
+logger = logging.getLogger(__name__)
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))
+RETRIEVAL_CACHE_TTL_SECONDS = int(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "900"))
+
+_whitespace = re.compile(r"\s+")
+
+def normalize_query(query):
+    """Queries differing only in case, spacing or trailing punctuation share cache entries"""
+    return _whitespace.sub(" ", query).strip().rstrip("?!. ").lower()
+
+def embedding_digest(embedding):
+    packed = struct.pack(f"{len(embedding)}f", *embedding)
+    return hashlib.blake2b(packed, digest_size=16).hexdigest()
+
+class CountingCache:
+    """TTL + LRU cache that counts its hits and misses"""
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._cache[key] = value
+
+    def pop(self, key):
+        return self._cache.pop(key, None)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "max_size": int(self._cache.maxsize),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+class RetrievalCache:
+    """
+    Two cache layers in front of retrieval
+    query text -> embedding skips the OpenAI call, (doc_id, embedding) ->
+    retrieved chunks skips the Pinecone query. Documents are content
+    addressed (see utils/documentRegistry), so an entry can never describe
+    other vectors than the ones searched: a session that uploads another PDF
+    looks up another doc_id, on every worker, and nothing has to be invalidated.
+    """
+
+    def __init__(self, embedding_size=QUERY_EMBEDDING_CACHE_SIZE, results_size=RETRIEVAL_CACHE_SIZE,
+                 ttl=RETRIEVAL_CACHE_TTL_SECONDS):
+        self.embeddings = CountingCache(embedding_size, ttl)
+        self.results = CountingCache(results_size, ttl)
+
+    def get_embedding(self, query):
+        return self.embeddings.get(normalize_query(query))
+
+    def set_embedding(self, query, embedding):
+        self.embeddings.set(normalize_query(query), embedding)
+
+    def get_results(self, doc_id, embedding):
+        return self.results.get((doc_id, embedding_digest(embedding)))
+
+    def set_results(self, doc_id, embedding, documents):
+        """Only for fully embedded documents, a partial one's results change as it is embedded"""
+        self.results.set((doc_id, embedding_digest(embedding)), documents)
+
+    def stats(self):
+        return {
+            "query_embeddings": self.embeddings.stats(),
+            "retrievals": self.results.stats(),
+        }
+
+retrieval_cache = RetrievalCache()
+
+def _cache_counts(field):
+    return lambda: [((cache,), stats[field]) for cache, stats in retrieval_cache.stats().items()]
+
+register(CallbackCounter("cache_hits", "Retrieval cache hits", ("cache",), _cache_counts("hits")))
+register(CallbackCounter("cache_misses", "Retrieval cache misses", ("cache",), _cache_counts("misses")))
@@ -0,0 +1,255 @@
+"""
+End-to-end benchmark of the upload -> query -> cleanup flow
+
+Pinecone, OpenAI, Groq and Cloudinary are replaced through the client override
+seam in utils/clients with the stand-ins in benchmarks/fakes.py, each with its
+own latency and a shared injected error rate. Pinecone is the working
+InMemoryIndex, so uploaded chunks really are embedded, stored, retrieved and
+deleted. The app runs in-process (lifespan included) behind an httpx ASGI
+transport.
+
+Every simulated student uploads a fixture PDF to /upload-pdf/, polls
+/upload-status/ until ingestion finishes, asks --queries questions on /query
+and ends with /cleanup-session. --concurrency students run at a time.
+Results (throughput, p50/p95/p99 per endpoint, RSS, per stage timings from
+utils.metrics) are printed and written to --output as JSON; pass an earlier
+result file to --compare to see the differences.
+
+Run from the python-backend directory:
+    python -m benchmarks.e2e --sessions 16 --concurrency 4 --output e2e.json
+    python -m benchmarks.e2e --sessions 16 --concurrency 4 --compare e2e.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+from benchmarks import fakes
+
+QUESTIONS = [
+    "What is gradient descent?",
+    "How does the learning rate affect training?",
+    "Why does regularisation reduce overfitting?",
+    "What is an activation function?",
+    "How is the validation data used?",
+    "What does a neural network layer compute?",
+]
+
+def rss_mb():
+    """Current resident set size, from /proc where available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+def load_app(args):
+    for key in ("PINECONE_API_KEY", "PINECONE_INDEX_NAME", "OPENAI_API_KEY", "GROQ_API_KEY"):
+        os.environ.setdefault(key, "benchmark")
+    # Warm-up would build the real clients before the fakes are installed
+    os.environ["STARTUP_WARMUP"] = "false"
+
+    import main
+    from utils import clients
+
+    fakes_by_name = {
+        "index": fakes.InMemoryIndex(latency=args.pinecone_latency, error_rate=args.error_rate, seed=args.seed),
+        "embeddings": fakes.FakeEmbeddings(latency=args.embedding_latency, error_rate=args.error_rate, seed=args.seed + 1),
+        "groq": fakes.FakeGroq(latency=args.llm_latency, error_rate=args.error_rate, seed=args.seed + 2),
+        "async_groq": fakes.FakeAsyncGroq(latency=args.llm_latency, error_rate=args.error_rate, seed=args.seed + 3),
+        "cloudinary": fakes.FakeCloudinaryUploader(latency=args.cloudinary_latency, error_rate=args.error_rate, seed=args.seed + 4),
+    }
+    clients.reset_clients()
+    for name, fake in fakes_by_name.items():
+        clients.override_client(name, fake)
+
+    # Every simulated student shares one client address, as if behind a school NAT,
+    # so with --rate-limit the whole run is capped by RATE_LIMIT_IP_PER_MINUTE
+    main.rate_limiter.enabled = args.rate_limit
+    logging.getLogger().setLevel(logging.WARNING)
+    return main, fakes_by_name
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, operation, seconds, ok):
+        self.samples.setdefault(operation, []).append((seconds, ok))
+
+    def summary(self, wall):
+        results = {}
+        for operation, samples in sorted(self.samples.items()):
+            latencies = [seconds * 1000 for seconds, _ in samples]
+            errors = sum(1 for _, ok in samples if not ok)
+            results[operation] = {
+                "count": len(samples),
+                "errors": errors,
+                "throughput_per_s": round(len(samples) / wall, 3),
+                "p50_ms": round(fakes.percentile(latencies, 50), 2),
+                "p95_ms": round(fakes.percentile(latencies, 95), 2),
+                "p99_ms": round(fakes.percentile(latencies, 99), 2),
+                "max_ms": round(max(latencies), 2),
+            }
+        return results
+
+async def timed(recorder, operation, request):
+    started = time.perf_counter()
+    try:
+        response = await request
+    except Exception:
+        recorder.add(operation, time.perf_counter() - started, False)
+        raise
+    recorder.add(operation, time.perf_counter() - started, response.status_code < 400)
+    return response
+
+async def upload(client, recorder, args, session_id, pdf):
+    """Uploads the PDF and waits for its ingestion job, returns the Cloudinary public id or None"""
+    started = time.perf_counter()
+    while True:
+        response = await timed(recorder, "upload-pdf", client.post(
+            "/upload-pdf/",
+            params={"session_id": session_id},
+            files={"file": (f"{session_id}.pdf", pdf, "application/pdf")},
+        ))
+        # The ingestion queue is full, back off like the client would
+        if response.status_code != 503:
+            break
+        await asyncio.sleep(args.poll_interval * 4)
+    if response.status_code != 202:
+        return None
+
+    job_id = response.json()["job_id"]
+    while True:
+        await asyncio.sleep(args.poll_interval)
+        status = (await client.get(f"/upload-status/{job_id}")).json()
+        if status["status"] in ("completed", "failed"):
+            break
+    # Time from the first upload attempt until the document is searchable
+    recorder.add("ingest", time.perf_counter() - started, status["status"] == "completed")
+    return status["cloudinary_public_id"]
+
+async def student(client, recorder, args, index, rng):
+    session_id = f"e2e-session-{index}"
+    pdf = fakes.make_pdf(pages=args.pages, lines_per_page=args.lines_per_page, seed=0 if args.same_pdf else index)
+    public_id = await upload(client, recorder, args, session_id, pdf)
+    for _ in range(args.queries):
+        await timed(recorder, "query", client.post(
+            "/query", params={"session_id": session_id}, json={"user_query": rng.choice(QUESTIONS)}
+        ))
+    params = {"session_id": session_id}
+    if public_id:
+        params["cloudinary_public_id"] = public_id
+    await timed(recorder, "cleanup-session", client.post("/cleanup-session", params=params))
+
+def stage_summary():
+    from utils.metrics import STAGE_SECONDS
+
+    stages = {}
+    for (operation, stage), (counts, total) in sorted(STAGE_SECONDS._values.items()):
+        count = sum(counts)
+        stages[f"{operation}.{stage}"] = {"count": count, "mean_ms": round(total / count * 1000, 2) if count else 0.0}
+    return stages
+
+async def run(args):
+    import httpx
+
+    main, service_fakes = load_app(args)
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    slots = asyncio.Semaphore(args.concurrency)
+    peak = {"rss": rss_mb()}
+    rss_start = peak["rss"]
+
+    async def sample_rss():
+        while True:
+            peak["rss"] = max(peak["rss"], rss_mb())
+            await asyncio.sleep(0.05)
+
+    async def limited(index):
+        async with slots:
+            await student(client, recorder, args, index, rng)
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            sampler = asyncio.create_task(sample_rss())
+            started = time.perf_counter()
+            await asyncio.gather(*(limited(i) for i in range(args.sessions)))
+            wall = time.perf_counter() - started
+            sampler.cancel()
+
+    return {
+        "config": vars(args),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "wall_seconds": round(wall, 3),
+        "sessions_per_s": round(args.sessions / wall, 3),
+        "endpoints": recorder.summary(wall),
+        "rss_mb": {"start": round(rss_start, 1), "peak": round(max(peak["rss"], rss_mb()), 1), "end": round(rss_mb(), 1)},
+        "injected_errors": {name: fake.errors for name, fake in service_fakes.items()},
+        "stages": stage_summary(),
+    }
+
+def print_results(result, baseline=None):
+    print(f"{result['config']['sessions']} sessions, concurrency {result['config']['concurrency']}: "
+          f"{result['wall_seconds']:.2f}s, {result['sessions_per_s']:.2f} sessions/s")
+    print(f"{'endpoint':<16} {'count':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for operation, stats in result["endpoints"].items():
+        line = (f"{operation:<16} {stats['count']:>6} {stats['errors']:>6} {stats['throughput_per_s']:>8.2f} "
+                f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+        previous = (baseline or {}).get("endpoints", {}).get(operation)
+        if previous:
+            line += f"   p50 {stats['p50_ms'] - previous['p50_ms']:+.1f} p95 {stats['p95_ms'] - previous['p95_ms']:+.1f} ms vs baseline"
+        print(line)
+    rss = result["rss_mb"]
+    print(f"RSS start {rss['start']:.1f} MB, peak {rss['peak']:.1f} MB, end {rss['end']:.1f} MB")
+    if baseline:
+        print(f"Baseline peak RSS {baseline['rss_mb']['peak']:.1f} MB, wall {baseline['wall_seconds']:.2f}s")
+    print(f"Injected errors: {result['injected_errors']}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=16, help="Simulated students, one upload each")
+    parser.add_argument("--concurrency", type=int, default=4, help="Students active at the same time")
+    parser.add_argument("--queries", type=int, default=5, help="Questions per student")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per fixture PDF")
+    parser.add_argument("--lines-per-page", type=int, default=40)
+    parser.add_argument("--same-pdf", action="store_true", help="Every student uploads the same PDF (exercises deduplication)")
+    parser.add_argument("--embedding-latency", type=float, default=0.15)
+    parser.add_argument("--pinecone-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--cloudinary-latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls every fake service fails")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep rate limiting on (429s count as errors)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Seconds between /upload-status polls")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Earlier JSON result to compare against")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    result = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(result, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
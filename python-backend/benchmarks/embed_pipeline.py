@@ -0,0 +1,85 @@
+"""
+Throughput benchmark for the batched embedding/upsert pipeline
+
+A fake embedder sleeps for a fixed per-request latency plus a per-chunk cost,
+and a fake upsert sleeps for its own latency, so the sweep shows how batch size
+and embedding concurrency trade off against each other.
+
+Run from the python-backend directory:
+    python -m benchmarks.embed_pipeline --chunks 2000
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from fileUpload.embedPipeline import RateBudget, embed_and_upsert
+
+def make_records(count):
+    return [
+        {"id": f"bench-{i}", "text": "lorem ipsum dolor sit amet " * 35, "metadata": {"page": i // 5}}
+        for i in range(count)
+    ]
+
+def make_backends(args, rng):
+    async def embed_batch(texts):
+        await asyncio.sleep(args.embed_latency + args.per_chunk_latency * len(texts))
+        if rng.random() < args.error_rate:
+            raise RuntimeError("injected embedding failure")
+        return [[0.0] * 8 for _ in texts]
+
+    async def upsert_batch(records):
+        await asyncio.sleep(args.upsert_latency)
+
+    return embed_batch, upsert_batch
+
+async def run_once(args, batch_size, concurrency):
+    rng = random.Random(args.seed)
+    embed_batch, upsert_batch = make_backends(args, rng)
+    budget = RateBudget(args.requests_per_minute, args.tokens_per_minute)
+    started = time.perf_counter()
+    stats = await embed_and_upsert(
+        make_records(args.chunks),
+        embed_batch=embed_batch,
+        upsert_batch=upsert_batch,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        upsert_concurrency=args.upsert_concurrency,
+        budget=budget,
+    )
+    elapsed = time.perf_counter() - started
+    return stats, elapsed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-sizes", default="16,32,64,128")
+    parser.add_argument("--concurrency", default="1,2,4,8")
+    parser.add_argument("--upsert-concurrency", type=int, default=2)
+    parser.add_argument("--embed-latency", type=float, default=0.25, help="Seconds per embedding request")
+    parser.add_argument("--per-chunk-latency", type=float, default=0.002, help="Extra seconds per chunk in a request")
+    parser.add_argument("--upsert-latency", type=float, default=0.08)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability an embedding request fails")
+    parser.add_argument("--requests-per-minute", type=int, default=3000)
+    parser.add_argument("--tokens-per-minute", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    batch_sizes = [int(value) for value in args.batch_sizes.split(",")]
+    concurrencies = [int(value) for value in args.concurrency.split(",")]
+
+    print(f"{args.chunks} chunks, embed {args.embed_latency * 1000:.0f} ms + "
+          f"{args.per_chunk_latency * 1000:.1f} ms/chunk, upsert {args.upsert_latency * 1000:.0f} ms")
+    print(f"{'batch':>6}{'conc':>6}{'seconds':>10}{'chunks/s':>11}{'failed':>8}")
+    for batch_size in batch_sizes:
+        for concurrency in concurrencies:
+            stats, elapsed = asyncio.run(run_once(args, batch_size, concurrency))
+            print(f"{batch_size:>6}{concurrency:>6}{elapsed:>10.2f}"
+                  f"{stats['vectors_upserted'] / elapsed:>11.0f}{stats['chunks_failed']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,580 @@
+"""
+Local stand-ins for the external services used by the backend
+Every fake sleeps for a configurable latency so benchmarks can measure how the
+application behaves while it waits on the network, without any API keys. The
+service fakes also fail a configurable fraction of calls (error_rate) with a
+FakeServiceError, like a 503 from the real API.
+"""
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+
+EMBEDDING_DIMENSION = 1536
+
+class FakeServiceError(Exception):
+    """Injected failure, carries a status code like the SDKs' API errors"""
+
+    def __init__(self, service, status_code=503):
+        super().__init__(f"{service}: injected {status_code} error")
+        self.status_code = status_code
+
+class _FakeService:
+    """Latency and error injection shared by the service fakes"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    def _maybe_fail(self):
+        self.calls += 1
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors += 1
+            raise FakeServiceError(type(self).__name__)
+
+    def _wait(self, latency=None):
+        latency = self.latency if latency is None else latency
+        if latency:
+            time.sleep(latency)
+        self._maybe_fail()
+
+    async def _await(self, latency=None):
+        latency = self.latency if latency is None else latency
+        if latency:
+            await asyncio.sleep(latency)
+        self._maybe_fail()
+
+def _usage(messages, content):
+    # Same 4 characters per token estimate the app falls back to
+    prompt_tokens = sum(len(message["content"]) // 4 + 1 for message in messages or ())
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(content) // 4 + 1)
+
+def _completion(content, messages=None):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(messages, content))
+
+class FakeEmbeddings(_FakeService):
+    """Mimics OpenAIEmbeddings (embed_query/aembed_query/embed_documents)"""
+
+    def __init__(self, latency=0.15, error_rate=0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+
+    def _vector(self, text):
+        # Seeded by the text, so the same text gets the same vector in every run
+        bits = random.Random(text).getrandbits(EMBEDDING_DIMENSION)
+        return [float((bits >> i) & 1) for i in range(EMBEDDING_DIMENSION)]
+
+    def embed_query(self, text):
+        self._wait()
+        return self._vector(text)
+
+    async def aembed_query(self, text):
+        await self._await()
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self._wait()
+        return [self._vector(text) for text in texts]
+
+    async def aembed_documents(self, texts):
+        await self._await()
+        return [self._vector(text) for text in texts]
+
+class FakeIndex(_FakeService):
+    """Mimics the subset of the Pinecone Index API used by the backend"""
+
+    def __init__(self, latency=0.2, error_rate=0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+
+    def query(self, **kwargs):
+        self._wait()
+        return {"matches": []}
+
+    def upsert(self, vectors, **kwargs):
+        self._wait()
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, **kwargs):
+        self._wait()
+        return {}
+
+    def describe_index_stats(self, **kwargs):
+        return SimpleNamespace(total_vector_count=0, namespaces={})
+
+def _matches_filter(metadata, metadata_filter):
+    for key, condition in (metadata_filter or {}).items():
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+class InMemoryIndex(_FakeService):
+    """
+    Working in-memory stand-in for a Pinecone serverless Index
+    Stores vectors per namespace and implements upsert, query (cosine),
+    fetch, list, delete and delete_namespace with the same arguments and
+    response shapes as the real client, so PineconeVectorStore, ingestion,
+    cleanup and the namespace migration run against it unchanged.
+    """
+
+    # PineconeVectorStore reads the host and key from the index it is given
+    config = SimpleNamespace(host="in-memory", api_key="")
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+        # namespace -> {id: (values as float32 array, metadata)}
+        self.namespaces = {}
+
+    def upsert(self, vectors, namespace=None, **kwargs):
+        import numpy as np
+
+        self._wait()
+        store = self.namespaces.setdefault(namespace or "", {})
+        for vector in vectors:
+            if isinstance(vector, dict):
+                vector_id, values, metadata = vector["id"], vector["values"], vector.get("metadata", {})
+            else:
+                vector_id, values, metadata = (tuple(vector) + ({},))[:3]
+            store[vector_id] = (np.asarray(values, dtype=np.float32), dict(metadata))
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k=10, namespace=None, filter=None, include_metadata=False, **kwargs):
+        import numpy as np
+
+        self._wait()
+        store = self.namespaces.get(namespace or "", {})
+        candidates = [
+            (vector_id, values, metadata) for vector_id, (values, metadata) in store.items()
+            if _matches_filter(metadata, filter)
+        ]
+        if not candidates:
+            return {"matches": [], "namespace": namespace or ""}
+        query = np.asarray(vector, dtype=np.float32)
+        matrix = np.stack([values for _, values, _ in candidates])
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+        order = np.argsort(-scores)[:top_k]
+        matches = []
+        for position in order:
+            vector_id, _, metadata = candidates[position]
+            match = {"id": vector_id, "score": float(scores[position])}
+            if include_metadata:
+                match["metadata"] = dict(metadata)
+            matches.append(match)
+        return {"matches": matches, "namespace": namespace or ""}
+
+    def fetch(self, ids, namespace=None, **kwargs):
+        self._wait()
+        store = self.namespaces.get(namespace or "", {})
+        vectors = {
+            vector_id: SimpleNamespace(id=vector_id, values=store[vector_id][0].tolist(), metadata=dict(store[vector_id][1]))
+            for vector_id in ids if vector_id in store
+        }
+        return SimpleNamespace(vectors=vectors, namespace=namespace or "")
+
+    def list(self, prefix=None, limit=100, namespace=None, **kwargs):
+        ids = sorted(
+            vector_id for vector_id in self.namespaces.get(namespace or "", {})
+            if prefix is None or vector_id.startswith(prefix)
+        )
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def delete(self, ids=None, delete_all=None, namespace=None, filter=None, **kwargs):
+        self._wait()
+        store = self.namespaces.get(namespace or "", {})
+        if delete_all:
+            store.clear()
+        elif ids is not None:
+            for vector_id in ids:
+                store.pop(vector_id, None)
+        elif filter:
+            for vector_id in [vid for vid, (_, metadata) in store.items() if _matches_filter(metadata, filter)]:
+                del store[vector_id]
+        return {}
+
+    def delete_namespace(self, namespace, **kwargs):
+        from pinecone.exceptions import NotFoundException
+
+        self._wait()
+        if namespace not in self.namespaces:
+            raise NotFoundException(status=404, reason="Namespace not found")
+        del self.namespaces[namespace]
+        return {}
+
+    def describe_index_stats(self, **kwargs):
+        namespaces = {
+            name: SimpleNamespace(vector_count=len(store))
+            for name, store in self.namespaces.items() if store
+        }
+        return SimpleNamespace(
+            total_vector_count=sum(ns.vector_count for ns in namespaces.values()),
+            namespaces=namespaces,
+            dimension=EMBEDDING_DIMENSION,
+        )
+
+class FakeVectorStore:
+    """Mimics PineconeVectorStore for the retrieval path"""
+
+    latency = 0.2
+    chunks = [
+        "Gradient descent updates parameters in the direction of the negative gradient.",
+        "A learning rate that is too large makes the optimisation diverge.",
+        "Regularisation adds a penalty term to the loss to reduce overfitting.",
+    ]
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def _results(self):
+        return [(Document(page_content=chunk), 0.8) for chunk in self.chunks]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, **kwargs):
+        time.sleep(self.latency)
+        return self._results()[:k]
+
+    def add_documents(self, documents, **kwargs):
+        time.sleep(self.latency)
+        return [str(i) for i in range(len(documents))]
+
+    def as_retriever(self, **kwargs):
+        store = self
+
+        class _Retriever:
+            def invoke(self, query):
+                time.sleep(store.latency)
+                return [doc for doc, _ in store._results()]
+
+        return _Retriever()
+
+class FakeGroq(_FakeService):
+    """Mimics groq.Groq with a fixed generation latency"""
+
+    def __init__(self, latency=1.0, content="Gradient descent minimises the loss step by step.", error_rate=0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+        self.content = content
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages=None, **kwargs):
+        self._wait()
+        return _completion(self.content, messages)
+
+class FakeAsyncGroq(_FakeService):
+    """Mimics groq.AsyncGroq with a fixed generation latency"""
+
+    def __init__(self, latency=1.0, content="Gradient descent minimises the loss step by step.", error_rate=0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+        self.content = content
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, stream=False, messages=None, **kwargs):
+        if stream:
+            # Streams fail when the request is made, before the first chunk
+            await self._await(latency=0)
+            return self._stream(messages)
+        await self._await()
+        return _completion(self.content, messages)
+
+    async def _stream(self, messages):
+        words = self.content.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            delta = SimpleNamespace(content=word if i == 0 else " " + word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        # Like Groq, usage comes with a last chunk that has no choices
+        yield SimpleNamespace(choices=[], x_groq=SimpleNamespace(usage=_usage(messages, self.content)))
+
+class FakeCloudinaryUploader(_FakeService):
+    """Mimics cloudinary.uploader.upload/destroy"""
+
+    def __init__(self, latency=0.5, error_rate=0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+
+    def upload(self, file, public_id=None, folder=None, **kwargs):
+        self._wait()
+        return {"secure_url": f"https://res.cloudinary.invalid/raw/upload/{folder}/{public_id}"}
+
+    def destroy(self, public_id, **kwargs):
+        self._wait(self.latency / 2)
+        return {"result": "ok"}
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+def make_pdf(pages=3, lines_per_page=40, seed=0):
+    """Build a small text-only PDF in memory, used as a fixture for upload benchmarks"""
+    import random
+
+    rng = random.Random(seed)
+    vocabulary = (
+        "gradient descent learning rate loss function optimisation model training data "
+        "neural network layer weight bias activation regularisation overfitting validation"
+    ).split()
+
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(None)
+    page_ids = []
+    for page_no in range(pages):
+        lines = [
+            " ".join(rng.choice(vocabulary) for _ in range(12))
+            for _ in range(lines_per_page)
+        ]
+        text = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        stream = text.encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (pages_id, font_id, content_id)
+        ))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref_offset
+    )
+    return bytes(out)
+
+class FakeRedis:
+    """
+    In-process stand-in for redis.asyncio.Redis
+    Covers the commands used by RedisSessionStore, with key expiry, so the
+    Redis backend can be exercised without a server. Its Lua scripts run as
+    the Python equivalents below.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._values = {}
+        self._expires = {}
+        self._zsets = {}
+        self._sets = {}
+
+    def _alive(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._values
+
+    @staticmethod
+    def _encode(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    # Synchronous command implementations shared by the client and pipelines
+    def _get(self, key):
+        return self._values[key] if self._alive(key) else None
+
+    def _mget(self, keys):
+        return [self._get(key) for key in keys]
+
+    def _set(self, key, value, ex=None, px=None, nx=False):
+        if nx and self._alive(key):
+            return None
+        self._values[key] = self._encode(value)
+        self._expires.pop(key, None)
+        if ex is not None:
+            self._expires[key] = time.time() + ex
+        if px is not None:
+            self._expires[key] = time.time() + px / 1000
+        return True
+
+    def _delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                deleted += 1
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+            if self._zsets.pop(key, None) is not None:
+                deleted += 1
+        return deleted
+
+    def _exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key) or key in self._zsets)
+
+    def _expire(self, key, seconds):
+        if not self._alive(key):
+            return False
+        self._expires[key] = time.time() + seconds
+        return True
+
+    def _zadd(self, key, mapping, xx=False, nx=False):
+        zset = self._zsets.setdefault(key, {})
+        added = 0
+        for member, score in mapping.items():
+            member = self._encode(member)
+            if (xx and member not in zset) or (nx and member in zset):
+                continue
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    def _zscore(self, key, member):
+        return self._zsets.get(key, {}).get(self._encode(member))
+
+    def _zrem(self, key, *members):
+        zset = self._zsets.get(key, {})
+        return sum(1 for member in members if zset.pop(self._encode(member), None) is not None)
+
+    def _zrangebyscore(self, key, low, high, start=None, num=None):
+        low = float("-inf") if low == "-inf" else float(low)
+        high = float("inf") if high == "+inf" else float(high)
+        members = sorted(
+            (score, member) for member, score in self._zsets.get(key, {}).items()
+            if low <= score <= high
+        )
+        result = [member for _, member in members]
+        if start is not None:
+            result = result[start:start + num if num is not None else None]
+        return result
+
+    def _zcard(self, key):
+        return len(self._zsets.get(key, {}))
+
+    def _sadd(self, key, *members):
+        members = {self._encode(member) for member in members}
+        current = self._sets.setdefault(key, set())
+        added = len(members - current)
+        current |= members
+        return added
+
+    def _srem(self, key, *members):
+        current = self._sets.get(key, set())
+        removed = sum(1 for member in members if self._encode(member) in current)
+        current -= {self._encode(member) for member in members}
+        if not current:
+            self._sets.pop(key, None)
+        return removed
+
+    def _scard(self, key):
+        return len(self._sets.get(key, ()))
+
+    # Python equivalents of the Lua scripts in sessionStore/stores.py
+    def _attach_document(self, keys, args):
+        session_id, doc_id, sessions_prefix, chunks_prefix = args
+        previous = self._get(keys[0])
+        if previous == self._encode(doc_id):
+            return None
+        self._set(keys[0], doc_id)
+        self._sadd(sessions_prefix + doc_id, session_id)
+        if previous is None:
+            return None
+        self._srem(sessions_prefix + previous.decode(), session_id)
+        if self._scard(sessions_prefix + previous.decode()):
+            return None
+        self._delete(chunks_prefix + previous.decode())
+        return previous
+
+    def _detach_document(self, keys, args):
+        session_id, sessions_prefix, chunks_prefix = args
+        doc_id = self._get(keys[0])
+        if doc_id is None:
+            return []
+        self._delete(keys[0])
+        self._srem(sessions_prefix + doc_id.decode(), session_id)
+        if self._scard(sessions_prefix + doc_id.decode()):
+            return [doc_id, 0]
+        self._delete(chunks_prefix + doc_id.decode())
+        return [doc_id, 1]
+
+    def _mark_document_ready(self, keys, args):
+        if self._scard(keys[0]):
+            self._set(keys[1], args[0])
+        return None
+
+    def _unlock(self, keys, args):
+        if self._get(keys[0]) != self._encode(args[0]):
+            return 0
+        return self._delete(keys[0])
+
+    def register_script(self, script):
+        from sessionStore import stores
+
+        impl = {
+            stores._ATTACH_DOCUMENT_SCRIPT: FakeRedis._attach_document,
+            stores._DETACH_DOCUMENT_SCRIPT: FakeRedis._detach_document,
+            stores._MARK_DOCUMENT_READY_SCRIPT: FakeRedis._mark_document_ready,
+            stores._UNLOCK_SCRIPT: FakeRedis._unlock,
+        }[script]
+
+        async def run(keys=(), args=()):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return impl(self, list(keys), [str(arg) for arg in args])
+
+        return run
+
+    def __getattr__(self, name):
+        impl = getattr(type(self), f"_{name}", None)
+        if impl is None:
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return impl(self, *args, **kwargs)
+
+        return call
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._queued = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._queued = []
+
+    def __getattr__(self, name):
+        impl = getattr(type(self._redis), f"_{name}", None)
+        if impl is None:
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self._queued.append((impl, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        if self._redis.latency:
+            await asyncio.sleep(self._redis.latency)
+        results = [impl(self._redis, *args, **kwargs) for impl, args, kwargs in self._queued]
+        self._queued = []
+        return results
@@ -0,0 +1,95 @@
+"""
+Benchmark for parsing and chunking several PDF uploads at once
+
+Every upload is parsed and chunked as in the upload route, without embedding,
+first through the blocking thread pool (PDF_PARSE_MODE=thread) and then in
+worker processes (PDF_PARSE_MODE=process) for each pool size. The process
+pools are warmed up before timing so worker start-up is not counted. Event
+loop lag is how late a 10 ms timer fires meanwhile, i.e. how long other
+requests would wait while the uploads are parsed.
+
+Run from the python-backend directory:
+    python -m benchmarks.parallel_ingest --uploads 8 --pages 60
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+from benchmarks.fakes import make_pdf
+from fileUpload import pdfUpload
+from utils import processPool
+
+async def ingest_one(pdf, name):
+    started = time.perf_counter()
+    first_chunk = None
+    chunks = 0
+    async for _ in pdfUpload._stream_chunks(pdf, name, None):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - started
+        chunks += 1
+    return time.perf_counter() - started, first_chunk, chunks
+
+async def measure_lag(lags, interval=0.01):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+async def run_mode(pdfs):
+    lags = []
+    ticker = asyncio.create_task(measure_lag(lags))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(ingest_one(pdf, f"upload-{i}.pdf") for i, pdf in enumerate(pdfs)))
+    wall = time.perf_counter() - started
+    ticker.cancel()
+    return wall, results, lags
+
+def report(label, wall, results, lags, pages):
+    durations = sorted(duration for duration, _, _ in results)
+    first_chunks = [first for _, first, _ in results]
+    print(
+        f"{label:<22} wall {wall:6.2f}s  {len(results) / wall:5.2f} uploads/s  {pages * len(results) / wall:7.1f} pages/s  "
+        f"upload p50 {statistics.median(durations):5.2f}s max {durations[-1]:5.2f}s  "
+        f"first chunk p50 {statistics.median(first_chunks):5.2f}s  "
+        f"loop lag p99 {sorted(lags)[int(len(lags) * 0.99)] * 1000:6.1f}ms max {max(lags) * 1000:6.1f}ms"
+    )
+
+def warm_up(pdf, workers):
+    # Start every worker and import the parser in it before timing
+    pool = processPool.get_process_pool()
+    from fileUpload.pdfParsing import parse_pdf_records
+    list(pool.map(parse_pdf_records, [pdf] * workers, [None] * workers, [1000] * workers, [200] * workers))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=8, help="PDFs uploaded at the same time")
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--lines-per-page", type=int, default=50)
+    parser.add_argument("--processes", default="1,2,4", help="Process pool sizes to try")
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    pdfs = [make_pdf(pages=args.pages, lines_per_page=args.lines_per_page, seed=i) for i in range(args.uploads)]
+    print(f"{args.uploads} concurrent uploads of {args.pages} pages, {os.cpu_count()} CPUs")
+
+    pdfUpload.PDF_PARSE_MODE = "thread"
+    wall, results, lags = asyncio.run(run_mode(pdfs))
+    report("thread pool", wall, results, lags, args.pages)
+    thread_chunks = [chunks for _, _, chunks in results]
+
+    pdfUpload.PDF_PARSE_MODE = "process"
+    for workers in (int(value) for value in args.processes.split(",")):
+        processPool.PARSE_PROCESSES = workers
+        warm_up(pdfs[0], workers)
+        wall, results, lags = asyncio.run(run_mode(pdfs))
+        report(f"process pool x{workers}", wall, results, lags, args.pages)
+        assert [chunks for _, _, chunks in results] == thread_chunks, "process mode produced different chunks"
+        processPool.shutdown_process_pool()
+
+if __name__ == "__main__":
+    main()
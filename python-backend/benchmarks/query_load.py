@@ -0,0 +1,153 @@
+"""
+Load benchmark for /query mixed with cheap /history and /session-info calls
+
+All external services are replaced by the stand-ins in benchmarks/fakes.py, so
+the numbers only reflect how the app schedules work while waiting on them.
+"blocking" replays the old behaviour (embedding, search and generation called
+synchronously on the event loop, see blocking_main), "async" uses RAG_app.amain.
+
+Run from the python-backend directory:
+    python -m benchmarks.query_load --rate 20 --requests 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+
+from benchmarks import fakes
+
+def load_app(args):
+    for key in ("PINECONE_API_KEY", "PINECONE_INDEX_NAME", "OPENAI_API_KEY", "GROQ_API_KEY"):
+        os.environ.setdefault(key, "benchmark")
+
+    import main
+    import RAGresponse.RAG_app as RAG_app
+    import RAGresponse.responseRoute as responseRoute
+    from utils import clients
+
+    fakes.FakeVectorStore.latency = args.pinecone_latency
+    clients.override_client("index", fakes.FakeIndex(latency=args.pinecone_latency))
+    clients.override_client("vector_store", fakes.FakeVectorStore())
+    clients.override_client("embeddings", fakes.FakeEmbeddings(latency=args.embedding_latency))
+    clients.override_client("groq", fakes.FakeGroq(latency=args.llm_latency))
+    clients.override_client("async_groq", fakes.FakeAsyncGroq(latency=args.llm_latency))
+
+    main.rate_limiter.enabled = False
+    logging.getLogger().setLevel(logging.WARNING)
+    return main.app, RAG_app, responseRoute
+
+def blocking_main(RAG_app, query, chat_history):
+    """The pipeline as it was before it went async: every service call blocks the event loop"""
+    from utils import clients
+
+    embedding = clients.get_embeddings().embed_query(query)
+    results = clients.get_vector_store().similarity_search_by_vector_with_score(embedding, k=RAG_app.RETRIEVER_TOP_K)
+    documents = [doc for doc, _ in results]
+    response = clients.get_groq_client().chat.completions.create(
+        model=RAG_app.llm_gateway.model,
+        messages=RAG_app.build_rag_messages(documents, query, chat_history),
+        temperature=0.2,
+        max_tokens=RAG_app.RESPONSE_MAX_TOKENS,
+        top_p=0.9,
+    )
+    return RAG_app.finalize_response(response.choices[0].message.content)
+
+async def run_mode(mode, args):
+    import httpx
+
+    app, RAG_app, responseRoute = load_app(args)
+    original_amain = RAG_app.amain
+
+    if mode == "blocking":
+        async def blocking_amain(query, chat_history, session_id=None):
+            return blocking_main(RAG_app, query, chat_history)
+        RAG_app.amain = blocking_amain
+
+    latencies = {"query": [], "history": [], "session-info": []}
+    rng = random.Random(args.seed)
+    session_ids = [f"bench-session-{i}" for i in range(args.clients)]
+    for session_id in session_ids:
+        await responseRoute.session_store.delete(session_id)
+
+    # Open-loop arrivals: latency is measured from the scheduled arrival time, so
+    # time spent waiting for a blocked event loop is counted.
+    arrivals = []
+    clock = 0.0
+    for _ in range(args.requests):
+        clock += rng.expovariate(args.rate)
+        roll = rng.random()
+        if roll < args.query_ratio:
+            kind = "query"
+        elif roll < args.query_ratio + (1 - args.query_ratio) / 2:
+            kind = "history"
+        else:
+            kind = "session-info"
+        arrivals.append((clock, kind, rng.choice(session_ids)))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Make sure every session exists so /history and /session-info return 200
+        await asyncio.gather(*[
+            client.post(f"/query?session_id={sid}", json={"user_query": "warm up"})
+            for sid in session_ids
+        ])
+
+        async def fire(due, kind, session_id):
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            if kind == "query":
+                resp = await client.post(
+                    f"/query?session_id={session_id}",
+                    json={"user_query": "What is gradient descent?"},
+                )
+            elif kind == "history":
+                resp = await client.get(f"/history?session_id={session_id}")
+            else:
+                resp = await client.get(f"/session-info?session_id={session_id}")
+            resp.raise_for_status()
+            latencies[kind].append(time.perf_counter() - due)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            fire(started + offset, kind, session_id)
+            for offset, kind, session_id in arrivals
+        ])
+        elapsed = time.perf_counter() - started
+
+    RAG_app.amain = original_amain
+    return latencies, elapsed
+
+def report(mode, latencies, elapsed):
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"\n[{mode}] {total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+    print(f"{'route':<14}{'count':>7}{'p50 ms':>10}{'p99 ms':>10}")
+    for kind, samples in latencies.items():
+        print(
+            f"{kind:<14}{len(samples):>7}"
+            f"{fakes.percentile(samples, 50) * 1000:>10.1f}"
+            f"{fakes.percentile(samples, 99) * 1000:>10.1f}"
+        )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["blocking", "async", "both"], default="both")
+    parser.add_argument("--clients", type=int, default=20, help="Number of distinct sessions")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20.0, help="Mean arrivals per second")
+    parser.add_argument("--query-ratio", type=float, default=0.3)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--pinecone-latency", type=float, default=0.08)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    modes = ["blocking", "async"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        latencies, elapsed = asyncio.run(run_mode(mode, args))
+        report(mode, latencies, elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark for session expiry with a large number of live sessions
+
+Compares the old request path, which scanned every session for expiry before
+handling each query, with the current one, where a query only loads, updates
+and saves its own session and expiry is left to the background sweeper.
+
+Run from the python-backend directory:
+    python -m benchmarks.session_expiry --sessions 100000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sessionStore.sessionData import SessionData
+from sessionStore.stores import InMemorySessionStore
+
+def scan_expired(store):
+    """The per-request scan the query routes used to run"""
+    now = datetime.now()
+    return [
+        session_id for session_id, data in store._sessions.items()
+        if now - data.last_accessed > timedelta(seconds=store.expiry_seconds)
+    ]
+
+async def handle_query(store, session_id, scan):
+    if scan:
+        scan_expired(store)
+    session_data = await store.load(session_id)
+    session_data.last_accessed = datetime.now()
+    session_data.message_count += 1
+    await store.save(session_data)
+
+async def fill(store, count, expired):
+    now = datetime.now()
+    stale = now - timedelta(seconds=store.expiry_seconds + 60)
+    await store.save_many(
+        SessionData(f"bench-{i}", last_accessed=stale if i < expired else now)
+        for i in range(count)
+    )
+
+async def run(args):
+    store = InMemorySessionStore()
+    await fill(store, args.sessions, 0)
+    session_ids = [f"bench-{i}" for i in range(args.sessions)]
+
+    print(f"{args.sessions} sessions, {args.requests} requests")
+    for label, scan, requests in (("scan per request", True, args.scan_requests), ("no scan", False, args.requests)):
+        started = time.perf_counter()
+        for i in range(requests):
+            await handle_query(store, session_ids[(i * 7919) % len(session_ids)], scan)
+        elapsed = time.perf_counter() - started
+        print(f"{label:>18}: {elapsed / requests * 1e6:10.1f} us/request")
+
+    store = InMemorySessionStore()
+    await fill(store, args.sessions, args.expired)
+    started = time.perf_counter()
+    removed = await store.cleanup_expired()
+    elapsed = time.perf_counter() - started
+    print(f"{'sweep':>18}: {elapsed * 1000:10.2f} ms to expire {len(removed)} of {args.sessions}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--scan-requests", type=int, default=50, help="The scanning path is slow, so run fewer")
+    parser.add_argument("--expired", type=int, default=1000, help="Expired sessions for the sweep measurement")
+    return parser.parse_args()
+
+def main():
+    asyncio.run(run(parse_args()))
+
+if __name__ == "__main__":
+    main()
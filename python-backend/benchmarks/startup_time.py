@@ -0,0 +1,85 @@
+"""
+Cold start benchmark: time to import the app and to answer the first request
+
+Each run uses a fresh interpreter, like a machine Fly starts after idling.
+"import" is how long `import main` takes; "first response" is the time from
+launching uvicorn until GET / succeeds. The background warm-up is disabled by
+default so no external service is contacted. Pass limits to use it as a
+regression gate, the exit status is 1 when a median exceeds its limit.
+
+Run from the python-backend directory:
+    python -m benchmarks.startup_time --runs 5 --max-import-seconds 1 --max-first-response-seconds 3
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure_import(env):
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, check=True, capture_output=True, text=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+def measure_first_response(env, timeout):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+                time.sleep(0.01)
+        raise RuntimeError(f"No response within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for the first response")
+    parser.add_argument("--warmup", action="store_true", help="Keep the background client warm-up enabled")
+    parser.add_argument("--max-import-seconds", type=float)
+    parser.add_argument("--max-first-response-seconds", type=float)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    env = dict(os.environ, STARTUP_WARMUP="true" if args.warmup else "false")
+
+    imports = [measure_import(env) for _ in range(args.runs)]
+    first_responses = [measure_first_response(env, args.timeout) for _ in range(args.runs)]
+
+    failed = False
+    for label, values, limit in (
+        ("import main", imports, args.max_import_seconds),
+        ("first response", first_responses, args.max_first_response_seconds),
+    ):
+        median = statistics.median(values)
+        verdict = ""
+        if limit is not None:
+            verdict = "ok" if median <= limit else f"OVER LIMIT {limit:.2f}s"
+            failed = failed or median > limit
+        print(f"{label:<15} median {median:6.3f}s  min {min(values):6.3f}s  max {max(values):6.3f}s  {verdict}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Retrieval latency of the local vector index
+
+Fills a LocalVectorIndex with random 1536-dimensional vectors for a number of
+documents and times the same call apinecone_retriver makes, a top-5 search
+through PineconeVectorStore scoped to one document, either by metadata filter
+or by namespace. Compare with the Pinecone round trip from the app's region.
+
+Run from the python-backend directory:
+    python -m benchmarks.vector_search --chunks 300,1000,5000
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+import numpy as np
+from langchain_pinecone import PineconeVectorStore
+
+from benchmarks import fakes
+from utils.localVectorIndex import LocalVectorIndex
+
+def fill(index, documents, chunks, rng, namespaces):
+    for doc in range(documents):
+        vectors = rng.standard_normal((chunks, fakes.EMBEDDING_DIMENSION), dtype=np.float32)
+        records = [
+            {"id": f"doc{doc}-{i}", "values": vectors[i].tolist(), "metadata": {"doc_id": f"doc{doc}", "text": f"chunk {i}"}}
+            for i in range(chunks)
+        ]
+        namespace = f"doc-doc{doc}" if namespaces else None
+        for start in range(0, chunks, 100):
+            index.upsert(vectors=records[start:start + 100], namespace=namespace)
+
+def run(args, chunks, namespaces):
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as path:
+        index = LocalVectorIndex(path, fakes.EMBEDDING_DIMENSION)
+        fill(index, args.documents, chunks, rng, namespaces)
+        # Reopen from disk like after a restart, the matrices are memory-mapped
+        index = LocalVectorIndex(path, fakes.EMBEDDING_DIMENSION)
+        store = PineconeVectorStore(index=index, embedding=fakes.FakeEmbeddings(latency=0))
+
+        timings = []
+        for i in range(args.queries):
+            doc = f"doc{i % args.documents}"
+            scope = {"namespace": f"doc-{doc}"} if namespaces else {"filter": {"doc_id": doc}}
+            query = rng.standard_normal(fakes.EMBEDDING_DIMENSION, dtype=np.float32).tolist()
+            started = time.perf_counter()
+            results = store.similarity_search_by_vector_with_score(query, k=5, **scope)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert len(results) == 5
+        return timings
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", default="300,1000,5000", help="Chunks per document")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(f"{args.documents} documents, {args.queries} queries, top-5 cosine")
+    print(f"{'chunks/doc':>11}{'scope':>11}{'p50 ms':>9}{'p99 ms':>9}")
+    for chunks in (int(value) for value in args.chunks.split(",")):
+        for namespaces in (False, True):
+            timings = run(args, chunks, namespaces)
+            scope = "namespace" if namespaces else "filter"
+            print(f"{chunks:>11}{scope:>11}{fakes.percentile(timings, 50):>9.2f}{fakes.percentile(timings, 99):>9.2f}")
+
+if __name__ == "__main__":
+    main()
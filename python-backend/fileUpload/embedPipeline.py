@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+from utils import clients
+from utils.blockingPool import run_blocking
+from utils.metrics import count_chunks, span
+
+logger = logging.getLogger(__name__)
+
+# Chunks sent to the embeddings API per request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Embedding requests allowed in flight at the same time
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# Pinecone upserts allowed in flight at the same time
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "2"))
+# Attempts per batch before it is given up on
+EMBED_MAX_ATTEMPTS = int(os.getenv("EMBED_MAX_ATTEMPTS", "4"))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "0.5"))
+# Rate-limit budget for the embeddings API, shared by every ingestion in the process
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("EMBED_REQUESTS_PER_MINUTE", "3000"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "1000000"))
+
+class RateBudget:
+    """
+    Token bucket over requests and tokens per minute
+    acquire() waits until both buckets can pay for the request.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # A single request larger than the whole bucket still gets through once it is full
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait_requests = (1 - self._requests) * 60 / self.requests_per_minute
+                wait_tokens = (tokens - self._tokens) * 60 / self.tokens_per_minute
+                await asyncio.sleep(max(wait_requests, wait_tokens, 0.001))
+
+embed_budget = RateBudget(EMBED_REQUESTS_PER_MINUTE, EMBED_TOKENS_PER_MINUTE)
+
+def estimate_tokens(texts):
+    # Roughly 4 characters per token for English text, good enough for budgeting
+    return sum(len(text) for text in texts) // 4 + len(texts)
+
+async def _with_retries(what, func, *args):
+    for attempt in range(1, EMBED_MAX_ATTEMPTS + 1):
+        try:
+            return await func(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempt == EMBED_MAX_ATTEMPTS:
+                raise
+            delay = EMBED_BACKOFF_SECONDS * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            logger.warning(f"{what} failed (attempt {attempt}/{EMBED_MAX_ATTEMPTS}): {str(e)}, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+async def default_embed_batch(texts):
+    return await clients.get_embeddings().aembed_documents(texts)
+
+async def default_upsert_batch(records, namespace=None):
+    await run_blocking(clients.get_index().upsert, vectors=records, namespace=namespace)
+
+async def _aiter(records):
+    if hasattr(records, "__aiter__"):
+        async for record in records:
+            yield record
+    else:
+        for record in records:
+            yield record
+
+async def _batches(records, batch_size):
+    batch = []
+    async for record in _aiter(records):
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def embed_and_upsert(
+    records,
+    embed_batch=default_embed_batch,
+    upsert_batch=default_upsert_batch,
+    batch_size=EMBED_BATCH_SIZE,
+    concurrency=EMBED_CONCURRENCY,
+    upsert_concurrency=UPSERT_CONCURRENCY,
+    budget=embed_budget,
+    progress=None,
+):
+    """
+    Embed chunk records in batches and upsert them to the vector store
+    records: Iterable or async iterable of {"id", "text", "metadata"} dicts,
+        consumed lazily so embedding starts while records are still produced
+    embed_batch: async callable texts -> vectors
+    upsert_batch: async callable receiving Pinecone-style {"id", "values", "metadata"} records
+    progress: Optional callback progress(stage, **counts)
+
+    Up to `concurrency` embedding batches run at once within the rate budget,
+    and finished batches are upserted behind them while later batches are
+    still being embedded. Failed batches are retried with jittered exponential
+    backoff; a batch that keeps failing is skipped and counted as failed.
+    Returns a dict with chunks_embedded, vectors_upserted and chunks_failed.
+    """
+    stats = {"chunks_embedded": 0, "vectors_upserted": 0, "chunks_failed": 0}
+    embed_slots = asyncio.Semaphore(concurrency)
+    upsert_queue = asyncio.Queue(maxsize=max(1, upsert_concurrency * 2))
+
+    def report():
+        if progress is not None:
+            progress("embedding", **stats)
+
+    async def embed_one(batch):
+        texts = [record["text"] for record in batch]
+
+        async def call():
+            await budget.acquire(estimate_tokens(texts))
+            with span("ingest", "embed_batch"):
+                return await embed_batch(texts)
+
+        try:
+            try:
+                vectors = await _with_retries("Embedding batch", call)
+            except Exception as e:
+                logger.error(f"Giving up on embedding batch of {len(batch)} chunks: {str(e)}")
+                stats["chunks_failed"] += len(batch)
+                count_chunks("failed", len(batch))
+                return
+            stats["chunks_embedded"] += len(batch)
+            count_chunks("embedded", len(batch))
+            report()
+            # Blocks while the upserters are behind, which also holds back new embedding calls
+            await upsert_queue.put([
+                {"id": record["id"], "values": vector, "metadata": {**record["metadata"], "text": record["text"]}}
+                for record, vector in zip(batch, vectors)
+            ])
+        finally:
+            embed_slots.release()
+
+    async def upsert_worker():
+        while True:
+            batch = await upsert_queue.get()
+            try:
+                if batch is None:
+                    return
+                with span("ingest", "upsert_batch"):
+                    await _with_retries("Upsert batch", upsert_batch, batch)
+                stats["vectors_upserted"] += len(batch)
+                count_chunks("upserted", len(batch))
+                report()
+            except Exception as e:
+                logger.error(f"Giving up on upserting batch of {len(batch)} vectors: {str(e)}")
+                stats["chunks_failed"] += len(batch)
+                count_chunks("failed", len(batch))
+            finally:
+                upsert_queue.task_done()
+
+    upserters = [asyncio.create_task(upsert_worker()) for _ in range(upsert_concurrency)]
+    embedders = set()
+    try:
+        async for batch in _batches(records, batch_size):
+            await embed_slots.acquire()
+            task = asyncio.create_task(embed_one(batch))
+            embedders.add(task)
+            task.add_done_callback(embedders.discard)
+        await asyncio.gather(*list(embedders))
+        for _ in upserters:
+            await upsert_queue.put(None)
+        await asyncio.gather(*upserters)
+    finally:
+        for task in list(embedders) + upserters:
+            task.cancel()
+
+    return stats
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from .pdfUpload import process_pdf
+from sessionStore.sessionData import SessionData
+from sessionStore.stores import session_store
+from utils import clients
+from utils.blockingPool import run_blocking
+from utils.documentRegistry import release_session_vectors
+from utils.metrics import observe_stage, span
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+# Finished jobs are kept this long so clients can still poll their result
+INGEST_JOB_TTL_SECONDS = int(os.getenv("INGEST_JOB_TTL_SECONDS", "3600"))
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot accept another job"""
+
+class IngestJob:
+    def __init__(self, session_id, filename, public_id, file_content):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.filename = filename
+        self.public_id = public_id
+        self.cloudinary_public_id = f"pdfs/{public_id}"
+        self.file_content = file_content
+        self.status = "queued"
+        self.stage = "queued"
+        self.total_pages = 0
+        self.pages_parsed = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.vectors_upserted = 0
+        self.chunks_failed = 0
+        self.cloudinary_url = None
+        self.embedding_result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def update_progress(self, stage, **counts):
+        """Progress callback handed to the ingestion pipeline"""
+        self.stage = stage
+        for name, value in counts.items():
+            setattr(self, name, value)
+        self.updated_at = time.time()
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": {
+                "total_pages": self.total_pages,
+                "pages_parsed": self.pages_parsed,
+                "chunks_total": self.chunks_total,
+                "chunks_embedded": self.chunks_embedded,
+                "vectors_upserted": self.vectors_upserted,
+                "chunks_failed": self.chunks_failed,
+            },
+            "cloudinary_url": self.cloudinary_url,
+            "cloudinary_public_id": self.cloudinary_public_id if self.status == "completed" else None,
+            "embedding_result": self.embedding_result,
+            "error": self.error,
+        }
+
+class InMemoryJobBackend:
+    """
+    Bounded in-process queue plus a job table
+    Another backend (Redis list, database table...) only needs the same methods.
+    """
+
+    def __init__(self, max_queued=INGEST_QUEUE_SIZE):
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._jobs = {}
+
+    def put_nowait(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Ingestion queue is full")
+        self._jobs[job.job_id] = job
+
+    async def get_next(self):
+        return await self._queue.get()
+
+    def task_done(self):
+        self._queue.task_done()
+
+    def save(self, job):
+        self._jobs[job.job_id] = job
+
+    def load(self, job_id):
+        return self._jobs.get(job_id)
+
+    def queued_count(self):
+        return self._queue.qsize()
+
+    def prune(self, max_age_seconds):
+        cutoff = time.time() - max_age_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in ("completed", "failed") and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+async def upload_to_cloudinary(job):
+    with span("ingest", "cloudinary"):
+        return await run_blocking(
+            clients.get_cloudinary_uploader().upload,
+            job.file_content,
+            resource_type="raw",
+            folder="pdfs",
+            public_id=job.public_id,
+            timeout=60
+        )
+
+async def embed_pdf(job):
+    with span("ingest", "process_pdf"):
+        return await process_pdf(job.file_content, job.session_id, job.filename, job.update_progress)
+
+async def ingest_pdf(job):
+    """Upload the PDF to Cloudinary and embed it, updating job progress along the way"""
+    # Upload to Cloudinary and embed the in-memory bytes at the same time,
+    # ingestion never downloads the file back from Cloudinary
+    upload_result, embedding_result = await asyncio.gather(
+        upload_to_cloudinary(job),
+        embed_pdf(job),
+        return_exceptions=True
+    )
+
+    if isinstance(upload_result, Exception) or isinstance(embedding_result, Exception):
+        # The vectors are useless without the stored file and the other way
+        # round, drop this session's share of both
+        try:
+            await release_session_vectors(job.session_id)
+        except Exception as cleanup_error:
+            logger.error(f"Failed to cleanup Pinecone vectors: {str(cleanup_error)}")
+    if isinstance(embedding_result, Exception) and not isinstance(upload_result, Exception):
+        # Cleanup Cloudinary if upload succeeded but processing failed
+        try:
+            await run_blocking(clients.get_cloudinary_uploader().destroy, job.cloudinary_public_id, resource_type="raw")
+            logger.info(f"Cleaned up Cloudinary file: {job.cloudinary_public_id}")
+        except Exception as cleanup_error:
+            logger.error(f"Failed to cleanup Cloudinary: {str(cleanup_error)}")
+
+    if isinstance(embedding_result, Exception):
+        raise embedding_result
+    if isinstance(upload_result, Exception):
+        raise upload_result
+
+    job.cloudinary_url = upload_result["secure_url"]
+    job.embedding_result = embedding_result
+    logger.info(f"PDF uploaded to Cloudinary: {job.cloudinary_url}")
+    logger.info(f"PDF embedded successfully: {embedding_result}")
+
+async def touch_session(session_id):
+    """
+    Creates the session or refreshes its last_accessed
+    A session that uploads but never asks anything still expires, and the
+    sweeper releases its vectors with it.
+    """
+    try:
+        async with session_store.lock(session_id):
+            if await session_store.exists(session_id):
+                await session_store.touch(session_id)
+            else:
+                await session_store.save(SessionData(session_id))
+    except Exception as e:
+        logger.error(f"Failed to refresh session {session_id}: {str(e)}")
+
+class IngestJobManager:
+    """Runs queued ingestion jobs on a fixed number of asyncio worker tasks"""
+
+    def __init__(self, backend=None, workers=INGEST_WORKERS, job_ttl_seconds=INGEST_JOB_TTL_SECONDS):
+        self.backend = backend or InMemoryJobBackend()
+        self.workers = workers
+        self.job_ttl_seconds = job_ttl_seconds
+        self._tasks = []
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"ingest-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} ingestion workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Stopped ingestion workers")
+
+    async def submit(self, session_id, filename, public_id, file_content):
+        """Queue a new job and return it, raises QueueFullError when at capacity"""
+        self.backend.prune(self.job_ttl_seconds)
+        job = IngestJob(session_id, filename, public_id, file_content)
+        self.backend.put_nowait(job)
+        logger.info(f"Queued ingestion job {job.job_id} for session: {session_id}")
+        await touch_session(session_id)
+        return job
+
+    def get(self, job_id):
+        return self.backend.load(job_id)
+
+    async def _worker(self, worker_no):
+        while True:
+            job = await self.backend.get_next()
+            observe_stage("ingest", "queue_wait", time.time() - job.created_at)
+            try:
+                job.status = "running"
+                job.update_progress("starting")
+                self.backend.save(job)
+                await ingest_pdf(job)
+                job.status = "completed"
+                job.update_progress("completed")
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Ingestion was interrupted"
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion job {job.job_id} failed: {str(e)}")
+                job.status = "failed"
+                job.error = f"Error processing PDF: {str(e)}"
+                job.update_progress("failed")
+            finally:
+                # The bytes are no longer needed once the job is done
+                job.file_content = None
+                self.backend.save(job)
+                self.backend.task_done()
+            # The session's idle time starts when its upload is done
+            await touch_session(job.session_id)
+
+job_manager = IngestJobManager()
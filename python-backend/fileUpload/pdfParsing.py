@@ -0,0 +1,118 @@
+"""
+PDF parsing and chunking without any of the app's clients
+
+Kept free of Pinecone/OpenAI/Groq imports so parse worker processes
+(utils.processPool) start quickly and only load what parsing needs. The
+langchain modules themselves are imported on first use, they are slow to
+import and only uploads need them.
+"""
+
+# Per-page metadata fields, everything else PyPDFParser sets is the same on every page
+PAGE_FIELDS = ("page", "page_label")
+
+def iter_pdf_pages(pdf_source, source_name=None):
+    """
+    Parse a PDF lazily, yielding one Document per page as it is extracted
+    pdf_source: Raw PDF bytes (parsed in memory) or a path/URL for PyPDFLoader
+    source_name: Value stored as the "source" metadata for in-memory PDFs
+    """
+    if isinstance(pdf_source, bytes):
+        from langchain_community.document_loaders.parsers import PyPDFParser
+        from langchain_core.document_loaders import Blob
+
+        # Blob wraps the bytes in a BytesIO, which shares the buffer instead of copying it
+        blob = Blob.from_data(pdf_source, path=source_name, mime_type="application/pdf")
+        return PyPDFParser().lazy_parse(blob)
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(pdf_source).lazy_load()
+
+def _chunk_offsets(text, chunks, chunk_overlap):
+    """Start of every chunk in text, found the same way add_start_index does"""
+    offsets = []
+    index = 0
+    previous_chunk_len = 0
+    for chunk in chunks:
+        index = text.find(chunk, max(0, index + previous_chunk_len - chunk_overlap))
+        offsets.append(index)
+        previous_chunk_len = len(chunk)
+    return offsets
+
+def iter_chunks(pages, chunk_size, chunk_overlap):
+    """
+    Chunk pages as they arrive, yielding (text, metadata) pairs
+    The pages are treated as one continuous text, so a chunk can run over a
+    page break and keeps its overlap with the chunk before it. Only the text
+    from the start of the last, possibly unfinished chunk onwards is held back
+    and split again once the next page arrives. Chunk metadata is the metadata
+    of the page the chunk starts on, with start_index counted from the start of
+    the document.
+    Chunks cover the whole text and respect chunk_size, but they are not always
+    the ones splitting the whole document at once would give: the held back
+    text is split on its own, so a chunk can end at a different separator.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    pending = ""
+    pending_start = 0
+    # (document offset, page metadata) of the pages that pending spans
+    page_starts = []
+
+    def chunks_of(final):
+        nonlocal pending, pending_start
+        chunks = splitter.split_text(pending)
+        offsets = _chunk_offsets(pending, chunks, chunk_overlap)
+        ready = len(chunks) if final else len(chunks) - 1
+        for chunk, offset in zip(chunks[:ready], offsets[:ready]):
+            start = pending_start + max(offset, 0)
+            page_metadata = next(meta for page_start, meta in reversed(page_starts) if page_start <= start)
+            yield chunk, {**page_metadata, "start_index": start}
+        if not final and ready > 0 and offsets[ready] >= 0:
+            pending = pending[offsets[ready]:]
+            pending_start += offsets[ready]
+            while len(page_starts) > 1 and page_starts[1][0] <= pending_start:
+                page_starts.pop(0)
+
+    for page in pages:
+        if page_starts or pending:
+            pending += "\n"
+        page_starts.append((pending_start + len(pending), page.metadata))
+        pending += page.page_content
+        yield from chunks_of(final=False)
+    if pending.strip():
+        yield from chunks_of(final=True)
+
+def parse_pdf_records(pdf_source, source_name, chunk_size, chunk_overlap):
+    """
+    Parse and chunk a whole PDF into compact records, run in a worker process
+    Returns (document metadata, page count, chunks) where every chunk is a
+    (text, page, page_label, start_index) tuple. Metadata shared by all pages
+    is sent back once instead of with every chunk, and plain tuples pickle far
+    smaller and faster than Document objects.
+    """
+    document_metadata = {}
+    page_count = 0
+
+    def pages():
+        nonlocal document_metadata, page_count
+        for page in iter_pdf_pages(pdf_source, source_name):
+            page_count += 1
+            if not document_metadata:
+                document_metadata = {key: value for key, value in page.metadata.items() if key not in PAGE_FIELDS}
+            yield page
+
+    chunks = [
+        (text, metadata.get("page"), metadata.get("page_label"), metadata["start_index"])
+        for text, metadata in iter_chunks(pages(), chunk_size, chunk_overlap)
+    ]
+    return document_metadata, page_count, chunks
+
+def chunk_metadata(document_metadata, page, page_label, start_index):
+    """Rebuilds the metadata iter_chunks would have produced for a compact record"""
+    metadata = dict(document_metadata)
+    if page is not None:
+        metadata["page"] = page
+    if page_label is not None:
+        metadata["page_label"] = page_label
+    metadata["start_index"] = start_index
+    return metadata
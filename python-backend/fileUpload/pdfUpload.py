@@ -1,62 +1,184 @@
 from dotenv import load_dotenv
-import os
+from functools import partial
+from itertools import islice
 import logging
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from pinecone import Pinecone, ServerlessSpec
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
+import os
+import time
+from utils.blockingPool import run_blocking
+from utils.processPool import run_in_process
+from utils.metrics import observe_stage, span
+from utils.documentRegistry import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    PDF_DEDUP_ENABLED,
+    PINECONE_NAMESPACES,
+    document_key,
+    document_registry,
+    namespace_for,
+    vector_filter,
+    vector_id_prefix,
+)
+from .pdfParsing import chunk_metadata, iter_chunks, iter_pdf_pages, parse_pdf_records
+from .embedPipeline import EMBED_BATCH_SIZE, default_upsert_batch, embed_and_upsert
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-def process_pdf(file_path, session_id):
+# "thread" streams pages through the blocking thread pool (lowest memory, first
+# chunks embedded soonest); "process" parses whole PDFs in worker processes so
+# concurrent uploads don't compete for the GIL
+PDF_PARSE_MODE = os.getenv("PDF_PARSE_MODE", "thread").lower()
+
+def _report(progress, stage, **counts):
+    if progress is not None:
+        progress(stage, **counts)
+
+async def process_pdf(pdf_source, session_id, source_name=None, progress=None):
+    """
+    Parse, chunk and embed a PDF into the vector store
+    In-memory PDFs are deduplicated by content: when the same bytes were already
+    embedded, the session just takes a reference to the existing vectors.
+    progress: Optional callback progress(stage, **counts) used by ingestion jobs
+    """
     try:
-        logger.info(f"Processing PDF: {file_path} for session: {session_id}")
-        
-        loader = PyPDFLoader(file_path)
-        docs = loader.load()
-        
-        if not docs:
-            logger.error("No content extracted from PDF")
-            raise ValueError("PDF appears to be empty or unreadable")
-        
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            add_start_index=True,
-        )
-        all_splits = text_splitter.split_documents(docs)
-
-        # Add session metadata to documents
-        for doc in all_splits:
-            doc.metadata["session_id"] = session_id
-
-        PINECONE_API = os.getenv("PINECONE_API_KEY")
-        pc = Pinecone(api_key=PINECONE_API)
-        index_name = os.getenv("PINECONE_INDEX_NAME")
-        region_name = os.getenv("PINECONE_ENVIRONMENT")
-        
-        if not pc.has_index(index_name):
-            logger.info(f"Creating new Pinecone index: {index_name}")
-            pc.create_index(
-                name=index_name,
-                dimension=1536,  # OpenAI text-embedding-3-small dimension
-                metric="cosine",
-                spec=ServerlessSpec(cloud="aws", region=region_name),
-            )
-        
-        index = pc.Index(index_name)
-
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small", openai_api_key=openai_api_key)
-        vector_store = PineconeVectorStore(index=index, embedding=embeddings)
-        
-        vector_store.add_documents(all_splits)
-        logger.info(f"Successfully processed {len(all_splits)} chunks")
-        return f"Processed {len(all_splits)} chunks from {file_path}"
+        source_label = source_name or (pdf_source if isinstance(pdf_source, str) else "in-memory PDF")
+        logger.info(f"Processing PDF: {source_label} for session: {session_id}")
+
+        if not (PDF_DEDUP_ENABLED and isinstance(pdf_source, bytes)):
+            return await _ingest(pdf_source, source_name, source_label, session_id, None, progress)
+
+        with span("ingest", "hash"):
+            doc_id = await run_blocking(document_key, pdf_source)
+        # The session's previous document is locked too: when this upload
+        # leaves it unused its vectors are deleted, not while another session
+        # is deciding to reuse them
+        previous_doc_id = await document_registry.doc_for_session(session_id)
+        async with document_registry.ingest_locks(doc_id, previous_doc_id):
+            chunk_count = await document_registry.chunk_count(doc_id)
+            previous_chunk_count = await document_registry.chunk_count(previous_doc_id) if previous_doc_id else None
+            orphaned_doc_id = await document_registry.attach(session_id, doc_id)
+            if chunk_count is not None:
+                logger.info(f"Reusing {chunk_count} embedded chunks of document {doc_id} for session: {session_id}")
+                _report(progress, "reused", chunks_total=chunk_count, chunks_embedded=chunk_count, vectors_upserted=chunk_count)
+                result = f"Reused {chunk_count} chunks already embedded for {source_label}"
+            else:
+                try:
+                    result = await _ingest(pdf_source, source_name, source_label, session_id, doc_id, progress)
+                except Exception:
+                    await _restore_document(session_id, doc_id, previous_doc_id, previous_chunk_count)
+                    raise
+            # Only once the new document is in place
+            if orphaned_doc_id is not None:
+                await document_registry.delete_document(orphaned_doc_id)
+                logger.info(f"Deleted vectors of document {orphaned_doc_id}, replaced in session: {session_id}")
+            return result
     
     except Exception as e:
         logger.error(f"Error processing PDF: {str(e)}")
         raise
+
+async def _restore_document(session_id, doc_id, previous_doc_id, previous_chunk_count):
+    """Points the session back at the document it had before a failed upload"""
+    if previous_doc_id is not None:
+        orphaned_doc_id = await document_registry.attach(session_id, previous_doc_id)
+        if previous_chunk_count is not None:
+            await document_registry.mark_ready(previous_doc_id, previous_chunk_count)
+    else:
+        _, orphaned = await document_registry.detach(session_id)
+        orphaned_doc_id = doc_id if orphaned else None
+    if orphaned_doc_id is not None:
+        # Whatever part of the failed document was written
+        await document_registry.delete_document(orphaned_doc_id)
+
+async def _stream_chunks(pdf_source, source_name, progress, batch_size=EMBED_BATCH_SIZE):
+    """
+    Yields chunks while the PDF is still being parsed
+    Every step parses just enough pages for one embedding batch in the blocking
+    pool, so only the current pages and chunks are in memory and the first
+    batches are embedded (and searchable) before the last page is read.
+    """
+    if PDF_PARSE_MODE == "process":
+        async for chunk in _process_chunks(pdf_source, source_name, progress):
+            yield chunk
+        return
+
+    parsed = {"pages": 0, "total_pages": None, "chunks": 0}
+
+    def pages():
+        for page in iter_pdf_pages(pdf_source, source_name):
+            parsed["pages"] += 1
+            parsed["total_pages"] = page.metadata.get("total_pages", parsed["total_pages"])
+            yield page
+
+    chunks = iter_chunks(pages(), CHUNK_SIZE, CHUNK_OVERLAP)
+    # Parsing is interleaved with embedding, only the time spent parsing is counted
+    parse_seconds = 0.0
+    while True:
+        started = time.perf_counter()
+        batch = await run_blocking(lambda: list(islice(chunks, batch_size)))
+        parse_seconds += time.perf_counter() - started
+        if not batch:
+            observe_stage("ingest", "parse", parse_seconds)
+            return
+        parsed["chunks"] += len(batch)
+        _report(progress, "embedding", total_pages=parsed["total_pages"] or parsed["pages"],
+                pages_parsed=parsed["pages"], chunks_total=parsed["chunks"])
+        for chunk in batch:
+            yield chunk
+
+async def _process_chunks(pdf_source, source_name, progress):
+    """
+    Parses and chunks the whole PDF in a worker process
+    The worker sends back compact records, metadata is rebuilt here one chunk
+    at a time as the embedding pipeline consumes them.
+    """
+    with span("ingest", "parse"):
+        document_metadata, page_count, records = await run_in_process(
+            parse_pdf_records, pdf_source, source_name, CHUNK_SIZE, CHUNK_OVERLAP
+        )
+    _report(progress, "embedding", total_pages=page_count, pages_parsed=page_count, chunks_total=len(records))
+    for text, *position in records:
+        yield text, chunk_metadata(document_metadata, *position)
+
+async def _ingest(pdf_source, source_name, source_label, session_id, doc_id, progress):
+    """
+    Parsing and chunking stream page by page from the blocking pool (or come
+    from a worker process, see PDF_PARSE_MODE) straight into the batched
+    embedding/upsert pipeline in embedPipeline.
+    """
+    _report(progress, "parsing")
+
+    # Tag vectors with the document (shared) or the session (private),
+    # ids are stable so retried upserts overwrite
+    owner = vector_filter(doc_id, session_id)
+    id_prefix = vector_id_prefix(doc_id, session_id)
+    chunk_count = 0
+
+    async def records():
+        nonlocal chunk_count
+        async for text, metadata in _stream_chunks(pdf_source, source_name, progress):
+            yield {"id": f"{id_prefix}{chunk_count}", "text": text, "metadata": {**metadata, **owner}}
+            chunk_count += 1
+
+    namespace = namespace_for(doc_id, session_id) if PINECONE_NAMESPACES else None
+    stats = await embed_and_upsert(
+        records(),
+        upsert_batch=partial(default_upsert_batch, namespace=namespace),
+        progress=progress,
+    )
+    
+    if chunk_count == 0:
+        logger.error("No content extracted from PDF")
+        raise ValueError("PDF appears to be empty or unreadable")
+    if stats["vectors_upserted"] == 0:
+        raise ValueError("Failed to embed any content from the PDF")
+    if stats["chunks_failed"]:
+        # Incomplete documents are not offered for reuse
+        logger.warning(f"{stats['chunks_failed']} of {chunk_count} chunks could not be embedded")
+        return f"Processed {stats['vectors_upserted']} of {chunk_count} chunks from {source_label}"
+    
+    if doc_id:
+        await document_registry.mark_ready(doc_id, chunk_count)
+    logger.info(f"Successfully processed {chunk_count} chunks")
+    return f"Processed {chunk_count} chunks from {source_label}"
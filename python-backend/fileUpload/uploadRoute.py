@@ -1,36 +1,38 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
-import os
-from .pdfUpload import process_pdf
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query
+from typing import Optional
+from fastapi.responses import JSONResponse
+from .ingestJobs import job_manager, QueueFullError
+from utils.metrics import span
 from dotenv import load_dotenv
 import logging
-from slowapi import Limiter
-from slowapi.util import get_remote_address
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
-
-limiter = Limiter(key_func=get_remote_address)
 router = APIRouter()
 
 # File validation constants
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_CONTENT_TYPES = ["application/pdf"]
 
-@router.post("/upload-pdf/")
-@limiter.limit("5/minute")
-async def upload_pdf(request: Request, file: UploadFile = File(...), session_id: str = Form(...)):
-    cloudinary_public_id = None
-    
+@router.post("/upload-pdf/", status_code=202)
+async def upload_pdf(
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Query(None),
+    form_session_id: Optional[str] = Form(None, alias="session_id"),
+):
+    """
+    Validate the PDF and queue it for ingestion
+    Returns a job id right away, progress is polled through /upload-status/{job_id}
+    session_id goes in the query string, where the rate limiter reads it; the
+    form field is still accepted from older clients
+    """
     try:
+        if session_id and form_session_id and session_id != form_session_id:
+            raise HTTPException(status_code=400, detail="session_id in the query and the form differ")
+        session_id = session_id or form_session_id
+
         # Validate session_id
         if not session_id or len(session_id) < 5:
             raise HTTPException(status_code=400, detail="Valid session_id is required")
@@ -44,7 +46,8 @@ async def upload_pdf(request: Request, file: UploadFile = File(...), session_id:
             raise HTTPException(status_code=400, detail="File must have .pdf extension")
         
         # Read and validate file size
-        file_content = await file.read()
+        with span("upload", "read"):
+            file_content = await file.read()
         if len(file_content) > MAX_FILE_SIZE:
             raise HTTPException(status_code=400, detail=f"File size exceeds {MAX_FILE_SIZE / (1024*1024)}MB limit")
         
@@ -61,40 +64,35 @@ async def upload_pdf(request: Request, file: UploadFile = File(...), session_id:
         sanitized_filename = '_'.join(filter(None, sanitized_filename.split('_')))
         
         public_id = f"{session_id}_{sanitized_filename}"
-        cloudinary_public_id = f"pdfs/{public_id}"
         
-        upload_result = cloudinary.uploader.upload(
-            file_content,
-            resource_type="raw",
-            folder="pdfs",
-            public_id=public_id,
-            timeout=60
-        )
-        pdf_url = upload_result["secure_url"]
-        logger.info(f"PDF uploaded to Cloudinary: {pdf_url}")
-
-        # Process and embed PDF
-        embedding_result = process_pdf(pdf_url, session_id)
-        logger.info(f"PDF embedded successfully: {embedding_result}")
-
+        try:
+            job = await job_manager.submit(session_id, file.filename, public_id, file_content)
+        except QueueFullError:
+            logger.warning(f"Ingestion queue full, rejecting upload for session: {session_id}")
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Server is busy processing other PDFs. Please try again shortly."},
+                headers={"Retry-After": "10"}
+            )
+        
         return {
-            "message": "PDF uploaded and embedded successfully",
-            "cloudinary_url": pdf_url,
-            "cloudinary_public_id": cloudinary_public_id,
-            "embedding_result": embedding_result,
+            "message": "PDF queued for processing",
+            "job_id": job.job_id,
+            "status": job.status,
+            "status_url": f"/upload-status/{job.job_id}",
             "session_id": session_id
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error uploading or processing PDF: {str(e)}")
-        # Cleanup Cloudinary if upload succeeded but processing failed
-        if cloudinary_public_id:
-            try:
-                cloudinary.uploader.destroy(cloudinary_public_id, resource_type="raw")
-                logger.info(f"Cleaned up Cloudinary file: {cloudinary_public_id}")
-            except Exception as cleanup_error:
-                logger.error(f"Failed to cleanup Cloudinary: {str(cleanup_error)}")
-        
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error queueing PDF: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+
+@router.get("/upload-status/{job_id}")
+async def get_upload_status(job_id: str):
+    """Poll the progress of an ingestion job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job.to_dict()
@@ -1,11 +1,18 @@
-from fastapi import FastAPI, Request
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fileUpload.uploadRoute import router
 from RAGresponse.responseRoute import response_router
 from sessionCleanup.cleanupRoute import cleanup_router
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+from fileUpload.ingestJobs import job_manager
+from sessionCleanup.sweeper import session_sweeper
+from utils.blockingPool import shutdown_executor
+from utils.processPool import shutdown_process_pool
+from utils.warmup import STARTUP_WARMUP, warm_up
+from utils.metrics import MetricsMiddleware, render_metrics
+from utils.rateLimit import RateLimitMiddleware, rate_limiter
 import os
 from dotenv import load_dotenv
 import logging
@@ -19,12 +26,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Rate limiter
-limiter = Limiter(key_func=get_remote_address)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_manager.start()
+    # Expired sessions are removed in the background, not on the request path
+    session_sweeper.start()
+    # Not awaited: the app answers right away while clients are built
+    warmup_task = asyncio.create_task(warm_up()) if STARTUP_WARMUP else None
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await session_sweeper.stop()
+    await job_manager.stop()
+    shutdown_executor(wait=False)
+    shutdown_process_pool(wait=False)
 
-app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
+# Rate limiting for every route (costs per route in utils.rateLimit). Added
+# first so it sits inside CORS and 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 
 # CORS - Use environment variable for allowed origins
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",")
@@ -33,15 +53,27 @@ app.add_middleware(
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["GET", "POST"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["Server-Timing"]
 )
+# Outermost, so request timings include the other middleware
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
-@limiter.limit("10/minute")
-async def indexPage(request: Request):
+async def indexPage():
     logger.info("Index page accessed")
     return {"response": "Hi! there is nothing here"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage timings, request latencies and counters in the Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/rate-limit-stats")
+async def get_rate_limit_stats():
+    """Allowed/rejected counters of the rate limiter"""
+    return rate_limiter.stats()
+
 app.include_router(router)
 app.include_router(response_router)
 app.include_router(cleanup_router)
\ No newline at end of file
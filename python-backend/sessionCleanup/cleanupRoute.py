@@ -1,11 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from fastapi import Query as FastAPIQuery
-import os
 from dotenv import load_dotenv
-from pinecone import Pinecone
-import cloudinary
-import cloudinary.uploader
 import logging
+from utils import clients
+from utils.blockingPool import run_blocking
+from utils.documentRegistry import document_registry, release_session_vectors
+from utils.metrics import span
+from sessionStore.stores import session_store
 
 load_dotenv()
 
@@ -13,19 +14,6 @@ logger = logging.getLogger(__name__)
 
 cleanup_router = APIRouter()
 
-# Initialize Pinecone
-PINECONE_API = os.getenv("PINECONE_API_KEY")
-index_name = os.getenv("PINECONE_INDEX_NAME")
-pc = Pinecone(api_key=PINECONE_API)
-index = pc.Index(index_name)
-
-# Initialize Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
-
 @cleanup_router.post("/cleanup-session")
 async def cleanup_session(session_id: str = FastAPIQuery(...), cloudinary_public_id: str = FastAPIQuery(None)):
     """
@@ -34,23 +22,29 @@ async def cleanup_session(session_id: str = FastAPIQuery(...), cloudinary_public
     try:
         if not session_id or len(session_id) < 5:
             raise HTTPException(status_code=400, detail="Valid session_id is required")
+        # Document ids are content hashes anyone holding the PDF can compute
+        if await document_registry.is_document(session_id):
+            raise HTTPException(status_code=400, detail="Valid session_id is required")
         
         logger.info(f"Cleaning up session: {session_id}")
         
-        # Delete vectors with the session_id metadata from Pinecone
-        index.delete(filter={"session_id": session_id})
-        logger.info(f"Deleted Pinecone vectors for session: {session_id}")
+        # Delete the session's vectors from Pinecone, shared documents are only
+        # deleted once no other session references them
+        with span("cleanup", "vectors"):
+            pinecone_deleted = await release_session_vectors(session_id)
+        logger.info(f"Released Pinecone vectors for session: {session_id}")
         
         # Clear the chat history for this session
-        from RAGresponse.responseRoute import session_storage
-        if session_id in session_storage:
-            del session_storage[session_id]
+        with span("cleanup", "session_store"):
+            deleted = await session_store.delete(session_id)
+        if deleted:
             logger.info(f"Cleared chat history for session: {session_id}")
         
         # Delete from Cloudinary if public_id provided
         if cloudinary_public_id:
             try:
-                cloudinary.uploader.destroy(cloudinary_public_id, resource_type="raw")
+                with span("cleanup", "cloudinary"):
+                    await run_blocking(clients.get_cloudinary_uploader().destroy, cloudinary_public_id, resource_type="raw")
                 logger.info(f"Deleted Cloudinary file: {cloudinary_public_id}")
             except Exception as cloudinary_error:
                 logger.error(f"Failed to delete from Cloudinary: {str(cloudinary_error)}")
@@ -58,7 +52,7 @@ async def cleanup_session(session_id: str = FastAPIQuery(...), cloudinary_public
             
         return {
             "message": f"Session {session_id} cleaned up successfully",
-            "pinecone_deleted": True,
+            "pinecone_deleted": pinecone_deleted,
             "cloudinary_deleted": bool(cloudinary_public_id)
         }
         
@@ -71,13 +65,14 @@ async def cleanup_session(session_id: str = FastAPIQuery(...), cloudinary_public
 @cleanup_router.get("/session-stats")
 async def get_session_stats():
     """
-    Get current Pinecone index statistics
+    Get current Pinecone index and session store statistics
     """
     try:
-        stats = index.describe_index_stats()
+        stats = await run_blocking(clients.get_index().describe_index_stats)
         return {
             "total_vectors": stats.total_vector_count,
-            "index_name": index_name
+            "index_name": clients.get_index_name(),
+            "session_store": session_store.stats()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
\ No newline at end of file
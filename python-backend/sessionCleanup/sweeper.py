@@ -0,0 +1,50 @@
+import asyncio
+import logging
+import os
+
+from sessionStore.stores import session_store
+from utils.documentRegistry import release_session_vectors
+
+logger = logging.getLogger(__name__)
+
+# How often expired sessions are looked for, instead of on every query
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "60"))
+
+async def sweep_expired_sessions():
+    """Delete expired sessions together with their Pinecone vectors"""
+    expired_sessions = await session_store.cleanup_expired()
+    for session_id in expired_sessions:
+        try:
+            await release_session_vectors(session_id)
+        except Exception as e:
+            logger.error(f"Failed to delete vectors of expired session {session_id}: {str(e)}")
+        logger.info(f"Expired session cleaned up: {session_id}")
+    return len(expired_sessions)
+
+async def run_sweeper(interval=SESSION_SWEEP_INTERVAL_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sweep_expired_sessions()
+        except Exception as e:
+            logger.error(f"Session sweep failed: {str(e)}")
+
+class SessionSweeper:
+    """Background task started and stopped by the application lifespan"""
+
+    def __init__(self, interval=SESSION_SWEEP_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(run_sweeper(self.interval), name="session-sweeper")
+            logger.info(f"Session sweeper running every {self.interval:.0f}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+session_sweeper = SessionSweeper()
@@ -0,0 +1,181 @@
+import logging
+import os
+from collections import deque
+
+from utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Stored bytes one session's history may use before the oldest turns are dropped
+CHAT_HISTORY_MAX_BYTES = int(os.getenv("CHAT_HISTORY_MAX_BYTES", str(256 * 1024)))
+# Compression for turns older than the newest CHAT_HISTORY_RAW_TURNS: lz4, zstd or none
+CHAT_HISTORY_COMPRESSION = os.getenv("CHAT_HISTORY_COMPRESSION", "lz4").lower()
+CHAT_HISTORY_RAW_TURNS = int(os.getenv("CHAT_HISTORY_RAW_TURNS", "6"))
+
+# Separates query and response inside a compressed turn
+_SEPARATOR = "\x00"
+
+def _load_codec(name):
+    """Returns (compress, decompress) for name, or None when compression is off or unavailable"""
+    try:
+        if name == "lz4":
+            import lz4.frame
+            return lz4.frame.compress, lz4.frame.decompress
+        if name == "zstd":
+            import zstandard
+            return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    except ImportError:
+        logger.warning(f"{name} is not installed, chat history is kept uncompressed")
+    return None
+
+_codec = _load_codec(CHAT_HISTORY_COMPRESSION)
+
+class Turn:
+    """One user query and the answer it got, optionally compressed"""
+    __slots__ = ("_query", "_response", "_packed", "in_context", "nbytes", "tokens", "seq")
+
+    def __init__(self, query, response, in_context=True, seq=0):
+        self._query = query
+        self._response = response
+        self._packed = None
+        # Canned replies and summarized turns are shown to the user but not sent to the model
+        self.in_context = in_context
+        self.nbytes = len(query.encode("utf-8")) + len(response.encode("utf-8"))
+        self.tokens = count_tokens(query) + count_tokens(response)
+        # Position in the session's history, never reused
+        self.seq = seq
+
+    def unpack(self):
+        """Returns (query, response), decompressing once if needed"""
+        if self._packed is None:
+            return self._query, self._response
+        return tuple(_codec[1](self._packed).decode("utf-8").split(_SEPARATOR, 1))
+
+    @property
+    def query(self):
+        return self.unpack()[0]
+
+    @property
+    def response(self):
+        return self.unpack()[1]
+
+    @property
+    def compressed(self):
+        return self._packed is not None
+
+    def compress(self):
+        if self._packed is not None or _codec is None:
+            return
+        packed = _codec[0](f"{self._query}{_SEPARATOR}{self._response}".encode("utf-8"))
+        # Short turns can grow when compressed
+        if len(packed) < self.nbytes:
+            self._packed = packed
+            self._query = self._response = None
+            self.nbytes = len(packed)
+
+class ChatHistory:
+    """
+    Bounded chat history of one session
+    Turns live in a ring buffer: once the stored bytes exceed max_bytes the
+    oldest turns are dropped, and turns older than the newest raw_turns are
+    compressed. The model context is the running summary plus the turns that
+    are still in_context, so nothing has to be re-parsed from prefixed strings.
+    """
+    __slots__ = ("turns", "summary", "summary_tokens", "max_bytes", "raw_turns", "turn_bytes", "context_turns", "next_seq")
+
+    def __init__(self, max_bytes=CHAT_HISTORY_MAX_BYTES, raw_turns=CHAT_HISTORY_RAW_TURNS):
+        self.turns = deque()
+        self.summary = None
+        self.summary_tokens = 0
+        self.max_bytes = max_bytes
+        self.raw_turns = raw_turns
+        self.turn_bytes = 0
+        # Number of turns with in_context set, i.e. not yet summarized
+        self.context_turns = 0
+        self.next_seq = 0
+
+    def __len__(self):
+        return len(self.turns)
+
+    @property
+    def nbytes(self):
+        return self.turn_bytes + (len(self.summary.encode("utf-8")) if self.summary else 0)
+
+    def append(self, query, response, in_context=True, seq=None):
+        if seq is None:
+            seq = self.next_seq
+        self.next_seq = max(self.next_seq, seq + 1)
+        turn = Turn(query, response, in_context, seq)
+        self.turns.append(turn)
+        self.turn_bytes += turn.nbytes
+        self.context_turns += in_context
+
+        if len(self.turns) > self.raw_turns:
+            old = self.turns[-self.raw_turns - 1]
+            before = old.nbytes
+            old.compress()
+            self.turn_bytes -= before - old.nbytes
+
+        # Always keep the newest turn, even when it alone is over budget
+        while self.turn_bytes > self.max_bytes and len(self.turns) > 1:
+            dropped = self.turns.popleft()
+            self.turn_bytes -= dropped.nbytes
+            self.context_turns -= dropped.in_context
+
+    @property
+    def context_tokens(self):
+        """Tokens of the summary and the turns still sent to the model"""
+        return self.summary_tokens + sum(turn.tokens for turn in self.turns if turn.in_context)
+
+    def context_seqs(self):
+        """seq of every turn still sent to the model, oldest first"""
+        return [turn.seq for turn in self.turns if turn.in_context]
+
+    def set_summary(self, summary, seqs=None):
+        """
+        Replaces the summary and the context turns it was made from (all when None)
+        seqs must still be the oldest context turns, as when the summary was
+        started; otherwise (another summary was stored meanwhile, turns were
+        dropped) nothing changes and False is returned. The summarized turns
+        stay visible in /history.
+        """
+        if seqs is not None and self.context_seqs()[:len(seqs)] != list(seqs):
+            return False
+        self.summary = summary
+        self.summary_tokens = count_tokens(summary)
+        summarized = None if seqs is None else set(seqs)
+        for turn in self.turns:
+            if turn.in_context and (summarized is None or turn.seq in summarized):
+                turn.in_context = False
+                self.context_turns -= 1
+        return True
+
+    def context(self):
+        """Yields (role, content) pairs for the model, oldest first"""
+        if self.summary:
+            yield "system", self.summary
+        for turn in self.turns:
+            if turn.in_context:
+                query, response = turn.unpack()
+                yield "user", query
+                yield "assistant", response
+
+    def to_list(self):
+        """Turns in the shape returned by /history"""
+        return [dict(zip(("user_query", "rag_response"), turn.unpack())) for turn in self.turns]
+
+    def to_dict(self):
+        return {
+            "summary": self.summary,
+            "turns": [[*turn.unpack(), turn.in_context, turn.seq] for turn in self.turns],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        history = cls()
+        for query, response, in_context, seq in data.get("turns", []):
+            history.append(query, response, in_context, seq)
+        if data.get("summary"):
+            history.summary = data["summary"]
+            history.summary_tokens = count_tokens(history.summary)
+        return history
@@ -0,0 +1,32 @@
+from datetime import datetime
+from sessionStore.chatHistory import ChatHistory
+
+# Session storage with metadata
+class SessionData:
+    def __init__(self, session_id, history=None, last_accessed=None, message_count=0):
+        self.session_id = session_id
+        # Shared by /history and the model context, see ChatHistory
+        self.history = history if history is not None else ChatHistory()
+        self.last_accessed = last_accessed or datetime.now()
+        self.message_count = message_count
+
+    @property
+    def nbytes(self):
+        """Bytes of chat text held for this session"""
+        return self.history.nbytes
+
+    def to_dict(self):
+        """Serializable form used by the persistent stores, last_accessed is stored separately"""
+        return {
+            "history": self.history.to_dict(),
+            "message_count": self.message_count,
+        }
+
+    @classmethod
+    def from_dict(cls, session_id, data, last_accessed):
+        return cls(
+            session_id,
+            history=ChatHistory.from_dict(data["history"]),
+            last_accessed=last_accessed,
+            message_count=data.get("message_count", 0),
+        )
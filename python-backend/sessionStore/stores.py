@@ -0,0 +1,744 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from .sessionData import SessionData
+from utils.blockingPool import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# memory | sqlite | redis
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory")
+SESSION_DB_URL = os.getenv("SESSION_DB_URL", "sqlite:///./sessions.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_EXPIRY_HOURS = 24
+# A crashed worker cannot hold a session lock for longer than this
+SESSION_LOCK_TTL_SECONDS = float(os.getenv("SESSION_LOCK_TTL_SECONDS", "120"))
+# How long a request waits for another request of the same session
+SESSION_LOCK_WAIT_SECONDS = float(os.getenv("SESSION_LOCK_WAIT_SECONDS", "30"))
+# Chat history bytes the in-memory backend may hold before evicting idle sessions
+SESSION_MEMORY_LIMIT_BYTES = int(os.getenv("SESSION_MEMORY_LIMIT_BYTES", str(128 * 1024 * 1024)))
+
+class SessionLockTimeout(Exception):
+    """Raised when a session stays locked by another request for too long"""
+
+class SessionStore:
+    """
+    Interface shared by every session backend
+    Handlers load a session once, change it in memory and save it once, so
+    each request costs one read and one write whatever the backend. Requests
+    of the same session are serialized with lock(), which works across
+    workers for the shared backends.
+    """
+
+    def __init__(self, expiry_seconds=SESSION_EXPIRY_HOURS * 3600):
+        self.expiry_seconds = expiry_seconds
+
+    async def load(self, session_id):
+        """Return the SessionData or None if the session does not exist"""
+        raise NotImplementedError
+
+    async def load_many(self, session_ids):
+        """Return {session_id: SessionData} for the sessions that exist"""
+        raise NotImplementedError
+
+    async def save(self, session_data):
+        raise NotImplementedError
+
+    async def save_many(self, sessions):
+        raise NotImplementedError
+
+    async def touch(self, session_id):
+        """Refresh last_accessed without rewriting the rest of the session"""
+        raise NotImplementedError
+
+    async def delete(self, session_id):
+        """Delete a session, returns True if it existed"""
+        raise NotImplementedError
+
+    async def exists(self, session_id):
+        raise NotImplementedError
+
+    async def cleanup_expired(self):
+        """Delete sessions idle for longer than expiry_seconds, returns their ids"""
+        raise NotImplementedError
+
+    # Deduplicated documents shared by sessions, see utils/documentRegistry.
+    # The references are kept next to the sessions so they survive restarts
+    # and are shared by the workers exactly like the sessions are.
+
+    async def document_of(self, session_id):
+        """doc_id of the shared document the session uses, or None"""
+        raise NotImplementedError
+
+    async def attach_document(self, session_id, doc_id):
+        """
+        Points the session at doc_id
+        Returns the document the session used before when no session uses it
+        anymore (its vectors can go), else None.
+        """
+        raise NotImplementedError
+
+    async def detach_document(self, session_id):
+        """Drops the session's reference, returns (doc_id or None, True when no session uses it anymore)"""
+        raise NotImplementedError
+
+    async def document_in_use(self, doc_id):
+        """True while at least one session uses the document"""
+        raise NotImplementedError
+
+    async def document_chunk_count(self, doc_id):
+        """Number of chunks of a fully embedded document, None if it is not ready"""
+        raise NotImplementedError
+
+    async def mark_document_ready(self, doc_id, chunk_count):
+        """Records a fully embedded document, unless every session let go of it meanwhile"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": type(self).__name__}
+
+    async def _try_lock(self, session_id, token):
+        raise NotImplementedError
+
+    async def _unlock(self, session_id, token):
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def lock(self, session_id):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + SESSION_LOCK_WAIT_SECONDS
+        while not await self._try_lock(session_id, token):
+            if time.monotonic() > deadline:
+                raise SessionLockTimeout(f"Session {session_id} is busy")
+            await asyncio.sleep(0.05)
+        try:
+            yield
+        finally:
+            await self._unlock(session_id, token)
+
+class InMemorySessionStore(SessionStore):
+    """
+    Sessions kept in this process, lost on restart and not shared between workers
+    Sessions are kept in access order (every save/touch moves a session to the
+    end), so the oldest sessions are always at the front and expiry only
+    looks at the sessions it actually removes. When the saved chat histories
+    exceed memory_limit bytes, the least recently used idle sessions are evicted.
+    """
+
+    def __init__(self, expiry_seconds=SESSION_EXPIRY_HOURS * 3600, memory_limit=SESSION_MEMORY_LIMIT_BYTES):
+        super().__init__(expiry_seconds)
+        self.memory_limit = memory_limit
+        self._sessions = OrderedDict()
+        # session_id -> history bytes when last saved
+        self._sizes = {}
+        self._nbytes = 0
+        self._evicted = 0
+        # Evicted sessions whose vectors the sweeper has not released yet
+        self._evicted_ids = []
+        # session_id -> [asyncio.Lock, number of requests using it]
+        self._locks = {}
+        # session_id -> doc_id, doc_id -> session ids, doc_id -> chunk count
+        self._session_docs = {}
+        self._doc_sessions = {}
+        self._doc_chunks = {}
+
+    async def load(self, session_id):
+        return self._sessions.get(session_id)
+
+    async def load_many(self, session_ids):
+        return {sid: self._sessions[sid] for sid in session_ids if sid in self._sessions}
+
+    def _put(self, session_data):
+        session_id = session_data.session_id
+        self._sessions.pop(session_id, None)
+        oldest = next(iter(self._sessions.values()), None)
+        self._sessions[session_id] = session_data
+        # Writes normally carry the current time; one older than everything
+        # else (e.g. a restored session) goes to the front so expiry sees it
+        if oldest is not None and session_data.last_accessed < oldest.last_accessed:
+            self._sessions.move_to_end(session_id, last=False)
+
+        size = session_data.nbytes
+        self._nbytes += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+
+    def _forget(self, session_id):
+        if self._sessions.pop(session_id, None) is None:
+            return False
+        self._nbytes -= self._sizes.pop(session_id, 0)
+        return True
+
+    def _evict_idle(self):
+        """
+        Drops least recently used sessions that no request is using until under memory_limit
+        The evicted ids are handed out by the next cleanup_expired, so the
+        sweeper releases their vectors like those of expired sessions.
+        """
+        if self._nbytes <= self.memory_limit:
+            return
+        evicted = []
+        excess = self._nbytes - self.memory_limit
+        for session_id in self._sessions:
+            if excess <= 0:
+                break
+            if session_id in self._locks:
+                continue
+            evicted.append(session_id)
+            excess -= self._sizes.get(session_id, 0)
+        for session_id in evicted:
+            self._forget(session_id)
+            self._evicted += 1
+            logger.warning(f"Session memory limit reached, evicted idle session: {session_id}")
+        self._evicted_ids.extend(evicted)
+
+    async def save(self, session_data):
+        self._put(session_data)
+        self._evict_idle()
+
+    async def save_many(self, sessions):
+        for session_data in sessions:
+            self._put(session_data)
+        self._evict_idle()
+
+    async def touch(self, session_id):
+        session_data = self._sessions.get(session_id)
+        if session_data is not None:
+            session_data.last_accessed = datetime.now()
+            self._sessions.move_to_end(session_id)
+
+    async def delete(self, session_id):
+        return self._forget(session_id)
+
+    async def exists(self, session_id):
+        return session_id in self._sessions
+
+    def _release_document(self, session_id, doc_id):
+        sessions = self._doc_sessions.get(doc_id, set())
+        sessions.discard(session_id)
+        if sessions:
+            return False
+        self._doc_sessions.pop(doc_id, None)
+        self._doc_chunks.pop(doc_id, None)
+        return True
+
+    async def document_of(self, session_id):
+        return self._session_docs.get(session_id)
+
+    async def attach_document(self, session_id, doc_id):
+        previous = self._session_docs.get(session_id)
+        if previous == doc_id:
+            return None
+        self._session_docs[session_id] = doc_id
+        self._doc_sessions.setdefault(doc_id, set()).add(session_id)
+        if previous is not None and self._release_document(session_id, previous):
+            return previous
+        return None
+
+    async def detach_document(self, session_id):
+        doc_id = self._session_docs.pop(session_id, None)
+        if doc_id is None:
+            return None, False
+        return doc_id, self._release_document(session_id, doc_id)
+
+    async def document_in_use(self, doc_id):
+        return bool(self._doc_sessions.get(doc_id))
+
+    async def document_chunk_count(self, doc_id):
+        return self._doc_chunks.get(doc_id)
+
+    async def mark_document_ready(self, doc_id, chunk_count):
+        if self._doc_sessions.get(doc_id):
+            self._doc_chunks[doc_id] = chunk_count
+
+    def stats(self):
+        return {
+            **super().stats(),
+            "sessions": len(self._sessions),
+            "history_bytes": self._nbytes,
+            "memory_limit_bytes": self.memory_limit,
+            "evicted_sessions": self._evicted,
+        }
+
+    async def cleanup_expired(self):
+        """Remove sessions that haven't been accessed in SESSION_EXPIRY_HOURS, evicted sessions are returned too"""
+        cutoff = datetime.now() - timedelta(seconds=self.expiry_seconds)
+        # Unless the session was started again since
+        expired_sessions = [sid for sid in self._evicted_ids if sid not in self._sessions]
+        self._evicted_ids = []
+        while self._sessions:
+            session_id, data = next(iter(self._sessions.items()))
+            if data.last_accessed >= cutoff:
+                break
+            self._forget(session_id)
+            expired_sessions.append(session_id)
+        return expired_sessions
+
+    @asynccontextmanager
+    async def lock(self, session_id):
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            try:
+                await asyncio.wait_for(entry[0].acquire(), SESSION_LOCK_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                raise SessionLockTimeout(f"Session {session_id} is busy")
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite database through SQLAlchemy
+    Survives restarts when the file is on a volume and can be shared by the
+    workers of one machine. Queries run in the blocking pool.
+    """
+
+    def __init__(self, url=SESSION_DB_URL, expiry_seconds=SESSION_EXPIRY_HOURS * 3600):
+        super().__init__(expiry_seconds)
+        from sqlalchemy import create_engine, event, text
+
+        self._text = text
+        self._engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+
+        @event.listens_for(self._engine, "connect")
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        with self._engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, last_accessed REAL NOT NULL)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_chat_sessions_last_accessed ON chat_sessions (last_accessed)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS chat_session_locks ("
+                "session_id TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS session_documents ("
+                "session_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_session_documents_doc_id ON session_documents (doc_id)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS ready_documents ("
+                "doc_id TEXT PRIMARY KEY, chunk_count INTEGER NOT NULL)"
+            ))
+
+    def _row_to_session(self, row):
+        return SessionData.from_dict(row.session_id, json.loads(row.data), datetime.fromtimestamp(row.last_accessed))
+
+    def _load_many(self, session_ids):
+        from sqlalchemy import bindparam
+
+        if not session_ids:
+            return {}
+        query = self._text(
+            "SELECT session_id, data, last_accessed FROM chat_sessions WHERE session_id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        with self._engine.connect() as conn:
+            rows = conn.execute(query, {"ids": list(session_ids)}).fetchall()
+        return {row.session_id: self._row_to_session(row) for row in rows}
+
+    def _save_many(self, sessions):
+        params = [
+            {
+                "session_id": session_data.session_id,
+                "data": json.dumps(session_data.to_dict()),
+                "last_accessed": session_data.last_accessed.timestamp(),
+            }
+            for session_data in sessions
+        ]
+        if not params:
+            return
+        with self._engine.begin() as conn:
+            conn.execute(self._text(
+                "INSERT INTO chat_sessions (session_id, data, last_accessed) "
+                "VALUES (:session_id, :data, :last_accessed) "
+                "ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, last_accessed = excluded.last_accessed"
+            ), params)
+
+    def _touch(self, session_id):
+        with self._engine.begin() as conn:
+            conn.execute(
+                self._text("UPDATE chat_sessions SET last_accessed = :now WHERE session_id = :session_id"),
+                {"now": time.time(), "session_id": session_id},
+            )
+
+    def _delete(self, session_id):
+        with self._engine.begin() as conn:
+            result = conn.execute(
+                self._text("DELETE FROM chat_sessions WHERE session_id = :session_id"),
+                {"session_id": session_id},
+            )
+        return result.rowcount > 0
+
+    def _cleanup_expired(self):
+        cutoff = {"cutoff": time.time() - self.expiry_seconds}
+        with self._engine.begin() as conn:
+            expired = [
+                row.session_id for row in conn.execute(
+                    self._text("SELECT session_id FROM chat_sessions WHERE last_accessed < :cutoff"), cutoff
+                )
+            ]
+            conn.execute(self._text("DELETE FROM chat_sessions WHERE last_accessed < :cutoff"), cutoff)
+        return expired
+
+    def _try_lock_sync(self, session_id, token):
+        now = time.time()
+        with self._engine.begin() as conn:
+            conn.execute(
+                self._text("DELETE FROM chat_session_locks WHERE session_id = :session_id AND expires_at < :now"),
+                {"session_id": session_id, "now": now},
+            )
+            result = conn.execute(
+                self._text(
+                    "INSERT OR IGNORE INTO chat_session_locks (session_id, token, expires_at) "
+                    "VALUES (:session_id, :token, :expires_at)"
+                ),
+                {"session_id": session_id, "token": token, "expires_at": now + SESSION_LOCK_TTL_SECONDS},
+            )
+        return result.rowcount == 1
+
+    def _unlock_sync(self, session_id, token):
+        with self._engine.begin() as conn:
+            conn.execute(
+                self._text("DELETE FROM chat_session_locks WHERE session_id = :session_id AND token = :token"),
+                {"session_id": session_id, "token": token},
+            )
+
+    def _release_document(self, conn, doc_id):
+        """Forgets a document no session uses anymore, returns True if it was"""
+        used = conn.execute(
+            self._text("SELECT 1 FROM session_documents WHERE doc_id = :doc_id LIMIT 1"), {"doc_id": doc_id}
+        ).first()
+        if used is not None:
+            return False
+        conn.execute(self._text("DELETE FROM ready_documents WHERE doc_id = :doc_id"), {"doc_id": doc_id})
+        return True
+
+    def _pop_session_document(self, conn, session_id):
+        # A write first takes the database write lock, so the reference checks after it are current
+        return conn.execute(
+            self._text("DELETE FROM session_documents WHERE session_id = :session_id RETURNING doc_id"),
+            {"session_id": session_id},
+        ).scalar()
+
+    def _document_of(self, session_id):
+        with self._engine.connect() as conn:
+            return conn.execute(
+                self._text("SELECT doc_id FROM session_documents WHERE session_id = :session_id"),
+                {"session_id": session_id},
+            ).scalar()
+
+    def _attach_document(self, session_id, doc_id):
+        with self._engine.begin() as conn:
+            previous = self._pop_session_document(conn, session_id)
+            conn.execute(
+                self._text("INSERT INTO session_documents (session_id, doc_id) VALUES (:session_id, :doc_id)"),
+                {"session_id": session_id, "doc_id": doc_id},
+            )
+            if previous is None or previous == doc_id:
+                return None
+            return previous if self._release_document(conn, previous) else None
+
+    def _detach_document(self, session_id):
+        with self._engine.begin() as conn:
+            doc_id = self._pop_session_document(conn, session_id)
+            if doc_id is None:
+                return None, False
+            return doc_id, self._release_document(conn, doc_id)
+
+    def _document_in_use(self, doc_id):
+        with self._engine.connect() as conn:
+            return conn.execute(
+                self._text("SELECT 1 FROM session_documents WHERE doc_id = :doc_id LIMIT 1"), {"doc_id": doc_id}
+            ).first() is not None
+
+    def _document_chunk_count(self, doc_id):
+        with self._engine.connect() as conn:
+            return conn.execute(
+                self._text("SELECT chunk_count FROM ready_documents WHERE doc_id = :doc_id"), {"doc_id": doc_id}
+            ).scalar()
+
+    def _mark_document_ready(self, doc_id, chunk_count):
+        with self._engine.begin() as conn:
+            conn.execute(self._text(
+                "INSERT INTO ready_documents (doc_id, chunk_count) "
+                "SELECT :doc_id, :chunk_count WHERE EXISTS (SELECT 1 FROM session_documents WHERE doc_id = :doc_id) "
+                "ON CONFLICT (doc_id) DO UPDATE SET chunk_count = excluded.chunk_count"
+            ), {"doc_id": doc_id, "chunk_count": chunk_count})
+
+    async def load(self, session_id):
+        return (await self.load_many([session_id])).get(session_id)
+
+    async def load_many(self, session_ids):
+        return await run_blocking(self._load_many, list(session_ids))
+
+    async def save(self, session_data):
+        await run_blocking(self._save_many, [session_data])
+
+    async def save_many(self, sessions):
+        await run_blocking(self._save_many, list(sessions))
+
+    async def touch(self, session_id):
+        await run_blocking(self._touch, session_id)
+
+    async def delete(self, session_id):
+        return await run_blocking(self._delete, session_id)
+
+    async def exists(self, session_id):
+        return session_id in await self.load_many([session_id])
+
+    async def cleanup_expired(self):
+        return await run_blocking(self._cleanup_expired)
+
+    async def document_of(self, session_id):
+        return await run_blocking(self._document_of, session_id)
+
+    async def attach_document(self, session_id, doc_id):
+        return await run_blocking(self._attach_document, session_id, doc_id)
+
+    async def detach_document(self, session_id):
+        return await run_blocking(self._detach_document, session_id)
+
+    async def document_in_use(self, doc_id):
+        return await run_blocking(self._document_in_use, doc_id)
+
+    async def document_chunk_count(self, doc_id):
+        return await run_blocking(self._document_chunk_count, doc_id)
+
+    async def mark_document_ready(self, doc_id, chunk_count):
+        await run_blocking(self._mark_document_ready, doc_id, chunk_count)
+
+    async def _try_lock(self, session_id, token):
+        return await run_blocking(self._try_lock_sync, session_id, token)
+
+    async def _unlock(self, session_id, token):
+        await run_blocking(self._unlock_sync, session_id, token)
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+# Deletes the session lock only while it still holds our token: a lock that
+# expired and was taken by another request must be left alone
+_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Document references change together with the per-document session sets in
+# one atomic step. ARGV[3]/ARGV[2] are key prefixes the per-document keys are
+# built from, which is fine on a single Redis (not on Redis Cluster).
+_ATTACH_DOCUMENT_SCRIPT = """
+local previous = redis.call('GET', KEYS[1])
+if previous == ARGV[2] then
+    return false
+end
+redis.call('SET', KEYS[1], ARGV[2])
+redis.call('SADD', ARGV[3] .. ARGV[2], ARGV[1])
+if not previous then
+    return false
+end
+redis.call('SREM', ARGV[3] .. previous, ARGV[1])
+if redis.call('SCARD', ARGV[3] .. previous) > 0 then
+    return false
+end
+redis.call('DEL', ARGV[4] .. previous)
+return previous
+"""
+
+_DETACH_DOCUMENT_SCRIPT = """
+local doc_id = redis.call('GET', KEYS[1])
+if not doc_id then
+    return {}
+end
+redis.call('DEL', KEYS[1])
+redis.call('SREM', ARGV[2] .. doc_id, ARGV[1])
+if redis.call('SCARD', ARGV[2] .. doc_id) > 0 then
+    return {doc_id, 0}
+end
+redis.call('DEL', ARGV[3] .. doc_id)
+return {doc_id, 1}
+"""
+
+_MARK_DOCUMENT_READY_SCRIPT = """
+if redis.call('SCARD', KEYS[1]) > 0 then
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+return false
+"""
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions in Redis (or anything speaking its protocol), shared by every worker and machine
+    Each session is a JSON string with a TTL, last_accessed lives in a sorted
+    set so touching a session never rewrites its history.
+    client: Optional redis.asyncio-compatible client, built from REDIS_URL otherwise
+    """
+
+    def __init__(self, client=None, url=REDIS_URL, prefix="edulume:", expiry_seconds=SESSION_EXPIRY_HOURS * 3600):
+        super().__init__(expiry_seconds)
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError:
+                raise RuntimeError("SESSION_STORE_BACKEND=redis requires the redis package (pip install redis)")
+            client = redis_asyncio.Redis.from_url(url)
+        self._redis = client
+        self._prefix = prefix
+        self._accessed_key = f"{prefix}sessions:last_accessed"
+        self._doc_sessions_prefix = f"{prefix}doc-sessions:"
+        self._doc_chunks_prefix = f"{prefix}doc-chunks:"
+        self._attach_document_script = client.register_script(_ATTACH_DOCUMENT_SCRIPT)
+        self._detach_document_script = client.register_script(_DETACH_DOCUMENT_SCRIPT)
+        self._mark_document_ready_script = client.register_script(_MARK_DOCUMENT_READY_SCRIPT)
+        self._unlock_script = client.register_script(_UNLOCK_SCRIPT)
+
+    def _key(self, session_id):
+        return f"{self._prefix}session:{session_id}"
+
+    def _lock_key(self, session_id):
+        return f"{self._prefix}session-lock:{session_id}"
+
+    def _document_key(self, session_id):
+        return f"{self._prefix}session-doc:{session_id}"
+
+    async def load(self, session_id):
+        return (await self.load_many([session_id])).get(session_id)
+
+    async def load_many(self, session_ids):
+        session_ids = list(session_ids)
+        if not session_ids:
+            return {}
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.mget([self._key(sid) for sid in session_ids])
+            for sid in session_ids:
+                pipe.zscore(self._accessed_key, sid)
+            results = await pipe.execute()
+        payloads, scores = results[0], results[1:]
+        sessions = {}
+        for sid, payload, score in zip(session_ids, payloads, scores):
+            if payload is None:
+                continue
+            last_accessed = datetime.fromtimestamp(score) if score is not None else datetime.now()
+            sessions[sid] = SessionData.from_dict(sid, json.loads(payload), last_accessed)
+        return sessions
+
+    async def save(self, session_data):
+        await self.save_many([session_data])
+
+    async def save_many(self, sessions):
+        sessions = list(sessions)
+        if not sessions:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for session_data in sessions:
+                pipe.set(
+                    self._key(session_data.session_id),
+                    json.dumps(session_data.to_dict()),
+                    ex=self.expiry_seconds,
+                )
+            pipe.zadd(self._accessed_key, {
+                session_data.session_id: session_data.last_accessed.timestamp()
+                for session_data in sessions
+            })
+            await pipe.execute()
+
+    async def touch(self, session_id):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(self._accessed_key, {session_id: time.time()}, xx=True)
+            pipe.expire(self._key(session_id), self.expiry_seconds)
+            await pipe.execute()
+
+    async def delete(self, session_id):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.delete(self._key(session_id))
+            pipe.zrem(self._accessed_key, session_id)
+            deleted, _ = await pipe.execute()
+        return deleted > 0
+
+    async def exists(self, session_id):
+        return await self._redis.exists(self._key(session_id)) > 0
+
+    async def cleanup_expired(self):
+        cutoff = time.time() - self.expiry_seconds
+        expired = [_decode(sid) for sid in await self._redis.zrangebyscore(self._accessed_key, "-inf", cutoff)]
+        if expired:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*[self._key(sid) for sid in expired])
+                pipe.zrem(self._accessed_key, *expired)
+                await pipe.execute()
+        return expired
+
+    async def document_of(self, session_id):
+        return _decode(await self._redis.get(self._document_key(session_id)))
+
+    async def attach_document(self, session_id, doc_id):
+        return _decode(await self._attach_document_script(
+            keys=[self._document_key(session_id)],
+            args=[session_id, doc_id, self._doc_sessions_prefix, self._doc_chunks_prefix],
+        ))
+
+    async def detach_document(self, session_id):
+        result = await self._detach_document_script(
+            keys=[self._document_key(session_id)],
+            args=[session_id, self._doc_sessions_prefix, self._doc_chunks_prefix],
+        )
+        if not result:
+            return None, False
+        return _decode(result[0]), bool(int(result[1]))
+
+    async def document_in_use(self, doc_id):
+        return await self._redis.scard(self._doc_sessions_prefix + doc_id) > 0
+
+    async def document_chunk_count(self, doc_id):
+        value = await self._redis.get(self._doc_chunks_prefix + doc_id)
+        return int(value) if value is not None else None
+
+    async def mark_document_ready(self, doc_id, chunk_count):
+        await self._mark_document_ready_script(
+            keys=[self._doc_sessions_prefix + doc_id, self._doc_chunks_prefix + doc_id], args=[chunk_count]
+        )
+
+    async def _try_lock(self, session_id, token):
+        return bool(await self._redis.set(
+            self._lock_key(session_id), token, nx=True, px=int(SESSION_LOCK_TTL_SECONDS * 1000)
+        ))
+
+    async def _unlock(self, session_id, token):
+        await self._unlock_script(keys=[self._lock_key(session_id)], args=[token])
+
+def create_session_store(backend=SESSION_STORE_BACKEND):
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    raise ValueError(f"Unknown SESSION_STORE_BACKEND: {backend}")
+
+session_store = create_session_store()
+logger.info(f"Using {SESSION_STORE_BACKEND} session store")
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Run from anywhere: modules import each other from the python-backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for key in ("PINECONE_API_KEY", "PINECONE_INDEX_NAME", "OPENAI_API_KEY", "GROQ_API_KEY"):
+    os.environ.setdefault(key, "test")
+os.environ["STARTUP_WARMUP"] = "false"
+os.environ["SESSION_STORE_BACKEND"] = "memory"
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from benchmarks import fakes
+from RAGresponse import RAG_app
+from RAGresponse.answerCache import AnswerCache
+from sessionStore.chatHistory import ChatHistory
+from sessionStore.stores import InMemorySessionStore
+from utils import clients
+from utils.documentRegistry import document_registry
+
+QUESTION = "What is gradient descent?"
+
+@pytest.fixture
+def cache(monkeypatch):
+    clients.reset_clients()
+    clients.override_client("embeddings", fakes.FakeEmbeddings(latency=0))
+    monkeypatch.setattr(document_registry, "_store", InMemorySessionStore())
+    cache = AnswerCache(enabled=True)
+    monkeypatch.setattr(RAG_app, "answer_cache", cache)
+    asyncio.run(document_registry.attach("session-a", "doc1"))
+    yield cache
+    clients.reset_clients()
+
+def ask_and_store(answer, documents):
+    key, cached = asyncio.run(RAG_app.lookup_cached_answer(QUESTION, ChatHistory(), "session-a"))
+    if cached is None:
+        RAG_app.store_cached_answer(key, answer, documents)
+    return cached
+
+def test_answers_are_not_cached_while_the_document_is_embedding(cache):
+    ask_and_store("half an answer", ["chunk"])
+    assert cache.stats()["size"] == 0
+
+    asyncio.run(document_registry.mark_ready("doc1", 10))
+    ask_and_store("the answer", ["chunk"])
+    assert ask_and_store("another answer", ["chunk"]) == "the answer"
+
+def test_answers_without_context_are_not_cached(cache):
+    asyncio.run(document_registry.mark_ready("doc1", 10))
+    ask_and_store("an answer from nothing", [])
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,39 @@
+from sessionStore.chatHistory import ChatHistory
+
+def history_with(turns):
+    history = ChatHistory()
+    for i in range(turns):
+        history.append(f"question {i}", f"answer {i}")
+    return history
+
+def test_summary_only_marks_the_turns_it_was_made_from():
+    history = history_with(4)
+    seqs = history.context_seqs()[:2]
+    # Answered while the summary was being written
+    history.append("question 4", "answer 4")
+
+    assert history.set_summary("summary", seqs)
+    assert history.context_seqs() == [2, 3, 4]
+    assert history.context_turns == 3
+    assert len(history) == 5
+
+def test_stale_summary_is_dropped():
+    history = history_with(4)
+    first = history.context_seqs()[:2]
+    second = history.context_seqs()[:3]
+
+    assert history.set_summary("first", first)
+    assert not history.set_summary("second", second)
+    assert history.summary == "first"
+    assert history.context_seqs() == [2, 3]
+
+def test_seqs_survive_a_round_trip():
+    history = history_with(3)
+    history.set_summary("summary", [0])
+
+    restored = ChatHistory.from_dict(history.to_dict())
+    assert restored.context_seqs() == [1, 2]
+    restored.append("question 3", "answer 3")
+    assert restored.context_seqs() == [1, 2, 3]
+    assert restored.set_summary("newer", [1, 2])
+    assert restored.context_seqs() == [3]
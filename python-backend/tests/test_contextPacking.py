@@ -0,0 +1,22 @@
+from langchain_core.documents import Document
+
+from RAGresponse.contextPacking import merge_chunks, pack_context
+
+TEXT = "Gradient descent follows the negative gradient. " * 4
+
+def chunk(start, end, page, doc_id="doc1"):
+    return Document(page_content=TEXT[start:end], metadata={"doc_id": doc_id, "page": page, "start_index": start})
+
+def test_chunks_merge_across_a_page_break():
+    documents = [chunk(60, 140, 1), chunk(0, 80, 0)]
+
+    blocks = merge_chunks(documents)
+    assert len(blocks) == 1
+    assert blocks[0].text == TEXT[0:140]
+    assert blocks[0].rank == 0
+    assert pack_context(documents).startswith("[Pages 1-2]\n")
+
+def test_chunks_of_other_documents_are_not_merged():
+    documents = [chunk(0, 80, 0), chunk(60, 140, 0, doc_id="doc2")]
+
+    assert len(merge_chunks(documents)) == 2
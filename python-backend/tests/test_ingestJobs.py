@@ -0,0 +1,41 @@
+import asyncio
+
+from benchmarks import fakes
+from fileUpload import ingestJobs
+from fileUpload.ingestJobs import IngestJobManager
+from sessionCleanup import sweeper
+from sessionStore.stores import InMemorySessionStore
+from utils import clients
+from utils.documentRegistry import document_registry
+
+def test_upload_only_session_expires_with_its_vectors(monkeypatch):
+    index = fakes.InMemoryIndex()
+    clients.reset_clients()
+    clients.override_client("index", index)
+    clients.override_client("embeddings", fakes.FakeEmbeddings(latency=0))
+    clients.override_client("cloudinary", fakes.FakeCloudinaryUploader(latency=0))
+    store = InMemorySessionStore()
+    monkeypatch.setattr(ingestJobs, "session_store", store)
+    monkeypatch.setattr(sweeper, "session_store", store)
+    monkeypatch.setattr(document_registry, "_store", store)
+
+    async def run():
+        manager = IngestJobManager(workers=1)
+        await manager.start()
+        try:
+            job = await manager.submit("session-a", "a.pdf", "a", fakes.make_pdf(pages=2, lines_per_page=30))
+            assert await store.exists("session-a")
+            while job.status not in ("completed", "failed"):
+                await asyncio.sleep(0.01)
+            assert job.status == "completed"
+            assert any(index.namespaces.values())
+
+            # Never queried, idle past the expiry
+            store.expiry_seconds = 0
+            assert await sweeper.sweep_expired_sessions() == 1
+        finally:
+            await manager.stop()
+
+    asyncio.run(run())
+    clients.reset_clients()
+    assert not any(index.namespaces.values())
@@ -0,0 +1,146 @@
+"""
+Behaviour every SessionStore backend must share: session locks, document
+references and expiry. The Redis backend runs against the stand-in from
+benchmarks/fakes.py and, when fakeredis is installed, against fakeredis so
+the Lua scripts themselves are exercised.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks import fakes
+from sessionStore import stores
+from sessionStore.sessionData import SessionData
+from sessionStore.stores import InMemorySessionStore, RedisSessionStore, SessionLockTimeout, SQLiteSessionStore
+
+def _fakeredis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+
+@pytest.fixture(params=["memory", "sqlite", "redis", "fakeredis"])
+def make_store(request, tmp_path):
+    """Builds a fresh store of the backend, call it inside the test's event loop"""
+    if request.param == "memory":
+        return lambda **kwargs: InMemorySessionStore(**kwargs)
+    if request.param == "sqlite":
+        pytest.importorskip("sqlalchemy")
+        return lambda **kwargs: SQLiteSessionStore(url=f"sqlite:///{tmp_path / 'sessions.db'}", **kwargs)
+    if request.param == "redis":
+        return lambda **kwargs: RedisSessionStore(client=fakes.FakeRedis(), **kwargs)
+    client = _fakeredis_client()
+    return lambda **kwargs: RedisSessionStore(client=client, **kwargs)
+
+def test_lock_serializes_requests_of_a_session(make_store):
+    events = []
+
+    async def request(store, name):
+        async with store.lock("session-a"):
+            events.append(f"{name} start")
+            await asyncio.sleep(0.02)
+            events.append(f"{name} end")
+
+    async def scenario():
+        store = make_store()
+        await asyncio.gather(request(store, "first"), request(store, "second"), request(store, "third"))
+
+    asyncio.run(scenario())
+    assert all(events[i].split()[0] == events[i + 1].split()[0] for i in range(0, len(events), 2))
+
+def test_lock_times_out_while_another_request_holds_it(make_store, monkeypatch):
+    monkeypatch.setattr(stores, "SESSION_LOCK_WAIT_SECONDS", 0.1)
+
+    async def scenario():
+        store = make_store()
+        async with store.lock("session-a"):
+            with pytest.raises(SessionLockTimeout):
+                async with store.lock("session-a"):
+                    pass
+            # Other sessions are not held up
+            async with store.lock("session-b"):
+                pass
+        async with store.lock("session-a"):
+            pass
+
+    asyncio.run(scenario())
+
+def test_expired_lock_holder_does_not_unlock_the_next_holder(make_store, monkeypatch):
+    monkeypatch.setattr(stores, "SESSION_LOCK_TTL_SECONDS", 0.05)
+
+    async def scenario():
+        store = make_store()
+        if isinstance(store, InMemorySessionStore):
+            pytest.skip("in-process locks don't expire")
+        assert await store._try_lock("session-a", "slow")
+        await asyncio.sleep(0.1)
+        monkeypatch.setattr(stores, "SESSION_LOCK_TTL_SECONDS", 60)
+        assert await store._try_lock("session-a", "next")
+
+        await store._unlock("session-a", "slow")
+        assert not await store._try_lock("session-a", "other")
+        await store._unlock("session-a", "next")
+        assert await store._try_lock("session-a", "other")
+
+    asyncio.run(scenario())
+
+def test_document_references_are_counted(make_store):
+    async def scenario():
+        store = make_store()
+        assert await store.attach_document("session-a", "doc1") is None
+        assert await store.attach_document("session-b", "doc1") is None
+        # Attaching the same document again changes nothing
+        assert await store.attach_document("session-a", "doc1") is None
+        await store.mark_document_ready("doc1", 7)
+        assert await store.document_chunk_count("doc1") == 7
+
+        # doc1 is still used by session-b
+        assert await store.attach_document("session-a", "doc2") is None
+        assert await store.document_of("session-a") == "doc2"
+        assert await store.document_in_use("doc1")
+        assert await store.document_chunk_count("doc1") == 7
+
+        assert await store.detach_document("session-b") == ("doc1", True)
+        assert not await store.document_in_use("doc1")
+        assert await store.document_chunk_count("doc1") is None
+        assert await store.detach_document("session-b") == (None, False)
+
+        # The last session moving on hands back the orphaned document
+        assert await store.attach_document("session-a", "doc3") == "doc2"
+        assert await store.document_of("session-b") is None
+
+    asyncio.run(scenario())
+
+def test_released_document_is_not_marked_ready(make_store):
+    async def scenario():
+        store = make_store()
+        await store.attach_document("session-a", "doc1")
+        await store.detach_document("session-a")
+        await store.mark_document_ready("doc1", 7)
+        assert await store.document_chunk_count("doc1") is None
+
+    asyncio.run(scenario())
+
+def test_cleanup_expired_removes_idle_sessions(make_store):
+    async def scenario():
+        store = make_store(expiry_seconds=60)
+        idle = SessionData("idle", last_accessed=datetime.now() - timedelta(minutes=5))
+        await store.save_many([idle, SessionData("active")])
+
+        assert await store.cleanup_expired() == ["idle"]
+        assert not await store.exists("idle")
+        assert await store.exists("active")
+        assert await store.cleanup_expired() == []
+
+    asyncio.run(scenario())
+
+def test_touch_keeps_a_session_from_expiring(make_store):
+    async def scenario():
+        store = make_store(expiry_seconds=60)
+        await store.save(SessionData("session-a", last_accessed=datetime.now() - timedelta(minutes=5)))
+        await store.touch("session-a")
+
+        assert await store.cleanup_expired() == []
+        assert await store.exists("session-a")
+
+    asyncio.run(scenario())
@@ -0,0 +1,201 @@
+"""
+Namespace and metadata-filter scoping of vectors, run against the in-memory
+Pinecone stand-in from benchmarks/fakes.py
+
+Run from the python-backend directory (needs pytest):
+    python -m pytest tests
+"""
+import asyncio
+
+import pytest
+
+from benchmarks import fakes
+from fileUpload import pdfUpload
+from RAGresponse import RAG_app
+from RAGresponse.retrievalCache import RetrievalCache
+from sessionCleanup import sweeper
+from sessionStore.sessionData import SessionData
+from sessionStore.stores import InMemorySessionStore
+from utils import clients, documentRegistry
+from utils.documentRegistry import document_key, document_registry, namespace_for, release_session_vectors
+from utils.migrateNamespaces import migrate_namespaces
+
+PDF_A = fakes.make_pdf(pages=2, lines_per_page=30, seed=1)
+PDF_B = fakes.make_pdf(pages=2, lines_per_page=30, seed=2)
+
+@pytest.fixture
+def index(monkeypatch):
+    index = fakes.InMemoryIndex()
+    clients.reset_clients()
+    clients.override_client("index", index)
+    clients.override_client("embeddings", fakes.FakeEmbeddings(latency=0))
+    monkeypatch.setattr(document_registry, "_store", InMemorySessionStore())
+    monkeypatch.setattr(RAG_app, "retrieval_cache", RetrievalCache())
+    yield index
+    clients.reset_clients()
+
+@pytest.fixture(params=[False, True], ids=["filter", "namespaces"])
+def namespaces(request, monkeypatch):
+    monkeypatch.setattr(documentRegistry, "PINECONE_NAMESPACES", request.param)
+    monkeypatch.setattr(pdfUpload, "PINECONE_NAMESPACES", request.param)
+    return request.param
+
+def ids_in(index, namespace=""):
+    return set(index.namespaces.get(namespace, {}))
+
+def upload(pdf, session_id):
+    return asyncio.run(pdfUpload.process_pdf(pdf, session_id, source_name=f"{session_id}.pdf"))
+
+def test_upsert_writes_document_namespace(index, monkeypatch):
+    monkeypatch.setattr(documentRegistry, "PINECONE_NAMESPACES", True)
+    monkeypatch.setattr(pdfUpload, "PINECONE_NAMESPACES", True)
+    upload(PDF_A, "session-a")
+
+    doc_id = document_key(PDF_A)
+    assert set(index.namespaces) == {namespace_for(doc_id=doc_id)}
+    vectors = index.namespaces[namespace_for(doc_id=doc_id)]
+    assert vectors and all(vector_id.startswith(f"doc:{doc_id}-") for vector_id in vectors)
+    assert all(metadata["doc_id"] == doc_id for _, metadata in vectors.values())
+
+def test_upsert_writes_private_session_namespace(index, monkeypatch):
+    monkeypatch.setattr(documentRegistry, "PINECONE_NAMESPACES", True)
+    monkeypatch.setattr(pdfUpload, "PINECONE_NAMESPACES", True)
+    monkeypatch.setattr(pdfUpload, "PDF_DEDUP_ENABLED", False)
+    upload(PDF_A, "session-a")
+
+    assert set(index.namespaces) == {"session-session-a"}
+    assert all(metadata["session_id"] == "session-a" for _, metadata in index.namespaces["session-session-a"].values())
+
+def test_upsert_without_namespaces_uses_default_namespace(index, monkeypatch):
+    monkeypatch.setattr(documentRegistry, "PINECONE_NAMESPACES", False)
+    monkeypatch.setattr(pdfUpload, "PINECONE_NAMESPACES", False)
+    upload(PDF_A, "session-a")
+
+    assert set(index.namespaces) == {""}
+
+def test_query_only_returns_the_sessions_document(index, namespaces):
+    upload(PDF_A, "session-a")
+    upload(PDF_B, "session-b")
+
+    for session_id, pdf in (("session-a", PDF_A), ("session-b", PDF_B)):
+        documents = asyncio.run(RAG_app.apinecone_retriver("What is gradient descent?", session_id))
+        assert documents
+        assert {document.metadata["doc_id"] for document in documents} == {document_key(pdf)}
+
+def test_cached_retrievals_follow_the_sessions_document(index, namespaces):
+    query = "What is gradient descent?"
+    upload(PDF_A, "session-a")
+    asyncio.run(RAG_app.apinecone_retriver(query, "session-a"))
+    # Nothing is invalidated on re-upload, the new document has its own entries
+    upload(PDF_B, "session-a")
+    documents = asyncio.run(RAG_app.apinecone_retriver(query, "session-a"))
+    assert {document.metadata["doc_id"] for document in documents} == {document_key(PDF_B)}
+
+    upload(PDF_B, "session-b")
+    asyncio.run(RAG_app.apinecone_retriver(query, "session-b"))
+    assert RAG_app.retrieval_cache.results.hits == 1
+
+def test_release_keeps_shared_vectors_until_last_session(index, namespaces):
+    upload(PDF_A, "session-a")
+    upload(PDF_A, "session-b")
+    doc_id = document_key(PDF_A)
+    namespace = namespace_for(doc_id=doc_id) if namespaces else ""
+    stored = ids_in(index, namespace)
+    assert stored
+
+    assert asyncio.run(release_session_vectors("session-a")) is False
+    assert ids_in(index, namespace) == stored
+    assert asyncio.run(release_session_vectors("session-b")) is True
+    assert not ids_in(index, namespace)
+    assert asyncio.run(release_session_vectors("session-b")) is False
+
+def test_release_private_session_vectors(index, namespaces, monkeypatch):
+    monkeypatch.setattr(pdfUpload, "PDF_DEDUP_ENABLED", False)
+    upload(PDF_A, "priv")
+    # Shares the "priv-" id prefix but belongs to someone else
+    index.upsert(vectors=[{"id": "priv-x-0", "values": [1.0] * 4, "metadata": {"session_id": "priv-x"}}])
+
+    assert asyncio.run(release_session_vectors("priv")) is True
+    assert ids_in(index, "session-priv") == set()
+    assert ids_in(index) == {"priv-x-0"}
+    assert asyncio.run(release_session_vectors("priv")) is False
+
+def test_release_private_session_vectors_with_unprefixed_ids(index, monkeypatch):
+    monkeypatch.setattr(documentRegistry, "PINECONE_NAMESPACES", False)
+    # Written before vector ids carried the owner
+    index.upsert(vectors=[{"id": "5d0f0c1e-uuid", "values": [1.0] * 4, "metadata": {"session_id": "legacy"}}])
+
+    asyncio.run(release_session_vectors("legacy"))
+    assert ids_in(index) == set()
+
+def test_release_with_a_doc_id_keeps_the_shared_document(index, namespaces):
+    upload(PDF_A, "session-a")
+    doc_id = document_key(PDF_A)
+    namespace = namespace_for(doc_id=doc_id) if namespaces else ""
+    stored = ids_in(index, namespace)
+
+    assert asyncio.run(release_session_vectors(doc_id)) is False
+    assert ids_in(index, namespace) == stored
+
+def test_reupload_deletes_replaced_document(index, namespaces):
+    upload(PDF_A, "session-a")
+    upload(PDF_B, "session-a")
+    old_namespace = namespace_for(doc_id=document_key(PDF_A)) if namespaces else ""
+
+    assert not any(vector_id.startswith(f"doc:{document_key(PDF_A)}-") for vector_id in ids_in(index, old_namespace))
+
+def test_failed_reupload_keeps_previous_document(index, namespaces):
+    upload(PDF_A, "session-a")
+    doc_id = document_key(PDF_A)
+    namespace = namespace_for(doc_id=doc_id) if namespaces else ""
+    stored = ids_in(index, namespace)
+
+    with pytest.raises(Exception):
+        upload(b"%PDF-1.4 not really a pdf", "session-a")
+
+    assert ids_in(index, namespace) == stored
+    assert asyncio.run(document_registry.doc_for_session("session-a")) == doc_id
+    # Still offered for reuse
+    assert asyncio.run(document_registry.chunk_count(doc_id)) == len(stored)
+    assert asyncio.run(RAG_app.apinecone_retriver("What is gradient descent?", "session-a"))
+
+def test_sweeper_releases_evicted_sessions(index, namespaces, monkeypatch):
+    store = document_registry.store
+    store.memory_limit = 0
+    monkeypatch.setattr(sweeper, "session_store", store)
+    upload(PDF_A, "session-a")
+    session = SessionData("session-a")
+    session.history.append("question", "answer")
+    asyncio.run(store.save(session))
+    assert not asyncio.run(store.exists("session-a"))
+
+    assert asyncio.run(sweeper.sweep_expired_sessions()) == 1
+    assert not any(index.namespaces.values())
+    assert asyncio.run(document_registry.doc_for_session("session-a")) is None
+
+def test_migrate_namespaces_moves_vectors_by_owner(index):
+    index.upsert(vectors=[
+        {"id": "doc1-0", "values": [1.0, 0.0], "metadata": {"doc_id": "doc1", "text": "a"}},
+        {"id": "doc1-1", "values": [0.0, 1.0], "metadata": {"doc_id": "doc1", "text": "b"}},
+        {"id": "sess-0", "values": [1.0, 1.0], "metadata": {"session_id": "sess", "text": "c"}},
+        {"id": "orphan", "values": [1.0, 1.0], "metadata": {"text": "d"}},
+    ])
+
+    assert migrate_namespaces(index, batch_size=2, dry_run=True) == {"doc-doc1": 2, "session-sess": 1, "skipped": 1}
+    assert set(index.namespaces) == {""}
+
+    assert migrate_namespaces(index, batch_size=2) == {"doc-doc1": 2, "session-sess": 1, "skipped": 1}
+    assert ids_in(index) == {"orphan"}
+    assert ids_in(index, "doc-doc1") == {"doc1-0", "doc1-1"}
+    assert index.namespaces["doc-doc1"]["doc1-1"][1] == {"doc_id": "doc1", "text": "b"}
+    assert ids_in(index, "session-sess") == {"sess-0"}
+
+    # Re-running only finds the vectors without an owner
+    assert migrate_namespaces(index) == {"skipped": 1}
+
+def test_migrate_namespaces_keep_source(index):
+    index.upsert(vectors=[{"id": "doc1-0", "values": [1.0, 0.0], "metadata": {"doc_id": "doc1"}}])
+
+    assert migrate_namespaces(index, delete_source=False) == {"doc-doc1": 1}
+    assert ids_in(index) == {"doc1-0"}
+    assert ids_in(index, "doc-doc1") == {"doc1-0"}
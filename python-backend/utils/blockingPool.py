@@ -0,0 +1,46 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of blocking SDK calls (Pinecone, Cloudinary, pypdf...) that may
+# run at the same time. Extra calls wait in the executor queue instead of
+# blocking the event loop.
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "8"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Return the shared thread pool used for blocking calls, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=BLOCKING_POOL_SIZE,
+                    thread_name_prefix="blocking-pool",
+                )
+                logger.info(f"Blocking thread pool started with {BLOCKING_POOL_SIZE} workers")
+    return _executor
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function in the shared thread pool and await its result
+    func: The blocking callable
+    args/kwargs: Arguments forwarded to func
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+def shutdown_executor(wait=True):
+    """Stop the shared thread pool, used on application shutdown"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
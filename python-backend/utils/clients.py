@@ -0,0 +1,162 @@
+from dotenv import load_dotenv
+import os
+import logging
+import threading
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Shared, lazily created clients for every external service.
+# Each client is built once per process on first use and then reused, so
+# requests keep their pooled keep-alive connections instead of paying for a new
+# TLS handshake (and, for Pinecone, an index-existence check) every time.
+# The SDKs are imported inside the factories: together they take over a second
+# to import, which would otherwise be paid by every cold start before the app
+# can answer anything (see warm_up_clients).
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSION = 1536  # OpenAI text-embedding-3-small dimension
+
+# pinecone | local (in-process NumPy index persisted under LOCAL_VECTOR_PATH)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+LOCAL_VECTOR_PATH = os.getenv("LOCAL_VECTOR_PATH", "./vector_data")
+
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+
+_instances = {}
+_lock = threading.RLock()
+
+def _get_or_create(name, factory):
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = factory()
+                _instances[name] = instance
+                logger.info(f"Initialized shared client: {name}")
+    return instance
+
+def override_client(name, instance):
+    """Replace a shared client, e.g. with a local stand-in for benchmarks"""
+    with _lock:
+        _instances[name] = instance
+
+def reset_clients():
+    """Forget every shared client so the next call builds a fresh one"""
+    with _lock:
+        _instances.clear()
+
+def _http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=HTTP_POOL_MAXSIZE,
+        max_keepalive_connections=HTTP_POOL_MAXSIZE,
+        keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+    )
+
+def get_index_name():
+    return os.getenv("PINECONE_INDEX_NAME")
+
+def _create_pinecone():
+    from pinecone import Pinecone
+    return Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+
+def get_pinecone():
+    return _get_or_create("pinecone", _create_pinecone)
+
+def _create_index():
+    from pinecone import ServerlessSpec
+
+    pc = get_pinecone()
+    index_name = get_index_name()
+    # Checked once per process instead of on every upload
+    if not pc.has_index(index_name):
+        logger.info(f"Creating new Pinecone index: {index_name}")
+        pc.create_index(
+            name=index_name,
+            dimension=EMBEDDING_DIMENSION,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=os.getenv("PINECONE_ENVIRONMENT")),
+        )
+    return pc.Index(index_name, connection_pool_maxsize=HTTP_POOL_MAXSIZE)
+
+def _create_local_index():
+    from utils.localVectorIndex import LocalVectorIndex
+    return LocalVectorIndex(LOCAL_VECTOR_PATH, EMBEDDING_DIMENSION)
+
+def get_index():
+    """Pinecone index, or the local index with the same interface when VECTOR_STORE_BACKEND=local"""
+    if VECTOR_STORE_BACKEND == "local":
+        return _get_or_create("index", _create_local_index)
+    return _get_or_create("index", _create_index)
+
+def _create_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    from openai import DefaultHttpxClient, DefaultAsyncHttpxClient
+    return OpenAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=DefaultHttpxClient(limits=_http_limits()),
+        http_async_client=DefaultAsyncHttpxClient(limits=_http_limits()),
+    )
+
+def get_embeddings():
+    return _get_or_create("embeddings", _create_embeddings)
+
+def _create_vector_store():
+    from langchain_pinecone import PineconeVectorStore
+    return PineconeVectorStore(index=get_index(), embedding=get_embeddings())
+
+def get_vector_store():
+    return _get_or_create("vector_store", _create_vector_store)
+
+def _create_groq():
+    from groq import Groq, DefaultHttpxClient
+    # Retries are left to RAGresponse/llmGateway, on top of the SDK's own they would multiply
+    return Groq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0, http_client=DefaultHttpxClient(limits=_http_limits()))
+
+def get_groq_client():
+    return _get_or_create("groq", _create_groq)
+
+def _create_async_groq():
+    from groq import AsyncGroq, DefaultAsyncHttpxClient
+    return AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0, http_client=DefaultAsyncHttpxClient(limits=_http_limits()))
+
+def get_async_groq_client():
+    return _get_or_create("async_groq", _create_async_groq)
+
+def _configure_cloudinary():
+    import cloudinary
+    import cloudinary.uploader
+
+    cloudinary.config(
+        cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+        api_key=os.getenv("CLOUDINARY_API_KEY"),
+        api_secret=os.getenv("CLOUDINARY_API_SECRET")
+    )
+    return cloudinary.uploader
+
+def get_cloudinary_uploader():
+    return _get_or_create("cloudinary", _configure_cloudinary)
+
+# Clients a request needs, built by warm_up_clients in this order
+WARM_UP_CLIENTS = (get_index, get_embeddings, get_vector_store, get_async_groq_client, get_groq_client, get_cloudinary_uploader)
+
+def warm_up_clients():
+    """
+    Import the SDKs and build every shared client, run in the background right
+    after startup so the first upload or question doesn't pay for it. A client
+    that fails (e.g. its service is unreachable) is simply built again on first
+    use. Returns the names of the clients that failed.
+    """
+    failed = []
+    for getter in WARM_UP_CLIENTS:
+        try:
+            getter()
+        except Exception as e:
+            logger.warning(f"Warm-up of {getter.__name__} failed, retrying on first use: {str(e)}")
+            failed.append(getter.__name__)
+    return failed
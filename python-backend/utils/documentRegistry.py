@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import logging
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from utils import clients
+from utils.blockingPool import run_blocking
+from sessionStore.stores import session_store
+
+logger = logging.getLogger(__name__)
+
+# Reuse the vectors of an identical PDF instead of embedding it again
+PDF_DEDUP_ENABLED = os.getenv("PDF_DEDUP_ENABLED", "true").lower() == "true"
+
+# Write every document (or private session upload) into its own Pinecone
+# namespace: searches need no metadata filter and cleanup drops the namespace
+PINECONE_NAMESPACES = os.getenv("PINECONE_NAMESPACES", "false").lower() == "true"
+
+# Anything that changes the produced vectors must be part of the key
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+def document_key(file_content, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Content address of a PDF: hash of its bytes plus the chunking/embedding parameters"""
+    digest = hashlib.sha256()
+    digest.update(f"{chunk_size}:{chunk_overlap}:{clients.EMBEDDING_MODEL}:".encode())
+    digest.update(file_content)
+    return digest.hexdigest()[:32]
+
+class DocumentRegistry:
+    """
+    Reference counts of embedded documents per session
+    Vectors of a deduplicated document have ids "doc:<doc_id>-<chunk>" and a
+    doc_id metadata field. Every session using the document holds one reference and the
+    vectors are only deleted when the last reference is released. References
+    and ready documents live in the session store backend, so with SQLite or
+    Redis they survive restarts and are shared by every worker; only the ingest
+    locks are per process.
+    """
+
+    def __init__(self, store=None):
+        self._store = store
+        # doc_id -> [asyncio.Lock, number of tasks using it]
+        self._locks = {}
+
+    @property
+    def store(self):
+        return self._store or session_store
+
+    @asynccontextmanager
+    async def ingest_lock(self, doc_id):
+        """Held while a document is embedded or deleted so identical concurrent uploads wait for it"""
+        entry = self._locks.get(doc_id)
+        if entry is None:
+            entry = self._locks[doc_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[doc_id]
+
+    @asynccontextmanager
+    async def ingest_locks(self, *doc_ids):
+        """ingest_lock of several documents, taken in sorted order so two tasks never wait on each other"""
+        async with AsyncExitStack() as stack:
+            for doc_id in sorted({doc_id for doc_id in doc_ids if doc_id}):
+                await stack.enter_async_context(self.ingest_lock(doc_id))
+            yield
+
+    async def doc_for_session(self, session_id):
+        return await self.store.document_of(session_id)
+
+    async def is_document(self, doc_id):
+        """True while some session uses doc_id"""
+        return await self.store.document_in_use(doc_id)
+
+    async def chunk_count(self, doc_id):
+        """Number of chunks of a fully embedded document, None if it is not ready"""
+        return await self.store.document_chunk_count(doc_id)
+
+    async def mark_ready(self, doc_id, chunk_count):
+        await self.store.mark_document_ready(doc_id, chunk_count)
+
+    async def attach(self, session_id, doc_id):
+        """
+        Point the session at doc_id
+        Returns the doc_id the session used before when no one uses it anymore, else None.
+        """
+        return await self.store.attach_document(session_id, doc_id)
+
+    async def detach(self, session_id):
+        """
+        Drop the session's reference
+        Returns (doc_id or None, True when no session uses the document anymore).
+        """
+        return await self.store.detach_document(session_id)
+
+    async def delete_document(self, doc_id):
+        """
+        Deletes the vectors of a document no session uses anymore
+        The caller holds the document's ingest_lock. Returns True when the index had any.
+        """
+        return await _delete_vectors(doc_id=doc_id)
+
+document_registry = DocumentRegistry()
+
+def namespace_for(doc_id=None, session_id=None):
+    """Namespace holding a deduplicated document's vectors, or a session's private ones"""
+    return f"doc-{doc_id}" if doc_id else f"session-{session_id}"
+
+def vector_id_prefix(doc_id=None, session_id=None):
+    """
+    Start of the vector ids of a deduplicated document, or of a session's private vectors
+    The "doc:"/"session:" parts keep the two apart, so no session id can name
+    a document's vectors
+    """
+    return f"doc:{doc_id}-" if doc_id else f"session:{session_id}-"
+
+def vector_filter(doc_id=None, session_id=None):
+    """Metadata selecting a deduplicated document's vectors, or a session's private ones"""
+    return {"doc_id": doc_id} if doc_id else {"session_id": session_id}
+
+def vector_scope(doc_id=None, session_id=None):
+    """Search kwargs limiting a query to a shared document's or a session's private vectors: a namespace or a metadata filter"""
+    if PINECONE_NAMESPACES:
+        return {"namespace": namespace_for(doc_id, session_id)}
+    return {"filter": vector_filter(doc_id, session_id)}
+
+async def _delete_vectors(doc_id=None, session_id=None):
+    """Returns True when the index held vectors of the document or session"""
+    from pinecone.exceptions import NotFoundException
+
+    index = clients.get_index()
+    if not PINECONE_NAMESPACES:
+        # Vector ids are "<doc:|session:><owner>-<chunk>": listing them tells
+        # what is there and deleting by id works on serverless indexes
+        prefix = vector_id_prefix(doc_id, session_id)
+        deleted = 0
+        for ids in await run_blocking(lambda: list(index.list(prefix=prefix))):
+            ids = [vector_id for vector_id in ids if vector_id[len(prefix):].isdigit()]
+            if ids:
+                await run_blocking(index.delete, ids=ids)
+                deleted += len(ids)
+        if doc_id is None:
+            # Private vectors uploaded before ids were prefixed have random ids
+            try:
+                await run_blocking(index.delete, filter=vector_filter(session_id=session_id))
+            except Exception as e:
+                logger.warning(f"Could not delete unprefixed vectors of session {session_id}: {str(e)}")
+        return deleted > 0
+    try:
+        # Constant time whatever the index size, unlike a filtered delete
+        await run_blocking(index.delete_namespace, namespace=namespace_for(doc_id, session_id))
+        return True
+    except NotFoundException:
+        # Nothing was ever written for this session
+        return False
+
+async def release_session_vectors(session_id):
+    """
+    Release a session's vectors, deleting them once no other session uses them
+    Returns True when vectors were deleted from the index.
+    """
+    doc_id = await document_registry.doc_for_session(session_id)
+    if doc_id is None:
+        # Not deduplicated: the vectors belong to this session only
+        return await _delete_vectors(session_id=session_id)
+
+    # Not while an identical upload is writing the same vectors
+    async with document_registry.ingest_lock(doc_id):
+        doc_id, orphaned = await document_registry.detach(session_id)
+        if doc_id is None:
+            return False
+        if not orphaned:
+            logger.info(f"Vectors of session {session_id} are still used by other sessions")
+            return False
+        deleted = await document_registry.delete_document(doc_id)
+    logger.info(f"Deleted vectors of document {doc_id}" if deleted else f"No vectors of document {doc_id} to delete")
+    return deleted
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Metadata fields that tag which document or session a vector belongs to
+OWNER_FIELDS = ("doc_id", "session_id")
+DEFAULT_NAMESPACE = "__default__"
+
+_safe_name = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,99}")
+
+def _owner_of(metadata):
+    for field in OWNER_FIELDS:
+        if metadata.get(field):
+            return field, metadata[field]
+    return None, None
+
+def _owner_from_filter(metadata_filter):
+    """The owner a filter selects when it is a single doc_id/session_id equality, else None"""
+    if not metadata_filter or len(metadata_filter) != 1:
+        return None
+    field, condition = next(iter(metadata_filter.items()))
+    if isinstance(condition, dict):
+        if list(condition) != ["$eq"]:
+            return None
+        condition = condition["$eq"]
+    return (field, condition) if field in OWNER_FIELDS else None
+
+def _matches_filter(metadata, metadata_filter):
+    for key, condition in (metadata_filter or {}).items():
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+class _Partition:
+    """The vectors of one owner: a contiguous float32 matrix of unit rows plus ids and metadata"""
+    __slots__ = ("owner", "matrix", "ids", "metadata", "rows")
+
+    def __init__(self, owner, matrix, ids, metadata):
+        self.owner = owner
+        self.matrix = matrix
+        self.ids = ids
+        self.metadata = metadata
+        self.rows = {vector_id: row for row, vector_id in enumerate(ids)}
+
+class LocalVectorIndex:
+    """
+    In-process vector index with the subset of the Pinecone Index API the app uses
+    Vectors are grouped per namespace and per owner (doc_id or session_id
+    metadata), each group being one contiguous float32 matrix of normalized
+    rows. A query scoped to one owner, by namespace or by an equality filter,
+    is a single matrix-vector product followed by a top-k partition, so it
+    takes milliseconds instead of a round trip to Pinecone. Scores are cosine
+    similarities like Pinecone's cosine metric.
+
+    Every change to a group is written to <path>/<namespace>/<group>.npy (plus a
+    .json with ids and metadata) and the matrix is then reopened memory-mapped,
+    so the vectors survive restarts and idle groups can be paged out by the OS.
+    """
+
+    def __init__(self, path, dimension):
+        self.path = path
+        self.dimension = dimension
+        self.config = SimpleNamespace(host=f"local:{path}", api_key="")
+        # namespace -> {owner: _Partition}
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    # Persistence
+    def _namespace_dir(self, namespace):
+        # Namespaces contain client supplied session ids, never use them as paths unchecked
+        name = namespace or DEFAULT_NAMESPACE
+        if not _safe_name.fullmatch(name):
+            name = "ns-" + hashlib.sha1(name.encode()).hexdigest()[:24]
+        return os.path.join(self.path, name)
+
+    def _file_stem(self, namespace, owner):
+        digest = hashlib.sha1(json.dumps(owner).encode()).hexdigest()[:24]
+        return os.path.join(self._namespace_dir(namespace), digest)
+
+    def _load(self):
+        if not os.path.isdir(self.path):
+            return
+        loaded = 0
+        for namespace_name in os.listdir(self.path):
+            directory = os.path.join(self.path, namespace_name)
+            for file_name in os.listdir(directory):
+                if not file_name.endswith(".json"):
+                    continue
+                stem = os.path.join(directory, file_name[:-5])
+                try:
+                    with open(stem + ".json") as f:
+                        info = json.load(f)
+                    matrix = np.load(stem + ".npy", mmap_mode="r")
+                except (OSError, ValueError) as e:
+                    logger.error(f"Skipping unreadable vector file {stem}: {str(e)}")
+                    continue
+                owner = tuple(info["owner"]) if info["owner"] else None
+                self._namespaces.setdefault(info["namespace"], {})[owner] = _Partition(owner, matrix, info["ids"], info["metadata"])
+                loaded += len(info["ids"])
+        logger.info(f"Loaded {loaded} local vectors from {self.path}")
+
+    def _persist(self, namespace, partition):
+        stem = self._file_stem(namespace, partition.owner)
+        os.makedirs(os.path.dirname(stem), exist_ok=True)
+        # Write to temporary files and rename, a crash never leaves a half written group
+        with open(stem + ".npy.tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(partition.matrix, dtype=np.float32))
+        with open(stem + ".json.tmp", "w") as f:
+            json.dump({"namespace": namespace or "", "owner": partition.owner, "ids": partition.ids, "metadata": partition.metadata}, f)
+        os.replace(stem + ".npy.tmp", stem + ".npy")
+        os.replace(stem + ".json.tmp", stem + ".json")
+        partition.matrix = np.load(stem + ".npy", mmap_mode="r")
+
+    def _remove_files(self, namespace, owner):
+        stem = self._file_stem(namespace, owner)
+        for suffix in (".npy", ".json"):
+            try:
+                os.remove(stem + suffix)
+            except FileNotFoundError:
+                pass
+
+    # Index API
+    def upsert(self, vectors, namespace=None, **kwargs):
+        groups = {}
+        for vector in vectors:
+            if isinstance(vector, dict):
+                vector_id, values, metadata = vector["id"], vector["values"], vector.get("metadata") or {}
+            else:
+                vector_id, values, metadata = (tuple(vector) + ({},))[:3]
+            groups.setdefault(_owner_of(metadata), []).append((vector_id, values, dict(metadata)))
+
+        with self._lock:
+            partitions = self._namespaces.setdefault(namespace or "", {})
+            for owner, items in groups.items():
+                owner = owner if owner[0] else None
+                values = np.asarray([values for _, values, _ in items], dtype=np.float32)
+                norms = np.linalg.norm(values, axis=1, keepdims=True)
+                values /= np.where(norms == 0, 1.0, norms)
+
+                partition = partitions.get(owner)
+                if partition is None:
+                    partition = _Partition(owner, np.empty((0, self.dimension), dtype=np.float32), [], [])
+                matrix = np.array(partition.matrix, dtype=np.float32)
+                ids, metadata = list(partition.ids), list(partition.metadata)
+                rows = dict(partition.rows)
+                new_rows = []
+                for (vector_id, _, meta), row_values in zip(items, values):
+                    row = rows.get(vector_id)
+                    if row is None:
+                        rows[vector_id] = len(ids)
+                        ids.append(vector_id)
+                        metadata.append(meta)
+                        new_rows.append(row_values)
+                    else:
+                        # Same id again (e.g. a retried batch) overwrites
+                        matrix[row] = row_values
+                        metadata[row] = meta
+                if new_rows:
+                    matrix = np.concatenate([matrix, np.asarray(new_rows, dtype=np.float32)])
+                updated = _Partition(owner, matrix, ids, metadata)
+                self._persist(namespace, updated)
+                partitions[owner] = updated
+        return {"upserted_count": len(vectors)}
+
+    def _candidates(self, namespace, metadata_filter):
+        partitions = self._namespaces.get(namespace or "", {})
+        owner = _owner_from_filter(metadata_filter)
+        if owner is not None:
+            partition = partitions.get(owner)
+            return [(partition, None)] if partition is not None else []
+        candidates = []
+        for partition in list(partitions.values()):
+            if not metadata_filter:
+                candidates.append((partition, None))
+                continue
+            rows = [row for row, meta in enumerate(partition.metadata) if _matches_filter(meta, metadata_filter)]
+            if rows:
+                candidates.append((partition, np.asarray(rows)))
+        return candidates
+
+    def query(self, vector, top_k=10, namespace=None, filter=None, include_metadata=False, include_values=False, **kwargs):
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scored = []
+        for partition, rows in self._candidates(namespace, filter):
+            matrix = partition.matrix if rows is None else partition.matrix[rows]
+            if not len(matrix):
+                continue
+            scores = matrix @ query
+            count = min(top_k, len(scores))
+            best = np.argpartition(-scores, count - 1)[:count]
+            for position in best:
+                row = int(position if rows is None else rows[position])
+                scored.append((float(scores[position]), partition, row))
+
+        scored.sort(key=lambda item: -item[0])
+        matches = []
+        for score, partition, row in scored[:top_k]:
+            match = {"id": partition.ids[row], "score": score}
+            if include_metadata:
+                match["metadata"] = dict(partition.metadata[row])
+            if include_values:
+                match["values"] = partition.matrix[row].tolist()
+            matches.append(match)
+        return {"matches": matches, "namespace": namespace or ""}
+
+    def fetch(self, ids, namespace=None, **kwargs):
+        wanted = set(ids)
+        vectors = {}
+        for partition in list(self._namespaces.get(namespace or "", {}).values()):
+            for vector_id in wanted.intersection(partition.rows):
+                row = partition.rows[vector_id]
+                vectors[vector_id] = SimpleNamespace(
+                    id=vector_id, values=partition.matrix[row].tolist(), metadata=dict(partition.metadata[row])
+                )
+        return SimpleNamespace(vectors=vectors, namespace=namespace or "")
+
+    def list(self, prefix=None, limit=100, namespace=None, **kwargs):
+        ids = sorted(
+            vector_id
+            for partition in list(self._namespaces.get(namespace or "", {}).values())
+            for vector_id in partition.ids
+            if prefix is None or vector_id.startswith(prefix)
+        )
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def delete(self, ids=None, delete_all=None, namespace=None, filter=None, **kwargs):
+        with self._lock:
+            partitions = self._namespaces.get(namespace or "", {})
+            owner = _owner_from_filter(filter)
+            if delete_all:
+                targets = {key: None for key in partitions}
+            elif owner is not None:
+                targets = {owner: None} if owner in partitions else {}
+            else:
+                targets = {}
+                for key, partition in partitions.items():
+                    rows = [
+                        row for row, (vector_id, meta) in enumerate(zip(partition.ids, partition.metadata))
+                        if (ids is not None and vector_id in ids) or (ids is None and filter and _matches_filter(meta, filter))
+                    ]
+                    if rows:
+                        targets[key] = rows
+
+            for key, rows in targets.items():
+                partition = partitions[key]
+                if rows is None or len(rows) == len(partition.ids):
+                    del partitions[key]
+                    self._remove_files(namespace, key)
+                    continue
+                keep = np.setdiff1d(np.arange(len(partition.ids)), rows)
+                updated = _Partition(
+                    key,
+                    np.array(partition.matrix[keep], dtype=np.float32),
+                    [partition.ids[row] for row in keep],
+                    [partition.metadata[row] for row in keep],
+                )
+                self._persist(namespace, updated)
+                partitions[key] = updated
+        return {}
+
+    def delete_namespace(self, namespace, **kwargs):
+        from pinecone.exceptions import NotFoundException
+
+        with self._lock:
+            partitions = self._namespaces.pop(namespace, None)
+            if partitions is None:
+                raise NotFoundException(status=404, reason="Namespace not found")
+            for owner in partitions:
+                self._remove_files(namespace, owner)
+            try:
+                os.rmdir(self._namespace_dir(namespace))
+            except OSError:
+                pass
+        return {}
+
+    def describe_index_stats(self, **kwargs):
+        namespaces = {
+            namespace or DEFAULT_NAMESPACE: SimpleNamespace(vector_count=sum(len(p.ids) for p in partitions.values()))
+            for namespace, partitions in list(self._namespaces.items())
+        }
+        return SimpleNamespace(
+            total_vector_count=sum(ns.vector_count for ns in namespaces.values()),
+            namespaces=namespaces,
+            dimension=self.dimension,
+        )
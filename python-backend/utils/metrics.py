@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Adds a Server-Timing header with the stage timings of every request, so the
+# browser's network panel shows where a slow request spent its time
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+METRICS_PREFIX = "edulume"
+# Seconds, from cache hits to whole PDF ingestions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage timings of the current request, None outside requests or when Server-Timing is off
+_request_timings = ContextVar("request_timings", default=None)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic count per label set, exported as <prefix>_<name>_total"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = f"{METRICS_PREFIX}_{name}_total"
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class CallbackCounter(Counter):
+    """Counter whose values are read from elsewhere when rendered, e.g. cache statistics"""
+
+    def __init__(self, name, documentation, labelnames, collect):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def render(self):
+        try:
+            self._values = {tuple(labels): value for labels, value in self.collect()}
+        except Exception as e:
+            logger.error(f"Failed to collect {self.name}: {str(e)}")
+        return super().render()
+
+class Histogram:
+    """Cumulative histogram per label set with a sum and a count, like prometheus_client's"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per bucket counts (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        labelnames = self.labelnames + ("le",)
+        with self._lock:
+            values = sorted((labels, list(counts), total) for labels, (counts, total) in self._values.items())
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labelnames, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+_registry = []
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+STAGE_SECONDS = register(Histogram("stage_duration_seconds", "Time spent in each stage of a request or job", ("operation", "stage")))
+HTTP_SECONDS = register(Histogram("http_request_duration_seconds", "Time to handle an HTTP request", ("method", "route", "status")))
+LLM_TOKENS = register(Counter("llm_tokens", "Tokens sent to and generated by the LLM", ("operation", "kind")))
+CHUNKS = register(Counter("chunks", "Document chunks retrieved, embedded, upserted or failed", ("event",)))
+
+def observe_stage(operation, stage, seconds):
+    STAGE_SECONDS.observe(seconds, operation, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((f"{operation}-{stage}", seconds))
+
+class span:
+    """
+    Times a with block into the stage histogram (and the Server-Timing header)
+    A plain class rather than @contextmanager, which costs a generator per use.
+    """
+    __slots__ = ("operation", "stage", "started")
+
+    def __init__(self, operation, stage):
+        self.operation = operation
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe_stage(self.operation, self.stage, time.perf_counter() - self.started)
+        return False
+
+def count_chunks(event, count):
+    if count:
+        CHUNKS.inc(count, event)
+
+def record_llm_usage(operation, usage):
+    """Token counts from a Groq/OpenAI usage object, if the response had one"""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, operation, "prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, operation, "completion")
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every request by method, route template and status
+    With server_timing, stage spans run while handling the request are sent
+    back in a Server-Timing header. For streamed responses that only covers
+    the stages finished before the first byte.
+    """
+
+    def __init__(self, app, server_timing=SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings = [] if self.server_timing else None
+        token = _request_timings.set(timings)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings is not None:
+                    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings]
+                    entries.append(f"app;dur={(time.perf_counter() - started) * 1000:.1f}")
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", ", ".join(entries).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+            # Route templates keep the label set small, unknown paths share one label
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - started, scope["method"], route, str(status))
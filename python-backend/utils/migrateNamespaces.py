@@ -0,0 +1,87 @@
+"""
+Move vectors from the shared namespace into per-document/per-session namespaces
+
+Vectors written before PINECONE_NAMESPACES was enabled live in one namespace
+and are told apart by their doc_id/session_id metadata. This copies each of
+them into the namespace PINECONE_NAMESPACES=true searches (doc-<doc_id> or
+session-<session_id>) and then deletes it from the source namespace. Vectors
+without owner metadata are left where they are. Safe to re-run: ids are kept,
+so upserts overwrite.
+
+Run from the python-backend directory:
+    python -m utils.migrateNamespaces --dry-run
+    python -m utils.migrateNamespaces
+"""
+import argparse
+import logging
+from collections import Counter, defaultdict
+
+from dotenv import load_dotenv
+
+from utils.documentRegistry import namespace_for
+
+logger = logging.getLogger(__name__)
+
+def target_namespace(metadata):
+    if metadata.get("doc_id"):
+        return namespace_for(doc_id=metadata["doc_id"])
+    if metadata.get("session_id"):
+        return namespace_for(session_id=metadata["session_id"])
+    return None
+
+def migrate_namespaces(index, source_namespace="", batch_size=100, delete_source=True, dry_run=False):
+    """
+    Returns {target namespace: vectors moved} plus a "skipped" count for vectors
+    without owner metadata
+    """
+    moved = Counter()
+    for ids in index.list(namespace=source_namespace, limit=batch_size):
+        fetched = index.fetch(ids=ids, namespace=source_namespace).vectors
+        by_namespace = defaultdict(list)
+        for vector_id, vector in fetched.items():
+            metadata = dict(vector.metadata or {})
+            namespace = target_namespace(metadata)
+            if namespace is None:
+                moved["skipped"] += 1
+                continue
+            by_namespace[namespace].append({"id": vector_id, "values": list(vector.values), "metadata": metadata})
+
+        for namespace, records in by_namespace.items():
+            moved[namespace] += len(records)
+            if dry_run:
+                continue
+            index.upsert(vectors=records, namespace=namespace)
+            # Only delete what has been written to its new namespace
+            if delete_source:
+                index.delete(ids=[record["id"] for record in records], namespace=source_namespace)
+        logger.info(f"Migrated a page of {len(ids)} vectors")
+    return dict(moved)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source-namespace", default="", help="Namespace to move vectors out of (default namespace if empty)")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--keep-source", action="store_true", help="Copy instead of move")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be moved")
+    return parser.parse_args()
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    from utils import clients
+
+    moved = migrate_namespaces(
+        clients.get_index(),
+        source_namespace=args.source_namespace,
+        batch_size=args.batch_size,
+        delete_source=not args.keep_source,
+        dry_run=args.dry_run,
+    )
+    skipped = moved.pop("skipped", 0)
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"{verb} {sum(moved.values())} vectors into {len(moved)} namespaces, {skipped} without owner metadata skipped")
+
+if __name__ == "__main__":
+    main()
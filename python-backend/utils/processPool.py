@@ -0,0 +1,56 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for CPU bound work (PDF parsing and chunking). Threads in the
+# blocking pool share the GIL, so several uploads parsed at once take turns on
+# one core; processes run them side by side.
+PARSE_PROCESSES = int(os.getenv("PARSE_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# Workers are replaced after this many tasks, which hands memory pypdf kept
+# from large PDFs back to the OS. 0 keeps workers for the life of the pool.
+PARSE_MAX_TASKS_PER_CHILD = int(os.getenv("PARSE_MAX_TASKS_PER_CHILD", "20"))
+# "spawn" starts clean interpreters: forking the server would copy its event
+# loop, threads and open client connections into every worker
+PARSE_START_METHOD = os.getenv("PARSE_START_METHOD", "spawn")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Return the shared process pool, starting it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=PARSE_PROCESSES,
+                    mp_context=multiprocessing.get_context(PARSE_START_METHOD),
+                    max_tasks_per_child=PARSE_MAX_TASKS_PER_CHILD or None,
+                )
+                logger.info(
+                    f"Process pool started with {PARSE_PROCESSES} workers "
+                    f"({PARSE_MAX_TASKS_PER_CHILD or 'unlimited'} tasks per worker)"
+                )
+    return _pool
+
+async def run_in_process(func, *args, **kwargs):
+    """
+    Run a function in the shared process pool and await its result
+    func: A module level callable, arguments and result must be picklable
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), functools.partial(func, *args, **kwargs))
+
+def shutdown_process_pool(wait=True):
+    """Stop the worker processes, used on application shutdown"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+            _pool = None
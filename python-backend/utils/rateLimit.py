@@ -0,0 +1,230 @@
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# memory (per process) | redis (shared by every worker and machine, uses REDIS_URL)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Every client (IP + session) gets a bucket refilled with this many tokens per
+# minute, holding at most RATE_LIMIT_BURST. A request takes its route's cost.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "60"))
+# Every IP also has a bucket, so a single client can't dodge its limit by
+# changing session ids. It holds ten clients' worth of tokens (five for the
+# burst) so students sharing one address (a school NAT) still get their own
+# per-session limit; keep it a multiple of the client bucket, at the same size
+# the session component would change nothing.
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "600"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "300"))
+
+# Tokens per request. With 60 tokens a minute these match the old per-route
+# limits: 5 uploads, 20 questions or 10 index hits per minute. Routes not
+# listed cost RATE_LIMIT_DEFAULT_COST (status polling, history...).
+ROUTE_COSTS = {
+    "/upload-pdf/": 12,
+    "/query": 3,
+    "/query/stream": 3,
+    "/": 6,
+}
+RATE_LIMIT_DEFAULT_COST = float(os.getenv("RATE_LIMIT_DEFAULT_COST", "0"))
+# Overrides as "/path=cost,/other=cost"
+for _entry in filter(None, os.getenv("RATE_LIMIT_COSTS", "").split(",")):
+    _path, _, _cost = _entry.partition("=")
+    ROUTE_COSTS[_path.strip()] = float(_cost)
+
+# Headers naming the real client behind a proxy, most trusted first. Fly's
+# proxy sets Fly-Client-IP; for X-Forwarded-For the last address is the one the
+# nearest proxy saw, the ones before it are whatever the client sent.
+CLIENT_IP_HEADERS = [
+    header.strip().lower()
+    for header in os.getenv("RATE_LIMIT_CLIENT_IP_HEADERS", "fly-client-ip,x-forwarded-for").split(",")
+    if header.strip()
+]
+
+class InMemoryBucketBackend:
+    """
+    Token buckets in a dict, O(1) per request
+    Buckets are kept in least recently used order; a bucket left alone long
+    enough to refill completely is the same as no bucket, so those are
+    dropped from the front as new requests come in.
+    """
+
+    def __init__(self):
+        # key -> (tokens, updated, idle seconds until full)
+        self._buckets = OrderedDict()
+
+    def _prune(self, now):
+        while self._buckets:
+            key, (_, updated, full_after) = next(iter(self._buckets.items()))
+            if now - updated < full_after:
+                return
+            del self._buckets[key]
+
+    async def take(self, key, cost, rate_per_second, capacity):
+        """Returns (allowed, seconds until the request would be allowed)"""
+        now = time.monotonic()
+        self._prune(now)
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = capacity
+        else:
+            tokens, updated, _ = bucket
+            tokens = min(capacity, tokens + (now - updated) * rate_per_second)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now, (capacity - tokens) / rate_per_second)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate_per_second
+
+    def stats(self):
+        return {"backend": "memory", "buckets": len(self._buckets)}
+
+# Refill, take and store in one round trip, atomically, using the Redis clock
+# so every worker agrees on the time
+_TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + (now - tonumber(bucket[2])) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+class RedisBucketBackend:
+    """
+    Token buckets in Redis, shared by every worker and machine
+    Each bucket is a hash that expires once it would be full again.
+    """
+
+    def __init__(self, client=None, url=REDIS_URL, prefix="edulume:ratelimit:"):
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError:
+                raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package (pip install redis)")
+            client = redis_asyncio.Redis.from_url(url)
+        self._redis = client
+        self._prefix = prefix
+        self._script = client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key, cost, rate_per_second, capacity):
+        allowed, tokens = await self._script(keys=[self._prefix + key], args=[cost, rate_per_second, capacity])
+        if int(allowed):
+            return True, 0.0
+        return False, (cost - float(tokens)) / rate_per_second
+
+    def stats(self):
+        return {"backend": "redis"}
+
+def create_bucket_backend(backend=RATE_LIMIT_BACKEND):
+    if backend == "redis":
+        return RedisBucketBackend()
+    return InMemoryBucketBackend()
+
+def client_ip(scope):
+    """The client address, taken from the proxy headers when present"""
+    headers = dict(scope.get("headers") or ())
+    for name in CLIENT_IP_HEADERS:
+        value = headers.get(name.encode("latin-1"))
+        if value:
+            return value.decode("latin-1").split(",")[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def session_of(scope):
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("session_id")
+    return values[0] if values else None
+
+class RateLimiter:
+    """
+    Two token buckets per request: one for the client (IP plus session_id, or
+    the IP alone when the request names no session) and one for the IP
+    """
+
+    def __init__(self, backend=None, enabled=RATE_LIMIT_ENABLED, route_costs=None, default_cost=RATE_LIMIT_DEFAULT_COST):
+        self.backend = backend or create_bucket_backend()
+        self.enabled = enabled
+        self.route_costs = ROUTE_COSTS if route_costs is None else route_costs
+        self.default_cost = default_cost
+        self.allowed = 0
+        self.rejected = 0
+
+    async def check(self, scope):
+        """Returns None when the request may go ahead, else the seconds to wait"""
+        cost = self.route_costs.get(scope["path"], self.default_cost)
+        if not self.enabled or cost <= 0 or scope["method"] == "OPTIONS":
+            return None
+
+        ip = client_ip(scope)
+        session_id = session_of(scope)
+        client_key = f"client:{ip}:{session_id}" if session_id else f"client:{ip}"
+        try:
+            allowed, wait = await self.backend.take(client_key, cost, RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST)
+            if allowed:
+                allowed, wait = await self.backend.take(f"ip:{ip}", cost, RATE_LIMIT_IP_PER_MINUTE / 60, RATE_LIMIT_IP_BURST)
+        except Exception as e:
+            # A rate limiter outage must not take the API down with it
+            logger.error(f"Rate limit check failed, allowing request: {str(e)}")
+            return None
+
+        if allowed:
+            self.allowed += 1
+            return None
+        self.rejected += 1
+        logger.warning(f"Rate limit exceeded for {client_key} on {scope['path']}")
+        return wait
+
+    def stats(self):
+        return {**self.backend.stats(), "enabled": self.enabled, "allowed": self.allowed, "rejected": self.rejected}
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After once a bucket is empty"""
+
+    def __init__(self, app, limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            wait = await self.limiter.check(scope)
+            if wait is not None:
+                retry_after = max(1, math.ceil(wait))
+                body = json.dumps({
+                    "detail": f"Too many requests, rate limit exceeded. Please retry in {retry_after} seconds."
+                }).encode()
+                await send({
+                    "type": "http.response.start",
+                    "status": 429,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"retry-after", str(retry_after).encode()),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        await self.app(scope, receive, send)
+
+rate_limiter = RateLimiter()
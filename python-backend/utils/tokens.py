@@ -0,0 +1,39 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# tiktoken has no Llama encoding, cl100k_base is close enough for budgeting
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+_encoding = None
+_encoding_failed = False
+_lock = threading.Lock()
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception as e:
+                    # The encoding is downloaded on first use, fall back to an estimate when offline
+                    logger.warning(f"tiktoken encoding {TOKEN_ENCODING} unavailable, estimating tokens: {str(e)}")
+                    _encoding_failed = True
+    return _encoding
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        # Roughly 4 characters per token for English text
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages):
+    # Every chat message carries a few tokens of role/formatting overhead
+    return sum(count_tokens(message["content"]) + 4 for message in messages)
@@ -0,0 +1,42 @@
+import importlib
+import logging
+import os
+import time
+
+from utils import clients
+from utils.blockingPool import run_blocking
+from utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Build clients and import heavy modules in the background after startup.
+# Startup itself stays fast either way, this only moves the cost off the
+# first upload/question after a cold start.
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+
+# Imported on first use by the upload path
+WARM_UP_MODULES = (
+    "langchain_community.document_loaders",
+    "langchain_community.document_loaders.parsers",
+    "langchain_text_splitters",
+)
+
+def _import_modules():
+    for name in WARM_UP_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"Warm-up import of {name} failed: {str(e)}")
+
+async def warm_up():
+    started = time.perf_counter()
+    try:
+        failed = await run_blocking(clients.warm_up_clients)
+        await run_blocking(_import_modules)
+        # Loads (or downloads) the tokenizer used for prompt budgeting
+        await run_blocking(count_tokens, "warm up")
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+        return
+    logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s"
+                + (f", failed: {', '.join(failed)}" if failed else ""))